@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # static files from STATIC_ROOT
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.common.CommonMiddleware',
@@ -106,6 +107,34 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# Cache su file, condivisa tra i processi dello stesso host (non richiede Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+# Cache dei dati di catalogo (prodotti, oggetti, badge, quiz): LRU in memoria + cache condivisa
+CATALOG_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,  # secondi
+    'MAX_ENTRIES': 1024,  # voci nella LRU locale di ogni processo
+    'GENERATION_TIMEOUT': 1,  # secondi tra due letture delle generazioni condivise
+}
+
+# Varianti ridimensionate delle immagini caricate (avatar, post, scansioni, prodotti)
+IMAGE_RENDITIONS = {
+    'SIZES': {'thumb': 160, 'small': 480, 'large': 1280},  # lato maggiore in pixel
+    'FORMAT': 'WEBP',  # JPEG se Pillow non supporta WebP
+    'QUALITY': 80,
+    'WORKERS': 2,  # thread per processo che generano le varianti; 0 = nella richiesta
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -159,7 +188,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'happygreen.pagination.BoundedPageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
@@ -0,0 +1,12 @@
+# Configurazione di gunicorn per il deploy ASGI (vedi docker-compose.yml)
+import multiprocessing
+import os
+
+bind = '0.0.0.0:8000'
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Sotto ASGI le view sincrone di DRF girano in un solo thread per processo: il numero
+# di worker è quante richieste sincrone vengono servite in parallelo. Gli endpoint in
+# /api/async/ invece sovrappongono le attese anche all'interno di un worker.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = 60
@@ -2,16 +2,34 @@ from django.contrib import admin
 from .models import (
     Profile, Badge, UserBadge, Group, GroupMembership, Post, Comment,
     RecognizedObject, ScanRecord, Quiz, QuizQuestion, QuizOption,
-    QuizAttempt, Challenge, ChallengeParticipation, Product, ProductScan
+    QuizAttempt, Challenge, ChallengeParticipation, Product, ProductScan,
+    PointsTransaction, BadgeCriterion
 )
 
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'points', 'created_at')
     search_fields = ('user__username', 'user__email')
 
+    def save_model(self, request, obj, form, change):
+        # Solo i campi modificati nel form, per non riscrivere i punti assegnati nel frattempo
+        if change:
+            obj.save(update_fields=[*form.changed_data, 'updated_at'])
+        else:
+            obj.save()
+
+class PointsTransactionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'amount', 'source', 'created_at')
+    search_fields = ('user__username',)
+    list_filter = ('source',)
+
+class BadgeCriterionInline(admin.TabularInline):
+    model = BadgeCriterion
+    extra = 1
+
 class BadgeAdmin(admin.ModelAdmin):
     list_display = ('name', 'points_required', 'created_at')
     search_fields = ('name',)
+    inlines = [BadgeCriterionInline]
 
 class UserBadgeAdmin(admin.ModelAdmin):
     list_display = ('user', 'badge', 'earned_at')
@@ -93,6 +111,7 @@ class ProductScanAdmin(admin.ModelAdmin):
 
 # Registrazione dei modelli
 admin.site.register(Profile, ProfileAdmin)
+admin.site.register(PointsTransaction, PointsTransactionAdmin)
 admin.site.register(Badge, BadgeAdmin)
 admin.site.register(UserBadge, UserBadgeAdmin)
 admin.site.register(Group, GroupAdmin)
@@ -0,0 +1,117 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .cache import catalog_cache
+from .feed import ahome_feed, encode_cursor, decode_cursor
+from .leaderboard import leaderboards, astandings, WINDOWS as LEADERBOARD_WINDOWS
+from .models import Product
+from .pagination import CreatedAtCursorPagination, MAX_PAGE_SIZE
+from .serializers import ProductSerializer, PostSerializer
+from .views import post_queryset
+
+# Async versions of the hot read endpoints, for ASGI deployments. They return the same payloads as
+# their DRF counterparts; while a request waits on the database or the cache the worker serves others.
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def session_user(request):
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+async def authenticate(request):
+    """User from the JWT bearer token or the session, like the DRF authentication classes; None if anonymous"""
+    result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    if result is not None:
+        return result[0]
+    return await sync_to_async(session_user)(request)
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+        try:
+            user = await authenticate(request)
+        except AuthenticationFailed as e:
+            return json_response({"detail": str(e.detail)}, status=401)
+        if user is None:
+            return json_response({"detail": "Authentication credentials were not provided."}, status=401)
+        return await view(request, user, *args, **kwargs)
+    return wrapper
+
+
+def query_limit(request):
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+async def load_by_barcode(barcode):
+    product = await Product.objects.filter(barcode=barcode).afirst()
+    if product is None:
+        return None
+    return ProductSerializer(product).data
+
+
+@login_required
+async def product_by_barcode(request, user):
+    barcode = request.GET.get('barcode')
+    if not barcode:
+        return json_response({"detail": "Barcode parameter is required"}, status=400)
+
+    # Same cache entries as ProductViewSet.by_barcode
+    data = await catalog_cache.aget_or_set('product', f'barcode:{barcode}', lambda: load_by_barcode(barcode))
+    if data is None:
+        return json_response({"detail": "Product not found"}, status=404)
+    return json_response(data)
+
+
+@login_required
+async def feed(request, user):
+    # Home feed, see PostViewSet.feed (?cursor=&page_size=)
+    try:
+        cursor = decode_cursor(request.GET['cursor']) if 'cursor' in request.GET else None
+    except ValueError:
+        return json_response({"detail": "Invalid cursor"}, status=400)
+    try:
+        size = int(request.GET.get('page_size', CreatedAtCursorPagination.page_size))
+    except ValueError:
+        size = CreatedAtCursorPagination.page_size
+    size = max(1, min(size, MAX_PAGE_SIZE))
+
+    post_ids, next_position = await ahome_feed(user, size, cursor)
+    posts = await post_queryset().ain_bulk(post_ids)
+    # Author, group and comment count are already loaded: serializing does not touch the database
+    serializer = PostSerializer(
+        [posts[post_id] for post_id in post_ids if post_id in posts], many=True, context={'request': request}
+    )
+    next_url = None
+    if next_position is not None:
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(next_position))
+    return json_response({'next': next_url, 'results': serializer.data})
+
+
+@login_required
+async def leaderboard(request, user):
+    # See LeaderboardViewSet.list (?period=all|week|month&limit=)
+    period = request.GET.get('period', 'all')
+    if period == 'all':
+        board = await sync_to_async(leaderboards.global_board)()
+    elif period in LEADERBOARD_WINDOWS:
+        board = await sync_to_async(leaderboards.window_board)(period)
+    else:
+        return json_response({"detail": "Invalid period"}, status=400)
+    return json_response(await astandings(board, user, query_limit(request)))
@@ -0,0 +1,139 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from django.db.models import Count
+
+from .cache import catalog_cache
+from .models import Product, RecognizedObject, ProductScan, ScanRecord
+from .search import fold
+
+# Suggerimenti massimi per richiesta
+MAX_SUGGESTIONS = 20
+# Oltre questo numero di chiavi con lo stesso prefisso i migliori risultati sono precalcolati
+SCAN_LIMIT = 256
+# Carattere maggiore di qualunque lettera normalizzata: prefisso + END chiude l'intervallo
+END = '\uffff'
+
+
+def normalize(text):
+    """Testo confrontabile per prefisso: minuscolo, senza accenti, spazi singoli"""
+    return ' '.join(fold(text or '').split())
+
+
+class PrefixIndex:
+    """
+    Array ordinato di chiavi normalizzate: i suggerimenti per un prefisso sono
+    l'intervallo trovato con bisect. Ogni elemento ha come chiavi il nome, il
+    nome a partire da ogni parola e gli eventuali codici (barcode). Per i prefissi
+    con più di SCAN_LIMIT chiavi i primi MAX_SUGGESTIONS risultati sono calcolati
+    alla costruzione, quindi ogni ricerca costa O(log n + SCAN_LIMIT).
+    """
+
+    def __init__(self, items):
+        # items: (rank, nome, codici, dati); rank più basso = più rilevante.
+        # Gli elementi sono identificati dalla loro posizione in ordine di rank
+        self._items = []
+        entries = []
+        for position, (_, name, codes, data) in enumerate(sorted(items, key=lambda item: item[0])):
+            self._items.append(data)
+            words = normalize(name).split()
+            keys = {' '.join(words[i:]) for i in range(len(words))}
+            keys.update(normalize(code) for code in codes if code)
+            entries.extend((key, position) for key in keys)
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._positions = [position for _, position in entries]
+        self._top = {}
+        self._precompute(0, len(self._keys), 1)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _best(self, lo, hi, k):
+        # Un elemento può comparire con più chiavi nello stesso intervallo
+        return heapq.nsmallest(k, set(self._positions[lo:hi]))
+
+    def _precompute(self, lo, hi, length):
+        """
+        Migliori risultati dell'intervallo [lo, hi), le cui chiavi hanno in comune
+        i primi length - 1 caratteri. Si ottengono fondendo i migliori dei
+        sotto-intervalli con un carattere in più; quelli troppo grandi vengono
+        suddivisi a loro volta e i loro risultati salvati in _top.
+        """
+        candidates = set()
+        position = lo
+        while position < hi:
+            key = self._keys[position]
+            if len(key) < length:
+                # Chiave uguale al prefisso comune
+                candidates.add(self._positions[position])
+                position += 1
+                continue
+            prefix = key[:length]
+            end = bisect_left(self._keys, prefix + END, position, hi)
+            if end - position > SCAN_LIMIT:
+                best = self._top[prefix] = self._precompute(position, end, length + 1)
+            else:
+                best = self._best(position, end, MAX_SUGGESTIONS)
+            candidates.update(best)
+            position = end
+        return heapq.nsmallest(MAX_SUGGESTIONS, candidates)
+
+    def suggest(self, query, k=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        top = self._top.get(prefix)
+        if top is None:
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_right(self._keys, prefix + END, lo)
+            top = self._best(lo, hi, k)
+        return [self._items[position] for position in top[:k]]
+
+
+def product_items():
+    scans = dict(ProductScan.objects.values('product').annotate(count=Count('id')).values_list('product', 'count'))
+    for product_id, name, barcode, manufacturer in Product.objects.values_list('id', 'name', 'barcode', 'manufacturer'):
+        # Prima i prodotti più scansionati, poi in ordine alfabetico
+        rank = (-scans.get(product_id, 0), normalize(name), product_id)
+        data = {'id': product_id, 'name': name, 'barcode': barcode, 'manufacturer': manufacturer}
+        yield rank, name, [barcode], data
+
+
+def object_items():
+    scans = dict(ScanRecord.objects.values('recognized_object').annotate(count=Count('id')).values_list(
+        'recognized_object', 'count'
+    ))
+    for object_id, name, category in RecognizedObject.objects.values_list('id', 'name', 'category'):
+        rank = (-scans.get(object_id, 0), normalize(name), object_id)
+        yield rank, name, [], {'id': object_id, 'name': name, 'category': category}
+
+
+class Autocomplete:
+    """
+    Indice dei suggerimenti di un catalogo, tenuto in memoria per il processo e
+    ricostruito quando cambia la generazione del catalogo nella cache.
+    """
+
+    def __init__(self, catalog_name, loader):
+        self.catalog_name = catalog_name
+        self.loader = loader
+        self._lock = Lock()
+        self._generation = None
+        self._index = None
+
+    def index(self):
+        generation = catalog_cache.generation(self.catalog_name)
+        with self._lock:
+            if self._generation != generation:
+                self._index = PrefixIndex(self.loader())
+                self._generation = generation
+            return self._index
+
+    def suggest(self, query, k=10):
+        return self.index().suggest(query, min(k, MAX_SUGGESTIONS))
+
+
+product_suggestions = Autocomplete('product', product_items)
+object_suggestions = Autocomplete('object', object_items)
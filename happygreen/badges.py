@@ -0,0 +1,252 @@
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from datetime import timedelta
+from threading import Lock
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import catalog_cache
+from .dashboard import activity
+from .models import (
+    Badge, BadgeCriterion, ActivityCounter, UserBadge, ScanRecord, ProductScan, Post, QuizAttempt,
+    ChallengeParticipation
+)
+
+
+class BadgeThresholds:
+    """
+    Soglie dei badge senza criteri ordinate per punti, tenute in memoria per il
+    processo. Vengono ricaricate quando cambia la generazione 'badge' della cache di catalogo.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._points = []
+        self._badge_ids = []
+
+    def _load(self):
+        rows = list(
+            Badge.objects.filter(criteria=None).order_by('points_required', 'id').values_list('points_required', 'id')
+        )
+        self._points = [points for points, _ in rows]
+        self._badge_ids = [badge_id for _, badge_id in rows]
+
+    def qualifying(self, points):
+        """Restituisce gli id dei badge con points_required <= points"""
+        generation = catalog_cache.generation('badge')
+        with self._lock:
+            if self._generation != generation:
+                self._load()
+                self._generation = generation
+            return self._badge_ids[:bisect_right(self._points, points)]
+
+
+thresholds = BadgeThresholds()
+
+
+class BadgeRules:
+    """
+    Criteri dei badge tenuti in memoria per il processo e indicizzati per tipo di
+    evento, così ogni evento rivaluta solo i badge che vi sono iscritti. Vengono
+    ricaricati quando cambia la generazione 'badge' della cache di catalogo.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._rules = ({}, {}, frozenset())
+
+    def _load(self):
+        by_event = defaultdict(set)  # evento -> badge con almeno un criterio sull'evento
+        criteria = defaultdict(list)  # badge -> [(evento, categoria, soglia, finestra)]
+        windowed = set()  # (evento, categoria) di cui tenere i contatori giornalieri
+        for badge_id, event, category, threshold, window_days in BadgeCriterion.objects.values_list(
+            'badge_id', 'event', 'category', 'threshold', 'window_days'
+        ):
+            by_event[event].add(badge_id)
+            criteria[badge_id].append((event, category, threshold, window_days))
+            if window_days:
+                windowed.add((event, category))
+        self._rules = (dict(by_event), dict(criteria), frozenset(windowed))
+
+    def rules(self):
+        """(badge per evento, criteri per badge, chiavi con finestra temporale)"""
+        generation = catalog_cache.generation('badge')
+        with self._lock:
+            if self._generation != generation:
+                self._load()
+                self._generation = generation
+            return self._rules
+
+
+rules = BadgeRules()
+
+
+def add_activity(user_id, event, category, day, amount):
+    """Somma amount al contatore, creandolo se manca (come add_daily_points)"""
+    counter = ActivityCounter.objects.filter(user_id=user_id, event=event, category=category, day=day)
+    if counter.update(count=F('count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            ActivityCounter.objects.create(user_id=user_id, event=event, category=category, day=day, count=amount)
+    except IntegrityError:
+        # Creato nel frattempo da una richiesta concorrente
+        counter.update(count=F('count') + amount)
+
+
+def counter_keys(events):
+    """{(evento, categoria): quantità} con il totale di ogni evento sotto la categoria ''"""
+    totals = Counter()
+    for (event, category), amount in events.items():
+        totals[(event, '')] += amount
+        if category:
+            totals[(event, category)] += amount
+    return totals
+
+
+def record_events(user, events, day=None):
+    """
+    Registra gli eventi dell'utente ({(evento, categoria): quantità}) nei
+    contatori e valuta solo i badge con criteri su quegli eventi, senza mai
+    ricontare lo storico. Restituisce gli id dei badge assegnati.
+    """
+    events = counter_keys({key: amount for key, amount in events.items() if amount})
+    if not events:
+        return []
+    day = day or timezone.localdate()
+    by_event, _, windowed = rules.rules()
+    with transaction.atomic():
+        for (event, category), amount in events.items():
+            add_activity(user.id, event, category, ActivityCounter.TOTAL, amount)
+            if (event, category) in windowed:
+                add_activity(user.id, event, category, day, amount)
+        candidates = set().union(*(by_event.get(event, ()) for event, _ in events))
+        return evaluate(user, candidates, day)
+
+
+def evaluate(user, badge_ids, day=None):
+    """
+    Assegna i badge tra badge_ids di cui l'utente soddisfa tutti i criteri.
+    Legge solo i contatori citati dai criteri: al più tre query.
+    """
+    if not badge_ids:
+        return []
+    day = day or timezone.localdate()
+    _, criteria, _ = rules.rules()
+    owned = set(UserBadge.objects.filter(user=user, badge_id__in=badge_ids).values_list('badge_id', flat=True))
+    candidates = [badge_id for badge_id in badge_ids if badge_id not in owned and badge_id in criteria]
+    if not candidates:
+        return []
+
+    needed = [criterion for badge_id in candidates for criterion in criteria[badge_id]]
+    keys = Q()
+    for event, category, _, _ in needed:
+        keys |= Q(event=event, category=category)
+    longest = max((window_days or 0 for _, _, _, window_days in needed), default=0)
+    since = day - timedelta(days=longest)
+    totals, daily = {}, defaultdict(list)
+    for event, category, counter_day, count in ActivityCounter.objects.filter(keys, user=user).filter(
+        Q(day=ActivityCounter.TOTAL) | Q(day__gt=since, day__lte=day)
+    ).values_list('event', 'category', 'day', 'count'):
+        if counter_day == ActivityCounter.TOTAL:
+            totals[(event, category)] = count
+        else:
+            daily[(event, category)].append((counter_day, count))
+
+    def value(event, category, window_days):
+        if not window_days:
+            return totals.get((event, category), 0)
+        start = day - timedelta(days=window_days)
+        return sum(count for counter_day, count in daily[(event, category)] if counter_day > start)
+
+    earned = [
+        badge_id for badge_id in candidates
+        if all(value(event, category, window_days) >= threshold for event, category, threshold, window_days in criteria[badge_id])
+    ]
+    if earned:
+        UserBadge.objects.bulk_create([UserBadge(user=user, badge_id=badge_id) for badge_id in earned], ignore_conflicts=True)
+        activity(user.id)
+    return earned
+
+
+def history_events():
+    """Righe (user_id, evento, categoria, giorno, quantità) ricavate dallo storico delle attività"""
+    day = TruncDate('created_at')
+    for row in ScanRecord.objects.values('user', 'recognized_object__category', day=day).annotate(
+        amount=Count('id')
+    ).order_by().iterator():
+        yield row['user'], 'SCAN', row['recognized_object__category'], row['day'], row['amount']
+    for row in ProductScan.objects.values('user', day=day).annotate(amount=Count('id')).order_by().iterator():
+        yield row['user'], 'PRODUCT_SCAN', '', row['day'], row['amount']
+    for row in Post.objects.values('author', day=day).annotate(amount=Count('id')).order_by().iterator():
+        yield row['author'], 'POST', '', row['day'], row['amount']
+
+    completed_day = TruncDate('completed_at')
+    for row in QuizAttempt.objects.filter(completed=True).exclude(completed_at=None).values(
+        'user', day=completed_day
+    ).annotate(amount=Count('id'), answers=Sum('score')).order_by().iterator():
+        yield row['user'], 'QUIZ', '', row['day'], row['amount']
+        yield row['user'], 'QUIZ_ANSWER', '', row['day'], row['answers']
+    for row in ChallengeParticipation.objects.filter(completed=True).exclude(completed_at=None).values(
+        'user', day=completed_day
+    ).annotate(amount=Count('id')).order_by().iterator():
+        yield row['user'], 'CHALLENGE', '', row['day'], row['amount']
+
+
+def rebuild_counters():
+    """
+    Porta i contatori delle attività ai valori ricalcolati dallo storico, come
+    stats.reconcile: applica solo le differenze con add_activity (F() + delta),
+    così gli incrementi di record_events concorrenti non vengono persi. Storico
+    e contatori sono letti nella stessa transazione. Restituisce il numero di
+    contatori corretti.
+    """
+    _, _, windowed = rules.rules()
+    expected = Counter()
+    with transaction.atomic():
+        for user_id, event, category, day, amount in history_events():
+            for key in counter_keys({(event, category): amount}):
+                expected[(user_id, *key, ActivityCounter.TOTAL)] += amount
+                if key in windowed:
+                    expected[(user_id, *key, day)] += amount
+        stored = {
+            (user_id, event, category, day): count
+            for user_id, event, category, day, count in ActivityCounter.objects.values_list(
+                'user', 'event', 'category', 'day', 'count'
+            ).iterator()
+        }
+
+    corrected = 0
+    for key in expected.keys() | stored.keys():
+        delta = expected[key] - stored.get(key, 0)
+        if delta:
+            add_activity(*key, delta)
+            corrected += 1
+    # I contatori scesi a zero (storico cancellato, finestre non più usate) equivalgono a quelli assenti
+    ActivityCounter.objects.filter(count=0).delete()
+    return corrected
+
+
+def award_badges(user, points):
+    """
+    Assegna all'utente tutti i badge senza criteri per cui ha raggiunto la soglia
+    di punti. Esegue al massimo due query, indipendentemente dal numero di badge.
+    """
+    qualifying = thresholds.qualifying(points)
+    if not qualifying:
+        return []
+
+    owned = set(UserBadge.objects.filter(user=user).values_list('badge_id', flat=True))
+    missing = [badge_id for badge_id in qualifying if badge_id not in owned]
+    if missing:
+        UserBadge.objects.bulk_create(
+            [UserBadge(user=user, badge_id=badge_id) for badge_id in missing],
+            ignore_conflicts=True
+        )
+        activity(user.id)
+    return missing
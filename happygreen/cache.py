@@ -0,0 +1,141 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+MISSING = object()
+
+
+class LRUCache:
+    """Cache LRU in memoria, locale al processo, con scadenza (TTL) delle voci"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CatalogCache:
+    """
+    Cache a due livelli per i dati di catalogo (prodotti, oggetti, badge, quiz):
+    una LRU locale al processo e la cache condivisa di Django.
+
+    Ogni catalogo ha un contatore di generazione salvato nella cache condivisa e
+    incrementato dai segnali post_save/post_delete; le chiavi includono la
+    generazione, quindi una modifica invalida entrambi i livelli in tutti i processi.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self):
+        options = getattr(settings, 'CATALOG_CACHE', {})
+        self.alias = options.get('ALIAS', 'default')
+        self.ttl = options.get('TIMEOUT', 300)
+        # Ogni quanti secondi un processo rilegge le generazioni dalla cache condivisa
+        self.generation_ttl = options.get('GENERATION_TIMEOUT', 1)
+        self.local = LRUCache(options.get('MAX_ENTRIES', 1024), self.ttl)
+        self._generations = {}
+        self._lock = Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def generation(self, name):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._generations.get(name)
+        if cached is not None and now - cached[1] < self.generation_ttl:
+            return cached[0]
+
+        key = f'catalog:generation:{name}'
+        generation = self.shared.get(key)
+        if generation is None:
+            # Partire da un timestamp evita di riusare generazioni di un contatore perso
+            self.shared.add(key, time.time_ns(), timeout=None)
+            generation = self.shared.get(key)
+        with self._lock:
+            self._generations[name] = (generation, now)
+        return generation
+
+    def bump(self, name):
+        key = f'catalog:generation:{name}'
+        try:
+            generation = self.shared.incr(key)
+        except ValueError:
+            generation = time.time_ns()
+            self.shared.set(key, generation, timeout=None)
+        with self._lock:
+            self._generations[name] = (generation, time.monotonic())
+
+    def lookup(self, name, key):
+        """(chiave completa, valore in cache o MISSING) per la chiave del catalogo"""
+        digest = hashlib.md5(str(key).encode()).hexdigest()
+        full_key = f'catalog:{name}:{self.generation(name)}:{digest}'
+
+        value = self.local.get(full_key)
+        if value is MISSING:
+            value = self.shared.get(full_key, MISSING)
+            if value is not MISSING:
+                self.local.set(full_key, value)
+        return full_key, value
+
+    def store(self, full_key, value):
+        self.shared.set(full_key, value, self.ttl)
+        self.local.set(full_key, value)
+
+    def get_or_set(self, name, key, loader):
+        """Restituisce il valore in cache per la chiave, calcolandolo con loader() se assente"""
+        full_key, value = self.lookup(name, key)
+        if value is MISSING:
+            value = loader()
+            self.store(full_key, value)
+        return value
+
+    async def aget_or_set(self, name, key, loader):
+        """Come get_or_set(), per le view asincrone: loader è una coroutine function"""
+        full_key, value = await sync_to_async(self.lookup)(name, key)
+        if value is MISSING:
+            value = await loader()
+            await sync_to_async(self.store)(full_key, value)
+        return value
+
+
+catalog_cache = CatalogCache()
+
+
+@receiver(setting_changed)
+def reset_catalog_cache(setting, **kwargs):
+    if setting in ('CACHES', 'CATALOG_CACHE'):
+        catalog_cache.configure()
@@ -0,0 +1,110 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+
+from .models import (
+    GroupMembership, Post, PointsTransaction, Profile, QuizAttempt, ChallengeParticipation,
+    UserBadge, UserScanStatistic
+)
+from .stats import aggregate, average
+from .streaks import streak_of
+
+# Secondi di validità della dashboard in cache; le attività dell'utente la invalidano prima
+DASHBOARD_TIMEOUT = 300
+# Badge più recenti mostrati nella dashboard
+RECENT_BADGES = 5
+
+
+def generation(user_id):
+    key = f'dashboard:generation:{user_id}'
+    value = cache.get(key)
+    if value is None:
+        # Come per la cache di catalogo, un timestamp evita di riusare generazioni perse
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def activity(user_id):
+    """Invalida la dashboard dell'utente dopo una nuova attività"""
+    key = f'dashboard:generation:{user_id}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def count_of(model, field='user', **filters):
+    """Subquery con il numero di righe del modello che appartengono all'utente"""
+    rows = model.objects.filter(**{field: OuterRef('user')}, **filters).order_by().values(field)
+    return Subquery(rows.annotate(count=Count('pk')).values('count'), output_field=IntegerField())
+
+
+def compute_dashboard(user):
+    """
+    Riepilogo dell'attività dell'utente con un numero fisso di query: conteggi,
+    punti per origine, scansioni per categoria (dai contatori delle statistiche),
+    badge recenti e serie di giorni attivi.
+    """
+    profile = Profile.objects.filter(user=user).annotate(
+        groups=count_of(GroupMembership),
+        posts=count_of(Post, 'author'),
+        badges=count_of(UserBadge),
+        quizzes_completed=count_of(QuizAttempt, completed=True),
+        challenges_completed=count_of(ChallengeParticipation, completed=True),
+    ).first() or Profile(user=user)
+    counts = {
+        field: getattr(profile, field, None) or 0
+        for field in ('groups', 'posts', 'badges', 'quizzes_completed', 'challenges_completed')
+    }
+
+    points_by_source = dict(
+        PointsTransaction.objects.filter(user=user).values('source').annotate(total=Sum('amount')).order_by().values_list(
+            'source', 'total'
+        )
+    )
+
+    statistics = {'CATEGORY': [], 'PRODUCT': []}
+    for scope, key, scans, score_total in UserScanStatistic.objects.filter(user=user).values_list(
+        'scope', 'key', 'scans', 'score_total'
+    ):
+        statistics[scope].append((key, scans, score_total))
+    categories = aggregate(statistics['CATEGORY'])
+    products = aggregate(statistics['PRODUCT'])
+    counts['scans'] = sum(scans for _, scans, _ in categories)
+    counts['product_scans'] = sum(scans for _, scans, _ in products)
+
+    recent_badges = [
+        {'id': badge_id, 'name': name, 'earned_at': earned_at}
+        for badge_id, name, earned_at in UserBadge.objects.filter(user=user).order_by('-earned_at', '-id').values_list(
+            'badge_id', 'badge__name', 'earned_at'
+        )[:RECENT_BADGES]
+    ]
+
+    return {
+        'user': user.id,
+        'username': user.username,
+        'points': profile.points,
+        'counts': counts,
+        'points_by_source': points_by_source,
+        'categories': [
+            {'category': key, 'scans': scans, 'average_score': average(scans, score_total)}
+            for key, scans, score_total in categories
+        ],
+        'products_average_score': average(
+            counts['product_scans'], sum(score_total for _, _, score_total in products)
+        ),
+        'recent_badges': recent_badges,
+        'streak': streak_of(profile),
+    }
+
+
+def dashboard(user):
+    """Dashboard dell'utente dalla cache condivisa, ricalcolata se è cambiata la generazione"""
+    key = f'dashboard:{user.id}:{generation(user.id)}'
+    data = cache.get(key)
+    if data is None:
+        data = compute_dashboard(user)
+        cache.set(key, data, DASHBOARD_TIMEOUT)
+    return data
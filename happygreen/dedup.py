@@ -0,0 +1,93 @@
+from datetime import timedelta
+from threading import RLock
+
+from django.utils import timezone
+
+from .fingerprints import HashIndex, sha256_of, perceptual_hash
+from .models import ScanRecord
+
+
+class SeenImages:
+    """
+    Indice in memoria degli hash percettivi delle scansioni, caricato alla prima
+    ricerca. Le scansioni salvate dal processo vengono aggiunte subito; quelle
+    degli altri processi ogni SYNC_INTERVAL rileggendo le più recenti.
+    """
+    SYNC_INTERVAL = timedelta(seconds=30)
+    # Margine per le transazioni ancora aperte durante la sincronizzazione precedente
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+            self._synced_at = None
+
+    def index(self):
+        with self._lock:
+            now = timezone.now()
+            if self._index is None:
+                self._index = HashIndex(self._hashes(ScanRecord.objects.all()))
+                self._synced_at = now
+            elif now - self._synced_at > self.SYNC_INTERVAL:
+                recent = ScanRecord.objects.filter(created_at__gte=self._synced_at - self.SYNC_OVERLAP)
+                for scan_id, value in self._hashes(recent):
+                    self._index.add(scan_id, value)
+                self._synced_at = now
+            return self._index
+
+    @staticmethod
+    def _hashes(queryset):
+        rows = queryset.exclude(image_phash=None).values_list('id', 'image_phash').iterator()
+        return ((scan_id, int(phash, 16)) for scan_id, phash in rows)
+
+    def scan_added(self, scan_id, phash):
+        with self._lock:
+            if self._index is not None and phash:
+                self._index.add(scan_id, int(phash, 16))
+
+    def scan_removed(self, scan_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(scan_id)
+
+
+seen_images = SeenImages()
+
+
+def find_seen(file, user, limit=10):
+    """
+    Scansioni con la stessa immagine (SHA-256) o una quasi identica (hash
+    percettivo). Gli id delle scansioni sono restituiti solo per quelle dell'utente.
+    """
+    sha256 = sha256_of(file)
+    phash = perceptual_hash(file)
+
+    exact = list(ScanRecord.objects.filter(image_sha256=sha256).values_list('id', flat=True)[:limit])
+    distances = dict.fromkeys(exact, 0)
+    if phash is not None:
+        for distance, scan_id in seen_images.index().near(phash)[:limit]:
+            distances.setdefault(scan_id, distance)
+
+    scans = ScanRecord.objects.filter(id__in=distances).values_list('id', 'user_id', 'recognized_object_id')
+    matches = sorted(
+        (
+            {
+                'distance': distances[scan_id],
+                'recognized_object': object_id,
+                'scan': scan_id if user_id == user.id else None,
+            }
+            for scan_id, user_id, object_id in scans
+        ),
+        key=lambda match: (match['distance'], match['scan'] is None)
+    )[:limit]
+
+    return {
+        'sha256': sha256,
+        'phash': None if phash is None else f'{phash:016x}',
+        'exact': bool(exact),
+        'matches': matches,
+    }
@@ -0,0 +1,88 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import ScanRecord, ProductScan, QuizAttempt, ChallengeParticipation
+
+# Righe lette dal database per ogni query dell'esportazione
+EXPORT_CHUNK_SIZE = 500
+
+# Dati esportabili: modello e colonne (nome della colonna -> lookup) per ciascun tipo
+EXPORTS = {
+    'scans': (ScanRecord, {
+        'id': 'id',
+        'created_at': 'created_at',
+        'object_name': 'recognized_object__name',
+        'category': 'recognized_object__category',
+        'image': 'image',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+        'location_name': 'location_name',
+    }),
+    'product_scans': (ProductScan, {
+        'id': 'id',
+        'created_at': 'created_at',
+        'barcode': 'product__barcode',
+        'product_name': 'product__name',
+        'sustainability_score': 'product__sustainability_score',
+    }),
+    'quiz_attempts': (QuizAttempt, {
+        'id': 'id',
+        'quiz_title': 'quiz__title',
+        'score': 'score',
+        'completed': 'completed',
+        'started_at': 'started_at',
+        'completed_at': 'completed_at',
+    }),
+    'challenges': (ChallengeParticipation, {
+        'id': 'id',
+        'challenge_title': 'challenge__title',
+        'completed': 'completed',
+        'joined_at': 'joined_at',
+        'completed_at': 'completed_at',
+    }),
+}
+
+
+def export_fields(export_type):
+    return list(EXPORTS[export_type][1])
+
+
+def export_rows(user, export_type, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Genera le righe dell'esportazione come dizionari, a blocchi di chunk_size.
+    I blocchi sono letti per chiave primaria crescente (keyset) invece che con
+    .iterator(): con MySQL il driver caricherebbe comunque l'intero risultato in memoria.
+    """
+    model, columns = EXPORTS[export_type]
+    fields = [name for name, lookup in columns.items() if name == lookup]
+    expressions = {name: F(lookup) for name, lookup in columns.items() if name != lookup}
+    queryset = model.objects.filter(user=user).order_by('id').values(*fields, **expressions)
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo:
+    """Buffer fittizio: csv.writer scrive una riga e la restituisce invece di salvarla"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
@@ -0,0 +1,67 @@
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Lato dell'immagine ridotta su cui vengono calcolate le feature
+FEATURE_IMAGE_SIZE = 64
+# Istogramma colore HSV: bin di tonalità, saturazione e luminosità
+COLOR_BINS = (8, 3, 3)
+# Istogramma dei gradienti: celle per lato e orientazioni per cella
+GRADIENT_CELLS = 4
+GRADIENT_BINS = 8
+
+FEATURE_SIZE = int(np.prod(COLOR_BINS)) + GRADIENT_CELLS * GRADIENT_CELLS * GRADIENT_BINS
+
+
+def normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def color_histogram(hsv):
+    """Istogramma congiunto HSV normalizzato (colori dominanti dell'oggetto)"""
+    bins = np.array(COLOR_BINS)
+    indices = (hsv.reshape(-1, 3).astype(np.int64) * bins) // 256
+    flat = np.ravel_multi_index(tuple(indices.T), COLOR_BINS)
+    return normalize(np.bincount(flat, minlength=int(np.prod(COLOR_BINS))).astype(np.float32))
+
+
+def gradient_histogram(gray):
+    """Istogrammi delle orientazioni dei gradienti per cella, pesati per intensità (forma dell'oggetto)"""
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    # Orientazione senza verso in [0, pi)
+    orientation = np.mod(np.arctan2(gy, gx), np.pi)
+    bins = np.minimum((orientation / np.pi * GRADIENT_BINS).astype(np.int64), GRADIENT_BINS - 1)
+
+    cell_size = FEATURE_IMAGE_SIZE // GRADIENT_CELLS
+    rows, columns = np.indices(gray.shape) // cell_size
+    cells = rows * GRADIENT_CELLS + columns
+    histogram = np.bincount(
+        (cells * GRADIENT_BINS + bins).ravel(),
+        weights=magnitude.ravel(),
+        minlength=GRADIENT_CELLS * GRADIENT_CELLS * GRADIENT_BINS
+    )
+    return normalize(histogram.astype(np.float32))
+
+
+def image_features(file):
+    """
+    Descrittore compatto dell'immagine (float32, FEATURE_SIZE valori, norma 1):
+    istogramma colore e istogramma dei gradienti, con lo stesso peso.
+    None se il file non è un'immagine.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image.draft('RGB', (FEATURE_IMAGE_SIZE * 2, FEATURE_IMAGE_SIZE * 2))
+            image = ImageOps.exif_transpose(image).convert('RGB').resize(
+                (FEATURE_IMAGE_SIZE, FEATURE_IMAGE_SIZE), Image.BILINEAR
+            )
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+    finally:
+        file.seek(0)
+
+    hsv = np.asarray(image.convert('HSV'))
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    return normalize(np.concatenate([color_histogram(hsv), gradient_histogram(gray)])).astype(np.float32)
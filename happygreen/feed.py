@@ -0,0 +1,121 @@
+import heapq
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Group, GroupMembership, Post, TimelineEntry
+
+# Oltre questo numero di membri i post del gruppo sono letti nel feed invece che copiati
+FANOUT_LIMIT = 1000
+# Post recenti copiati nella timeline di chi entra in un gruppo
+JOIN_BACKFILL = 50
+
+
+def fan_out(post_id):
+    """Copia il post nella timeline dei membri del gruppo, se il gruppo non è troppo grande"""
+    post = Post.objects.filter(id=post_id).select_related('group').only(
+        'id', 'group_id', 'created_at', 'group__fanout_on_read'
+    ).first()
+    if post is None or post.group.fanout_on_read:
+        return
+    member_ids = GroupMembership.objects.filter(group_id=post.group_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post.id, group_id=post.group_id, created_at=post.created_at)
+            for user_id in member_ids.iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def membership_added(group_id, user_id):
+    """
+    Passa il gruppo al fan-out in lettura quando supera FANOUT_LIMIT membri,
+    altrimenti copia nella timeline del nuovo membro i post più recenti.
+    """
+    if GroupMembership.objects.filter(group_id=group_id).count() > FANOUT_LIMIT:
+        # Il passaggio è definitivo: i post già copiati restano, il feed scarta i doppioni
+        Group.objects.filter(id=group_id, fanout_on_read=False).update(fanout_on_read=True)
+        return
+    if Group.objects.filter(id=group_id, fanout_on_read=True).exists():
+        return
+    recent = Post.objects.filter(group_id=group_id).order_by('-created_at', '-id').values_list('id', 'created_at')
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, group_id=group_id, created_at=created_at)
+            for post_id, created_at in recent[:JOIN_BACKFILL]
+        ],
+        ignore_conflicts=True
+    )
+
+
+def membership_removed(group_id, user_id):
+    TimelineEntry.objects.filter(user_id=user_id, group_id=group_id).delete()
+
+
+def encode_cursor(position):
+    created_at, post_id = position
+    return urlsafe_b64encode(f'{created_at.isoformat()}|{post_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Posizione (created_at, post_id) codificata nel cursore; ValueError se non è valido"""
+    try:
+        created_at, post_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (TypeError, UnicodeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def feed_sources(user, size, cursor, large_group_ids):
+    """
+    Queryset ordinati per data da fondere nella pagina: la timeline materializzata
+    (range scan sull'indice (user, created_at, post)) e, se l'utente è in gruppi
+    grandi, i loro post letti con una range scan per gruppo.
+    """
+    timeline = TimelineEntry.objects.filter(user=user)
+    if cursor is not None:
+        created_at, post_id = cursor
+        timeline = timeline.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id))
+
+    # Una riga in più per sapere se esiste una pagina successiva
+    sources = [
+        timeline.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:size + 1],
+    ]
+    if large_group_ids:
+        posts = Post.objects.filter(group_id__in=large_group_ids)
+        if cursor is not None:
+            posts = posts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id))
+        sources.append(posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:size + 1])
+    return sources
+
+
+def large_groups(user):
+    return GroupMembership.objects.filter(user=user, group__fanout_on_read=True).values_list('group_id', flat=True)
+
+
+def merge_page(sources, size):
+    """Fonde le righe (created_at, post_id) delle sorgenti scartando i doppioni"""
+    page, seen = [], set()
+    for position in heapq.merge(*sources, reverse=True):
+        if position[1] in seen:
+            continue
+        if len(page) == size:
+            return [post_id for _, post_id in page], page[-1]
+        seen.add(position[1])
+        page.append(position)
+    return [post_id for _, post_id in page], None
+
+
+def home_feed(user, size, cursor=None):
+    """Id dei post della pagina del feed e posizione della pagina successiva (o None)"""
+    sources = feed_sources(user, size, cursor, list(large_groups(user)))
+    return merge_page([list(source) for source in sources], size)
+
+
+async def ahome_feed(user, size, cursor=None):
+    """Come home_feed(), con l'interfaccia asincrona dell'ORM"""
+    sources = feed_sources(user, size, cursor, [group_id async for group_id in large_groups(user)])
+    return merge_page([[row async for row in source] for source in sources], size)
@@ -0,0 +1,103 @@
+import hashlib
+from collections import defaultdict
+from threading import RLock
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Bit dell'hash percettivo (dHash 8 x 8)
+HASH_BITS = 64
+# Distanza di Hamming massima tra due immagini considerate quasi identiche
+MAX_DISTANCE = 4
+
+
+def sha256_of(file):
+    """SHA-256 esadecimale del file, letto a blocchi"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(file):
+    """
+    dHash a 64 bit: confronta la luminosità dei pixel adiacenti di una miniatura
+    9 x 8 in scala di grigi. Resiste a ricompressione e ridimensionamento.
+    None se il file non è un'immagine.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image.draft('L', (64, 64))
+            pixels = list(ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        return None
+    finally:
+        file.seek(0)
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left, right = pixels[row * 9 + column], pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def distance(a, b):
+    """Distanza di Hamming tra due hash"""
+    return bin(a ^ b).count('1')
+
+
+class HashIndex:
+    """
+    Indice in memoria per la ricerca degli hash entro MAX_DISTANCE (multi-index
+    hashing): l'hash è diviso in MAX_DISTANCE + 1 segmenti e due hash abbastanza
+    vicini hanno almeno un segmento identico, quindi basta confrontare i
+    candidati che condividono un segmento invece di tutto l'indice.
+    """
+
+    def __init__(self, entries=(), max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        parts = max_distance + 1
+        bounds = [HASH_BITS * i // parts for i in range(parts + 1)]
+        self._segments = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._lock = RLock()
+        self._hashes = {}
+        self._tables = [defaultdict(set) for _ in self._segments]
+        for key, value in entries:
+            self.add(key, value)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _keys(self, value):
+        return [(value >> start) & mask for start, mask in self._segments]
+
+    def add(self, key, value):
+        with self._lock:
+            self.remove(key)
+            self._hashes[key] = value
+            for table, segment in zip(self._tables, self._keys(value)):
+                table[segment].add(key)
+
+    def remove(self, key):
+        with self._lock:
+            value = self._hashes.pop(key, None)
+            if value is None:
+                return
+            for table, segment in zip(self._tables, self._keys(value)):
+                bucket = table[segment]
+                bucket.discard(key)
+                if not bucket:
+                    del table[segment]
+
+    def near(self, value, max_distance=None):
+        """Lista di (distanza, chiave) degli hash entro max_distance, dai più vicini"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._lock:
+            candidates = set()
+            for table, segment in zip(self._tables, self._keys(value)):
+                candidates.update(table.get(segment, ()))
+            matches = [(distance(value, self._hashes[key]), key) for key in candidates]
+        return sorted(match for match in matches if match[0] <= max_distance)
@@ -0,0 +1,137 @@
+import math
+
+from django.db.models import Q
+
+# Precisione dei geohash salvati sui modelli: 9 caratteri, celle di circa 5 x 5 metri
+GEOHASH_PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS = 6371000  # metri
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash della coordinata con la precisione indicata"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_for(latitude, longitude):
+    """Geohash da salvare sul modello, None se la posizione non è nota"""
+    if latitude is None or longitude is None:
+        return None
+    return encode(latitude, longitude)
+
+
+def cell_size(precision):
+    """Dimensioni (latitudine, longitudine) in gradi di una cella geohash"""
+    bits = precision * 5
+    return 180.0 / (1 << (bits // 2)), 360.0 / (1 << ((bits + 1) // 2))
+
+
+def covering_prefixes(min_lat, min_lon, max_lat, max_lon, max_cells=16):
+    """
+    Prefissi geohash che coprono il rettangolo, alla precisione più alta che
+    richiede al massimo max_cells celle. Ogni prefisso è una range scan sull'indice.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor((max_lat + 90) / height) - math.floor((min_lat + 90) / height) + 1
+        columns = math.floor((max_lon + 180) / width) - math.floor((min_lon + 180) / width) + 1
+        if rows * columns <= max_cells:
+            break
+
+    prefixes = set()
+    lat = min_lat
+    while True:
+        lon = min_lon
+        while True:
+            prefixes.add(encode(lat, lon, precision))
+            if lon >= max_lon:
+                break
+            lon = min(lon + width, max_lon)
+        if lat >= max_lat:
+            break
+        lat = min(lat + height, max_lat)
+    return sorted(prefixes)
+
+
+def prefix_range(prefix):
+    """
+    Intervallo [prefix, limite) dei geohash che iniziano con prefix; il limite è
+    il prefisso successivo nell'alfabeto base32 (None se prefix è fatto di sole 'z').
+    """
+    stem = prefix.rstrip(BASE32[-1])
+    if not stem:
+        return prefix, None
+    return prefix, stem[:-1] + BASE32[BASE32.index(stem[-1]) + 1]
+
+
+def prefix_filter(prefixes, field='geohash'):
+    """
+    Q che seleziona i geohash con uno dei prefissi, con un intervallo gte/lt per
+    prefisso. A differenza di startswith (LIKE BINARY su MySQL) l'intervallo
+    usa l'indice con qualsiasi collation: cifre e lettere minuscole hanno lo
+    stesso ordine nelle collation binarie e case-insensitive.
+    """
+    condition = Q()
+    for prefix in prefixes:
+        low, high = prefix_range(prefix)
+        bounds = {f'{field}__gte': low}
+        if high is not None:
+            bounds[f'{field}__lt'] = high
+        condition |= Q(**bounds)
+    return condition
+
+
+def clamp_bbox(min_lat, min_lon, max_lat, max_lon, size):
+    """Rettangolo con i lati ridotti ad al più size gradi intorno al centro di quello dato"""
+    def clamp(low, high):
+        if high - low <= size:
+            return low, high
+        middle = (low + high) / 2
+        return middle - size / 2, middle + size / 2
+
+    min_lat, max_lat = clamp(min_lat, max_lat)
+    min_lon, max_lon = clamp(min_lon, max_lon)
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def radius_bbox(latitude, longitude, radius):
+    """Rettangolo (min_lat, min_lon, max_lat, max_lon) che contiene il cerchio di raggio radius metri"""
+    delta_lat = math.degrees(radius / EARTH_RADIUS)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = min(math.degrees(radius / (EARTH_RADIUS * cos_lat)), 180.0)
+    return (
+        max(latitude - delta_lat, -90.0),
+        max(longitude - delta_lon, -180.0),
+        min(latitude + delta_lat, 90.0),
+        min(longitude + delta_lon, 180.0),
+    )
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Distanza in metri tra due coordinate (formula dell'emisenoverso)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
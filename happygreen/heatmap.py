@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+from django.core.cache import cache
+
+from .geo import covering_prefixes, prefix_filter
+from .models import ScanRecord
+
+# Zoom minimo e massimo delle tile (coordinate slippy map / Web Mercator)
+MIN_ZOOM = 10
+MAX_ZOOM = 18
+# Numero massimo di tile calcolate in una richiesta: con MIN_ZOOM limita anche
+# l'area, e quindi le scansioni lette, a circa 300 km di lato
+MAX_TILES = 64
+# Durata in secondi dei conteggi di una tile nella cache
+HEATMAP_CACHE_TIMEOUT = 300
+# Latitudine massima rappresentabile in Web Mercator
+MAX_LATITUDE = 85.0511
+
+
+def tile_for(latitude, longitude, zoom):
+    """Coordinate (x, y) della tile che contiene il punto"""
+    x, y = tiles_for(np.array([latitude]), np.array([longitude]), zoom)
+    return int(x[0]), int(y[0])
+
+
+def tiles_for(latitudes, longitudes, zoom):
+    """Versione vettoriale di tile_for su array di coordinate"""
+    n = 1 << zoom
+    lat = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((longitudes + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """Rettangolo (min_lat, min_lon, max_lat, max_lon) della tile"""
+    n = 1 << zoom
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+def bin_scans(latitudes, longitudes, categories, zoom):
+    """
+    Conta i punti per tile e categoria con operazioni vettoriali:
+    restituisce {(x, y): {categoria: conteggio}}.
+    """
+    if not len(latitudes):
+        return {}
+    x, y = tiles_for(np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float), zoom)
+    names, codes = np.unique(np.asarray(categories, dtype=object), return_inverse=True)
+    keys = ((x << zoom) + y) * len(names) + codes
+    unique_keys, counts = np.unique(keys, return_counts=True)
+
+    tiles = {}
+    for key, count in zip(unique_keys.tolist(), counts.tolist()):
+        tile, code = divmod(key, len(names))
+        tile_x, tile_y = divmod(tile, 1 << zoom)
+        tiles.setdefault((tile_x, tile_y), {})[names[code]] = count
+    return tiles
+
+
+def heatmap(zoom, min_lat, min_lon, max_lat, max_lon):
+    """
+    Conteggi per categoria delle tile di livello zoom che coprono il rettangolo.
+    Le tile già calcolate arrivano dalla cache; le altre sono calcolate insieme
+    con una sola query sulle scansioni della loro area.
+    """
+    if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+        raise ValueError(f"Zoom must be between {MIN_ZOOM} and {MAX_ZOOM}")
+    min_x, min_y = tile_for(max_lat, min_lon, zoom)
+    max_x, max_y = tile_for(min_lat, max_lon, zoom)
+    if (max_x - min_x + 1) * (max_y - min_y + 1) > MAX_TILES:
+        raise ValueError(f"The area covers more than {MAX_TILES} tiles at this zoom level")
+
+    keys = {
+        (x, y): f'heatmap:{zoom}:{x}:{y}'
+        for x in range(min_x, max_x + 1)
+        for y in range(min_y, max_y + 1)
+    }
+    cached = cache.get_many(keys.values())
+    missing = [tile for tile, key in keys.items() if key not in cached]
+
+    if missing:
+        area = [tile_bounds(x, y, zoom) for x, y in missing]
+        south, west = min(b[0] for b in area), min(b[1] for b in area)
+        north, east = max(b[2] for b in area), max(b[3] for b in area)
+        rows = list(ScanRecord.objects.filter(prefix_filter(covering_prefixes(south, west, north, east))).filter(
+            latitude__range=(south, north), longitude__range=(west, east)
+        ).values_list('latitude', 'longitude', 'recognized_object__category'))
+
+        latitudes, longitudes, categories = zip(*rows) if rows else ((), (), ())
+        binned = bin_scans(latitudes, longitudes, categories, zoom)
+        computed = {keys[tile]: binned.get(tile, {}) for tile in missing}
+        cache.set_many(computed, HEATMAP_CACHE_TIMEOUT)
+        cached.update(computed)
+
+    return [
+        {'x': x, 'y': y, 'total': sum(cached[key].values()), 'categories': cached[key]}
+        for (x, y), key in keys.items()
+        if cached[key]
+    ]
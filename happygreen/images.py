@@ -0,0 +1,172 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .cache import catalog_cache
+from .models import Profile, Post, ScanRecord, Product
+
+logger = logging.getLogger(__name__)
+
+# Campo immagine dei modelli per cui vengono generate le varianti ridimensionate
+IMAGE_FIELDS = {
+    Profile: 'avatar',
+    Post: 'image',
+    ScanRecord: 'image',
+    Product: 'image',
+}
+
+DEFAULT_OPTIONS = {
+    'SIZES': {'thumb': 160, 'small': 480, 'large': 1280},  # lato maggiore in pixel
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+    'WORKERS': 2,  # 0 = generazione nel thread della richiesta
+}
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'IMAGE_RENDITIONS', {})}
+
+
+def output_format():
+    """Formato delle varianti: JPEG se Pillow è compilato senza WebP"""
+    image_format = options()['FORMAT'].upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def rendition_path(name, label, image_format):
+    stem, _ = os.path.splitext(name)
+    return f'renditions/{stem}_{label}.{EXTENSIONS[image_format]}'
+
+
+def render(source, sizes, image_format, quality):
+    """
+    Varianti ridimensionate dell'immagine: {etichetta: bytes}. Il JPEG viene
+    decodificato direttamente a scala ridotta (draft) e ogni variante è ricavata
+    dalla precedente, più grande, invece che dall'originale.
+    """
+    largest = max(sizes.values())
+    with Image.open(source) as image:
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+        renditions = {}
+        for label, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+            output = BytesIO()
+            image.save(output, image_format, quality=quality)
+            renditions[label] = output.getvalue()
+        return renditions
+
+
+def generate_renditions(model, pk):
+    """
+    Genera le varianti dell'immagine dell'oggetto e le registra nel campo renditions.
+    Il salvataggio avviene solo se nel frattempo l'immagine non è cambiata.
+    """
+    field_name = IMAGE_FIELDS[model]
+    row = model.objects.filter(pk=pk).values_list(field_name, 'renditions').first()
+    if row is None:
+        return None
+    name, previous = row
+    storage = model._meta.get_field(field_name).storage
+
+    data = {}
+    if name:
+        config = options()
+        image_format = output_format()
+        try:
+            with storage.open(name) as source:
+                rendered = render(source, config['SIZES'], image_format, config['QUALITY'])
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            # Immagine non valida: la si segna come elaborata per non riprovare
+            logger.warning('Cannot create renditions for %s %s (%s)', model.__name__, pk, name)
+            rendered = {}
+        sizes = {}
+        for label, content in rendered.items():
+            path = rendition_path(name, label, image_format)
+            if storage.exists(path):
+                storage.delete(path)
+            sizes[label] = storage.save(path, ContentFile(content))
+        data = {'source': name, 'sizes': sizes}
+
+    updated = model.objects.filter(pk=pk, **{field_name: name or ''}).update(renditions=data)
+    if not updated:
+        # L'immagine è stata sostituita: le varianti appena create non servono
+        obsolete, data = data, None
+    else:
+        obsolete = previous or {}
+        if model is Product:
+            # update() non invia post_save: i prodotti in cache vanno invalidati a mano
+            catalog_cache.bump('product')
+
+    # Le immagini con lo stesso contenuto condividono file e varianti
+    if obsolete.get('source') and not model.objects.filter(**{field_name: obsolete['source']}).exists():
+        for path in obsolete.get('sizes', {}).values():
+            storage.delete(path)
+    return data
+
+
+def needs_renditions(instance):
+    """True se le varianti salvate non corrispondono all'immagine attuale"""
+    name = getattr(instance, IMAGE_FIELDS[type(instance)]).name or ''
+    return (instance.renditions or {}).get('source', '') != name
+
+
+def _run(model, pk):
+    try:
+        generate_renditions(model, pk)
+    except Exception:
+        logger.exception('Rendition generation failed for %s %s', model.__name__, pk)
+    finally:
+        # I thread del pool non passano dal ciclo richiesta/risposta che chiude le connessioni
+        connection.close()
+
+
+class RenditionWorkers:
+    """Pool di thread, creato alla prima richiesta, che genera le varianti fuori dalla richiesta"""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = Lock()
+
+    def submit(self, model, pk):
+        workers = options()['WORKERS']
+        if not workers:
+            generate_renditions(model, pk)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='renditions')
+        self._executor.submit(_run, model, pk)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+rendition_workers = RenditionWorkers()
+
+
+@receiver(setting_changed)
+def reset_rendition_workers(setting, **kwargs):
+    if setting == 'IMAGE_RENDITIONS':
+        rendition_workers.shutdown()
@@ -0,0 +1,112 @@
+from collections import Counter
+from functools import partial
+
+from django.db import IntegrityError, transaction
+
+from .badges import award_badges, record_events
+from .dedup import seen_images
+from .geo import geohash_for
+from .images import needs_renditions, rendition_workers
+from .models import ScanRecord, ProductScan, PointsTransaction, RecognizedObject
+from .points import award_transactions, SCAN_POINTS, PRODUCT_SCAN_POINTS
+from .stats import record_scans
+from .streaks import record_activity
+
+
+def new_items(model, user, items):
+    """Scarta gli elementi il cui client_id è già stato registrato per l'utente"""
+    client_ids = [item['client_id'] for item in items]
+    seen = set(model.objects.filter(user=user, client_id__in=client_ids).values_list('client_id', flat=True))
+    return [item for item in items if item['client_id'] not in seen]
+
+
+# Tentativi di inserimento quando un batch concorrente registra gli stessi client_id
+INSERT_ATTEMPTS = 3
+
+
+def insert_new_items(user, scans, product_scans):
+    """
+    Inserisce le scansioni non ancora registrate e aggiorna punti e contatori
+    solo per queste. Senza ignore_conflicts: se un batch concorrente ha appena
+    registrato gli stessi client_id l'inserimento fallisce con IntegrityError e
+    tutta la transazione viene annullata, così nulla è contato due volte.
+    """
+    with transaction.atomic():
+        scans = new_items(ScanRecord, user, scans)
+        product_scans = new_items(ProductScan, user, product_scans)
+
+        records = [
+            ScanRecord(
+                user=user,
+                client_id=item['client_id'],
+                recognized_object_id=item['recognized_object'],
+                image=item['image'],
+                latitude=item.get('latitude'),
+                longitude=item.get('longitude'),
+                location_name=item.get('location_name'),
+                # bulk_create non chiama save(), che calcola il geohash
+                geohash=geohash_for(item.get('latitude'), item.get('longitude')),
+            )
+            for item in scans
+        ]
+        for record in records:
+            # ...né prepare_image(), che riusa le immagini già salvate
+            record.prepare_image()
+        ScanRecord.objects.bulk_create(records)
+        ProductScan.objects.bulk_create(
+            [ProductScan(user=user, client_id=item['client_id'], product_id=item['product']) for item in product_scans]
+        )
+
+        # bulk_create non invia post_save: varianti e indice delle immagini vanno aggiornati qui
+        pending = {record.client_id for record in records if needs_renditions(record)}
+        for pk, client_id, phash in ScanRecord.objects.filter(
+            user=user, client_id__in=[record.client_id for record in records]
+        ).values_list('pk', 'client_id', 'image_phash'):
+            transaction.on_commit(partial(seen_images.scan_added, pk, phash))
+            if client_id in pending:
+                transaction.on_commit(partial(rendition_workers.submit, ScanRecord, pk))
+
+        record_scans(
+            user,
+            object_ids=[item['recognized_object'] for item in scans],
+            product_ids=[item['product'] for item in product_scans]
+        )
+        if scans or product_scans:
+            record_activity(user)
+
+        points = award_transactions(user, [
+            PointsTransaction(amount=SCAN_POINTS * len(scans), source='SCAN'),
+            PointsTransaction(amount=PRODUCT_SCAN_POINTS * len(product_scans), source='PRODUCT_SCAN'),
+        ])
+    return scans, product_scans, points
+
+
+def ingest_scans(user, scans, product_scans):
+    """
+    Registra in blocco le scansioni sincronizzate dal client. Le scansioni già
+    ricevute (stesso client_id) vengono ignorate, anche quando due invii dello
+    stesso batch si sovrappongono; i punti sono assegnati con un unico
+    aggiornamento e i badge verificati una sola volta per batch.
+    """
+    for attempt in range(INSERT_ATTEMPTS):
+        try:
+            scans, product_scans, points = insert_new_items(user, scans, product_scans)
+            break
+        except IntegrityError:
+            # Al nuovo tentativo new_items vede le righe del batch concorrente, ormai confermate
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+
+    award_badges(user, points)
+    categories = dict(RecognizedObject.objects.filter(
+        id__in={item['recognized_object'] for item in scans}
+    ).values_list('id', 'category'))
+    events = Counter(('SCAN', categories.get(item['recognized_object'], '')) for item in scans)
+    events[('PRODUCT_SCAN', '')] = len(product_scans)
+    record_events(user, events)
+
+    return {
+        'scans': [item['client_id'] for item in scans],
+        'product_scans': [item['client_id'] for item in product_scans],
+        'points': points,
+    }
@@ -0,0 +1,221 @@
+from bisect import bisect_left, insort
+from datetime import timedelta
+from threading import RLock
+
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import catalog_cache
+from .models import Profile, DailyPoints
+
+# Classifiche a finestra mobile: durata in giorni, oggi compreso
+WINDOWS = {
+    'week': 7,
+    'month': 30,
+}
+
+
+class Leaderboard:
+    """
+    Classifica in memoria come lista ordinata di (-punti, user_id): rank con una
+    ricerca binaria e top-N leggendo l'inizio della lista, con memoria
+    proporzionale al numero di utenti e non ai punteggi. A parità di punti gli
+    utenti condividono il rank e sono elencati per id crescente. I punteggi
+    negativi valgono come zero.
+    """
+
+    def __init__(self, entries=()):
+        self._lock = RLock()
+        self._points = dict(entries)
+        self._order = sorted(self._key(user_id, points) for user_id, points in self._points.items())
+
+    @staticmethod
+    def _key(user_id, points):
+        return -max(points, 0), user_id
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, user_id):
+        return user_id in self._points
+
+    def points(self, user_id):
+        return self._points.get(user_id)
+
+    def update(self, user_id, points):
+        with self._lock:
+            self._discard(user_id)
+            self._points[user_id] = points
+            insort(self._order, self._key(user_id, points))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._discard(user_id)
+            self._points.pop(user_id, None)
+
+    def _discard(self, user_id):
+        previous = self._points.get(user_id)
+        if previous is None:
+            return
+        key = self._key(user_id, previous)
+        index = bisect_left(self._order, key)
+        if index < len(self._order) and self._order[index] == key:
+            del self._order[index]
+
+    def rank(self, user_id):
+        """1 + numero di utenti con più punti; None se l'utente non è in classifica"""
+        with self._lock:
+            points = self._points.get(user_id)
+            if points is None:
+                return None
+            # (-punti,) precede ogni (-punti, user_id): restano davanti solo i punteggi più alti
+            return 1 + bisect_left(self._order, (-max(points, 0),))
+
+    def top(self, n):
+        """Le prime n posizioni come lista di (rank, user_id, points)"""
+        with self._lock:
+            result = []
+            previous = rank = None
+            for position, (score, user_id) in enumerate(self._order[:n], 1):
+                if score != previous:
+                    rank, previous = position, score
+                result.append((rank, user_id, self._points[user_id]))
+            return result
+
+
+class LeaderboardRegistry:
+    """
+    Classifica globale e classifiche dei gruppi del processo, caricate alla prima
+    richiesta e aggiornate dai percorsi che assegnano punti. Le modifiche fatte
+    da altri processi vengono recuperate ogni SYNC_INTERVAL rileggendo i profili
+    con updated_at recente. Una classifica di gruppo viene ricaricata quando
+    cambia la generazione dei membri del gruppo nella cache condivisa, che ogni
+    processo incrementa dopo il commit di un'iscrizione o di un'uscita.
+
+    Le classifiche settimanali e mensili sommano i contatori DailyPoints della
+    finestra e vengono ricostruite ogni WINDOW_INTERVAL o al cambio di giorno.
+    """
+    SYNC_INTERVAL = timedelta(seconds=30)
+    WINDOW_INTERVAL = timedelta(seconds=60)
+    # Margine per le transazioni ancora aperte durante la sincronizzazione precedente
+    SYNC_OVERLAP = timedelta(seconds=5)
+    MAX_GROUP_BOARDS = 256
+
+    def __init__(self):
+        self._lock = RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._global = None
+            self._groups = {}
+            self._windows = {}
+            self._synced_at = None
+
+    def global_board(self):
+        with self._lock:
+            now = timezone.now()
+            if self._global is None:
+                self._global = Leaderboard(Profile.objects.values_list('user_id', 'points').iterator())
+                self._synced_at = now
+            elif now - self._synced_at > self.SYNC_INTERVAL:
+                changed = Profile.objects.filter(
+                    updated_at__gte=self._synced_at - self.SYNC_OVERLAP
+                ).values_list('user_id', 'points')
+                for user_id, points in changed:
+                    self._apply(user_id, points)
+                self._synced_at = now
+            return self._global
+
+    def group_board(self, group_id):
+        self.global_board()
+        generation = catalog_cache.generation(f'group:{group_id}')
+        with self._lock:
+            cached = self._groups.pop(group_id, None)
+            if cached is None or cached[0] != generation:
+                board = Leaderboard(
+                    Profile.objects.filter(user__groupmembership__group_id=group_id).values_list('user_id', 'points')
+                )
+                cached = (generation, board)
+            # Le classifiche usate più di recente restano in fondo al dizionario
+            self._groups[group_id] = cached
+            while len(self._groups) > self.MAX_GROUP_BOARDS:
+                del self._groups[next(iter(self._groups))]
+            return cached[1]
+
+    def window_board(self, period):
+        today = timezone.localdate()
+        now = timezone.now()
+        with self._lock:
+            cached = self._windows.get(period)
+            if cached is None or cached[0] != today or now - cached[1] > self.WINDOW_INTERVAL:
+                start = today - timedelta(days=WINDOWS[period] - 1)
+                totals = DailyPoints.objects.filter(day__gte=start).values('user_id').annotate(
+                    total=Sum('points')
+                ).values_list('user_id', 'total')
+                cached = (today, now, Leaderboard(totals))
+                self._windows[period] = cached
+            return cached[2]
+
+    def _apply(self, user_id, points):
+        self._global.update(user_id, points)
+        for _, board in self._groups.values():
+            if user_id in board:
+                board.update(user_id, points)
+
+    def points_changed(self, user_id, points, delta=0):
+        with self._lock:
+            if self._global is not None:
+                self._apply(user_id, points)
+            today = timezone.localdate()
+            for day, _, board in self._windows.values():
+                if day == today:
+                    board.update(user_id, (board.points(user_id) or 0) + delta)
+
+    def user_removed(self, user_id):
+        with self._lock:
+            if self._global is not None:
+                self._global.remove(user_id)
+            for _, board in self._groups.values():
+                board.remove(user_id)
+            for _, _, board in self._windows.values():
+                board.remove(user_id)
+
+    def membership_changed(self, group_id):
+        """Da chiamare dopo il commit: tutti i processi ricaricheranno la classifica del gruppo"""
+        catalog_cache.bump(f'group:{group_id}')
+        with self._lock:
+            self._groups.pop(group_id, None)
+
+
+leaderboards = LeaderboardRegistry()
+
+
+def standings_data(board, user, top, usernames):
+    return {
+        'results': [
+            {'rank': rank, 'user_id': user_id, 'username': usernames.get(user_id), 'points': points}
+            for rank, user_id, points in top
+        ],
+        'me': {'rank': board.rank(user.id), 'points': board.points(user.id)},
+    }
+
+
+def standings(board, user, limit):
+    """Prime limit posizioni della classifica e posizione dell'utente"""
+    top = board.top(limit)
+    usernames = dict(User.objects.filter(id__in=[user_id for _, user_id, _ in top]).values_list('id', 'username'))
+    return standings_data(board, user, top, usernames)
+
+
+async def astandings(board, user, limit):
+    """Come standings(), con l'interfaccia asincrona dell'ORM"""
+    top = board.top(limit)
+    usernames = {
+        user_id: username
+        async for user_id, username in User.objects.filter(id__in=[user_id for _, user_id, _ in top]).values_list(
+            'id', 'username'
+        )
+    }
+    return standings_data(board, user, top, usernames)
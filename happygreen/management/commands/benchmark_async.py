@@ -0,0 +1,79 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Endpoint sincroni (DRF) e le loro versioni asincrone
+ENDPOINTS = {
+    'barcode': ('/api/products/by_barcode/?barcode={barcode}', '/api/async/products/by_barcode/?barcode={barcode}'),
+    'feed': ('/api/posts/feed/', '/api/async/posts/feed/'),
+    'leaderboard': ('/api/leaderboard/?period=week', '/api/async/leaderboard/?period=week'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Test di carico su un server in esecuzione: confronta gli endpoint sincroni con le loro versioni '
+        'asincrone (ricerca per barcode, feed, classifica) con più client concorrenti'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Indirizzo del server')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--barcode', default='8001097047991', help='Barcode cercato')
+        parser.add_argument('--requests', type=int, default=500, help='Richieste per ogni endpoint')
+        parser.add_argument('--concurrency', type=int, default=50, help='Client concorrenti')
+        parser.add_argument(
+            '--endpoint', choices=sorted(ENDPOINTS), action='append', help='Endpoint da misurare (tutti se omesso)'
+        )
+
+    def handle(self, *args, **options):
+        base = options['url']
+        token = self.obtain_token(base, options['username'], options['password'])
+        headers = {'Authorization': f'Bearer {token}'}
+
+        for name in options['endpoint'] or sorted(ENDPOINTS):
+            for label, path in zip(('sync', 'async'), ENDPOINTS[name]):
+                url = urljoin(base, path.format(barcode=options['barcode']))
+                self.measure(f'{name} {label}', url, headers, options['requests'], options['concurrency'])
+
+        self.stdout.write(self.style.SUCCESS('Test di carico completato'))
+
+    def obtain_token(self, base, username, password):
+        body = json.dumps({'username': username, 'password': password}).encode()
+        request = Request(urljoin(base, '/api/token/'), data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request) as response:
+                return json.load(response)['access']
+        except HTTPError as e:
+            raise CommandError(f'Autenticazione non riuscita: {e.code}')
+
+    def measure(self, label, url, headers, requests, concurrency):
+        def fetch(_):
+            start = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers)) as response:
+                    response.read()
+                    ok = response.status < 400
+            except HTTPError as e:
+                ok = e.code == 404  # un barcode sconosciuto è comunque una risposta valida
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'- {label}: {requests / elapsed:.0f} req/s, '
+            f'p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, {errors} errori'
+        )
@@ -0,0 +1,41 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from happygreen.leaderboard import Leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Misura le prestazioni della classifica in memoria su profili sintetici (nessun accesso al database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1_000_000, help='Numero di profili simulati')
+        parser.add_argument('--operations', type=int, default=100_000, help='Operazioni per ogni misura')
+        parser.add_argument('--max-points', type=int, default=5000, help='Punteggio massimo iniziale')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        profiles = options['profiles']
+        operations = options['operations']
+        max_points = options['max_points']
+
+        start = time.perf_counter()
+        board = Leaderboard((user_id, rng.randint(0, max_points)) for user_id in range(1, profiles + 1))
+        self.stdout.write(f'- Costruzione con {profiles} profili: {time.perf_counter() - start:.2f} s')
+
+        user_ids = [rng.randint(1, profiles) for _ in range(operations)]
+
+        def measure(label, operation):
+            start = time.perf_counter()
+            for user_id in user_ids:
+                operation(user_id)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'- {label}: {elapsed / operations * 1e6:.2f} µs/op')
+
+        measure('update (punti + 5)', lambda user_id: board.update(user_id, board.points(user_id) + 5))
+        measure('rank', board.rank)
+        measure('top 10', lambda user_id: board.top(10))
+        measure('top 100', lambda user_id: board.top(100))
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completato'))
@@ -0,0 +1,48 @@
+import time
+from io import BytesIO
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+from happygreen.features import FEATURE_SIZE, image_features, normalize
+from happygreen.recognition import FeatureIndex
+
+
+class Command(BaseCommand):
+    help = 'Misura la latenza del riconoscimento lato server su descrittori sintetici (nessun accesso al database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--objects', type=int, default=10_000, help='Numero di oggetti nel catalogo simulato')
+        parser.add_argument('--queries', type=int, default=1000, help='Ricerche per ogni misura')
+        parser.add_argument('--k', type=int, default=5, help='Risultati per ricerca')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        objects = options['objects']
+        queries = options['queries']
+
+        def measure(label, operation, repeat):
+            start = time.perf_counter()
+            for i in range(repeat):
+                operation(i)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'- {label}: {elapsed / repeat * 1e3:.3f} ms/op')
+
+        vectors = rng.random((objects, FEATURE_SIZE), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        start = time.perf_counter()
+        index = FeatureIndex(np.arange(1, objects + 1), vectors)
+        self.stdout.write(f'- Costruzione con {objects} oggetti: {(time.perf_counter() - start) * 1e3:.2f} ms')
+
+        probes = [normalize(rng.random(FEATURE_SIZE, dtype=np.float32)) for _ in range(queries)]
+        measure(f'top {options["k"]}', lambda i: index.nearest(probes[i], options['k']), queries)
+
+        # Estrazione del descrittore da foto di dimensioni tipiche di uno smartphone
+        for size in ((1024, 768), (4032, 3024)):
+            pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+            output = BytesIO()
+            Image.fromarray(pixels).save(output, 'JPEG', quality=85)
+            measure(f'descrittore JPEG {size[0]}x{size[1]}', lambda i: image_features(output), 20)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completato'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from happygreen.cache import catalog_cache
+from happygreen.features import image_features
+from happygreen.models import RecognizedObject
+
+
+class Command(BaseCommand):
+    help = 'Calcola i descrittori per il riconoscimento lato server degli oggetti che ne sono privi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Ricalcola anche i descrittori già presenti')
+
+    def handle(self, *args, **options):
+        objects = RecognizedObject.objects.exclude(image='').exclude(image=None)
+        if not options['force']:
+            objects = objects.filter(features=None)
+
+        computed = failed = 0
+        for obj in objects.iterator():
+            try:
+                with obj.image.open('rb') as file:
+                    features = image_features(file)
+            except OSError as e:
+                features = None
+                self.stderr.write(f'  {obj.name}: {e}')
+            if features is None:
+                failed += 1
+                continue
+            RecognizedObject.objects.filter(id=obj.id).update(features=features.tobytes())
+            computed += 1
+
+        # update() non invia post_save: l'indice in memoria va ricostruito a mano
+        catalog_cache.bump('object')
+        self.stdout.write(self.style.SUCCESS(f'Descrittori calcolati per {computed} oggetti ({failed} immagini non valide)'))
@@ -2,7 +2,7 @@ import random
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from happygreen.models import (
-    Badge, RecognizedObject, Product, Quiz, QuizQuestion, QuizOption, Challenge
+    Badge, BadgeCriterion, RecognizedObject, Product, Quiz, QuizQuestion, QuizOption, Challenge
 )
 from django.utils import timezone
 from datetime import timedelta
@@ -36,27 +36,32 @@ class Command(BaseCommand):
             {
                 'name': 'Eco-Detective',
                 'description': 'Hai identificato correttamente 10 oggetti riciclabili.',
-                'points_required': 50
+                'points_required': 50,
+                'criteria': [{'event': 'SCAN', 'threshold': 10}]
             },
             {
                 'name': 'Green Guardian',
                 'description': 'Hai completato 5 sfide ecologiche.',
-                'points_required': 100
+                'points_required': 100,
+                'criteria': [{'event': 'CHALLENGE', 'threshold': 5}]
             },
             {
                 'name': 'Recycle Master',
                 'description': 'Hai scansionato 20 oggetti e li hai classificati correttamente.',
-                'points_required': 200
+                'points_required': 200,
+                'criteria': [{'event': 'SCAN', 'threshold': 20}]
             },
             {
                 'name': 'Quiz Champion',
                 'description': 'Hai risposto correttamente a 50 domande sui quiz di sostenibilità.',
-                'points_required': 150
+                'points_required': 150,
+                'criteria': [{'event': 'QUIZ_ANSWER', 'threshold': 50}]
             },
             {
                 'name': 'Eco-Influencer',
                 'description': 'Hai condiviso 10 post con il tuo gruppo.',
-                'points_required': 75
+                'points_required': 75,
+                'criteria': [{'event': 'POST', 'threshold': 10}]
             },
             {
                 'name': 'Planet Protector',
@@ -65,7 +70,7 @@ class Command(BaseCommand):
             },
         ]
 
-        created_count = 0
+        created_count = updated_count = 0
         for badge_data in badges:
             badge, created = Badge.objects.get_or_create(
                 name=badge_data['name'],
@@ -78,8 +83,17 @@ class Command(BaseCommand):
             )
             if created:
                 created_count += 1
+            # Senza criteri il badge si ottiene raggiungendo points_required. Anche i badge
+            # creati prima dei criteri li ricevono, ma quelli già configurati non si toccano
+            criteria = badge_data.get('criteria', [])
+            if criteria and (created or not badge.criteria.exists()):
+                for criterion in criteria:
+                    BadgeCriterion.objects.create(badge=badge, **criterion)
+                if not created:
+                    updated_count += 1
 
         self.stdout.write(f'- Creati {created_count} nuovi badge')
+        self.stdout.write(f'- Aggiunti i criteri a {updated_count} badge esistenti')
 
     def create_recognized_objects(self):
         objects = [
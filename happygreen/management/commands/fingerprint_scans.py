@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from happygreen.fingerprints import sha256_of, perceptual_hash
+from happygreen.models import ScanRecord
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcola SHA-256 e hash percettivo delle immagini di scansione già caricate '
+        'e fa puntare i duplicati esatti a un unico file'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-files', action='store_true', help='Non elimina i file duplicati non più usati')
+
+    def handle(self, *args, **options):
+        storage = ScanRecord._meta.get_field('image').storage
+        # Primo file salvato per ogni contenuto, con le sue varianti
+        stored = {
+            sha256: (name, renditions)
+            for sha256, name, renditions in ScanRecord.objects.exclude(image_sha256=None).order_by('-id').values_list(
+                'image_sha256', 'image', 'renditions'
+            )
+        }
+        fingerprinted = merged = freed = 0
+
+        pending = ScanRecord.objects.filter(image_sha256=None).exclude(image='').values_list('id', 'image', 'renditions')
+        for scan_id, name, renditions in pending.iterator():
+            try:
+                with storage.open(name) as file:
+                    sha256, phash = sha256_of(file), perceptual_hash(file)
+            except OSError as e:
+                self.stderr.write(f'  Scansione {scan_id}: {e}')
+                continue
+
+            original, original_renditions = stored.setdefault(sha256, (name, renditions))
+            ScanRecord.objects.filter(id=scan_id).update(
+                image=original,
+                image_sha256=sha256,
+                image_phash=None if phash is None else f'{phash:016x}',
+                renditions=original_renditions,
+            )
+            fingerprinted += 1
+            if original != name:
+                merged += 1
+                if not options['keep_files'] and not ScanRecord.objects.filter(image=name).exists():
+                    for path in [name, *(renditions or {}).get('sizes', {}).values()]:
+                        storage.delete(path)
+                    freed += 1
+
+        self.stdout.write(f'- {fingerprinted} immagini elaborate, {merged} duplicati unificati, {freed} file eliminati')
+        self.stdout.write(self.style.SUCCESS('Impronte calcolate'))
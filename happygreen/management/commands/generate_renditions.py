@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from happygreen.images import IMAGE_FIELDS, generate_renditions
+
+
+def generate(model, pk):
+    try:
+        return generate_renditions(model, pk)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Genera le varianti ridimensionate delle immagini già caricate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rigenera anche le varianti già presenti')
+        parser.add_argument('--workers', type=int, default=4, help='Thread che elaborano le immagini in parallelo')
+        parser.add_argument(
+            '--model',
+            choices=[model.__name__.lower() for model in IMAGE_FIELDS],
+            help='Elabora solo le immagini di questo modello'
+        )
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            for model, field_name in IMAGE_FIELDS.items():
+                if options['model'] and model.__name__.lower() != options['model']:
+                    continue
+                pending = [
+                    pk for pk, name, renditions in model.objects.exclude(**{field_name: ''}).exclude(
+                        **{f'{field_name}__isnull': True}
+                    ).values_list('pk', field_name, 'renditions').iterator()
+                    if options['force'] or (renditions or {}).get('source') != name
+                ]
+                failed = 0
+                for future in [executor.submit(generate, model, pk) for pk in pending]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'  {model.__name__}: {e}')
+                self.stdout.write(f'- {model.__name__}: {len(pending) - failed} immagini elaborate, {failed} errori')
+
+        self.stdout.write(self.style.SUCCESS('Varianti generate'))
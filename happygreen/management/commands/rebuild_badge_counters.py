@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from happygreen.badges import evaluate, rebuild_counters, rules
+from happygreen.models import ActivityCounter
+
+
+class Command(BaseCommand):
+    help = 'Riallinea allo storico i contatori delle attività usati dai criteri dei badge'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--award',
+            action='store_true',
+            help='Assegna anche i badge con criteri già soddisfatti dallo storico'
+        )
+
+    def handle(self, *args, **options):
+        corrected = rebuild_counters()
+        self.stdout.write(f'- Corretti {corrected} contatori')
+
+        if options['award']:
+            _, criteria, _ = rules.rules()
+            awarded = 0
+            for user in User.objects.filter(activity_counters__day=ActivityCounter.TOTAL).distinct().iterator():
+                awarded += len(evaluate(user, list(criteria)))
+            self.stdout.write(f'- Assegnati {awarded} badge')
+
+        self.stdout.write(self.style.SUCCESS('Contatori dei badge riallineati'))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from happygreen.models import Profile, PointsTransaction
+from happygreen.points import reconcile_daily_points
+
+
+class Command(BaseCommand):
+    help = (
+        'Riallinea il ledger PointsTransaction a Profile.points registrando una transazione ADJUSTMENT per i saldi '
+        'diversi, e riallinea i contatori DailyPoints. I saldi dei profili non vengono modificati, salvo con --overwrite'
+    )
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostra solo quanti profili hanno un saldo diverso dal ledger, senza modificare nulla'
+        )
+        mode.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Sovrascrive Profile.points con la somma del ledger invece di registrare aggiustamenti. '
+                 'Con un ledger vuoto o incompleto azzera o riduce i saldi esistenti'
+        )
+
+    def handle(self, *args, **options):
+        ledger_total = Subquery(
+            PointsTransaction.objects.filter(user=OuterRef('user'))
+            .order_by()
+            .values('user')
+            .annotate(total=Sum('amount'))
+            .values('total'),
+            output_field=IntegerField()
+        )
+        mismatched = [
+            (user_id, points - total)
+            for user_id, points, total in Profile.objects.annotate(
+                ledger_total=Coalesce(ledger_total, Value(0))
+            ).values_list('user_id', 'points', 'ledger_total').iterator()
+            if points != total
+        ]
+
+        if options['dry_run']:
+            self.stdout.write(f'- {len(mismatched)} profili hanno un saldo diverso dal ledger')
+            self.stdout.write(self.style.SUCCESS('Nessuna modifica effettuata (--dry-run)'))
+            return
+
+        with transaction.atomic():
+            if options['overwrite']:
+                # updated_at segnala ai processi del server di riallineare le classifiche in memoria
+                updated = Profile.objects.update(points=Coalesce(ledger_total, Value(0)), updated_at=timezone.now())
+            else:
+                PointsTransaction.objects.bulk_create(
+                    [PointsTransaction(user_id=user_id, amount=amount, source='ADJUSTMENT') for user_id, amount in mismatched],
+                    batch_size=1000
+                )
+                self.stdout.write(f'- Registrate {len(mismatched)} transazioni di aggiustamento')
+
+        corrected = reconcile_daily_points()
+        self.stdout.write(f'- Corretti {corrected} contatori giornalieri')
+
+        if options['overwrite']:
+            self.stdout.write(self.style.SUCCESS(f'Punti sovrascritti dal ledger per {updated} profili'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Ledger riallineato per {len(mismatched)} profili'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from happygreen.search import SEARCH_FIELDS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice di ricerca di prodotti, oggetti, post e gruppi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=[kind for kind, _ in SEARCH_FIELDS.values()],
+            help='Ricostruisce solo l\'indice di questo modello'
+        )
+
+    def handle(self, *args, **options):
+        for model, (kind, _) in SEARCH_FIELDS.items():
+            if options['model'] and kind != options['model']:
+                continue
+            count = rebuild_index(model)
+            self.stdout.write(f'- {model.__name__}: {count} oggetti indicizzati')
+
+        self.stdout.write(self.style.SUCCESS('Indice di ricerca ricostruito'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from happygreen.streaks import rebuild_streaks
+
+
+class Command(BaseCommand):
+    help = 'Ricalcola le serie di giorni attivi dei profili da scansioni, quiz e sfide completate'
+
+    def handle(self, *args, **options):
+        # Scrive a blocchi, senza tenere aperta una transazione per tutti i profili
+        updated = rebuild_streaks()
+        self.stdout.write(self.style.SUCCESS(f'Serie ricalcolate: corretti {updated} profili'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from happygreen.feed import FANOUT_LIMIT
+from happygreen.models import Group, GroupMembership, Post, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Ricostruisce le timeline del feed a partire da gruppi, membri e post'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            sizes = dict(Group.objects.annotate(size=Count('members')).values_list('id', 'size'))
+            large = [group_id for group_id, size in sizes.items() if size > FANOUT_LIMIT]
+            Group.objects.update(fanout_on_read=False)
+            Group.objects.filter(id__in=large).update(fanout_on_read=True)
+
+            TimelineEntry.objects.all().delete()
+            created = 0
+            for group_id in sizes:
+                if group_id in large:
+                    continue
+                member_ids = list(GroupMembership.objects.filter(group_id=group_id).values_list('user_id', flat=True))
+                batch = []
+                for post_id, created_at in Post.objects.filter(group_id=group_id).values_list('id', 'created_at').iterator():
+                    batch.extend(
+                        TimelineEntry(user_id=user_id, post_id=post_id, group_id=group_id, created_at=created_at)
+                        for user_id in member_ids
+                    )
+                    if len(batch) >= 1000:
+                        TimelineEntry.objects.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+                TimelineEntry.objects.bulk_create(batch)
+                created += len(batch)
+
+        self.stdout.write(f'- {len(large)} gruppi letti dal feed senza timeline (oltre {FANOUT_LIMIT} membri)')
+        self.stdout.write(self.style.SUCCESS(f'Timeline ricostruite: {created} voci'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from happygreen.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Ricalcola le statistiche delle scansioni dalle tabelle delle scansioni e corregge i contatori'
+
+    def handle(self, *args, **options):
+        differences, user_differences = reconcile()
+        self.stdout.write(f'- {differences} contatori globali corretti')
+        self.stdout.write(f'- {user_differences} contatori per utente corretti')
+        self.stdout.write(self.style.SUCCESS('Statistiche delle scansioni riconciliate'))
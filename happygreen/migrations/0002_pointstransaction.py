@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('happygreen', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('source', models.CharField(choices=[('SCAN', 'Object scan'), ('PRODUCT_SCAN', 'Product scan'), ('QUIZ', 'Quiz'), ('CHALLENGE', 'Challenge'), ('BADGE', 'Badge'), ('ADJUSTMENT', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
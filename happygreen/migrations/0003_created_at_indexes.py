@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0002_pointstransaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at', 'id'], name='happygreen__created_fc5aaf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='happygreen__post_id_ab44df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at', 'id'], name='happygreen__created_92984b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='happygreen__group_i_2be6f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='happygreen__author__436d62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productscan',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='happygreen__user_id_36ec1b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrecord',
+            index=models.Index(fields=['created_at', 'id'], name='happygreen__created_09f36f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrecord',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='happygreen__user_id_ac8a56_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0003_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productscan',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanrecord',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='productscan',
+            constraint=models.UniqueConstraint(fields=('user', 'client_id'), name='unique_productscan_client_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='scanrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'client_id'), name='unique_scanrecord_client_id'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0004_scan_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['updated_at'], name='happygreen__updated_811923_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('happygreen', '0005_profile_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPoints',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_points', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailypoints',
+            index=models.Index(fields=['day', 'user'], name='happygreen__day_c4811e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailypoints',
+            unique_together={('user', 'day')},
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:26
+
+from django.db import migrations, models
+
+# Copia congelata di happygreen.geo.geohash_for al momento della migrazione
+GEOHASH_PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_for(latitude, longitude):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < GEOHASH_PRECISION:
+        interval, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    for model_name in ('Post', 'ScanRecord'):
+        model = apps.get_model('happygreen', model_name)
+        rows = model.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        batch = []
+        for obj in rows.only('id', 'latitude', 'longitude').iterator():
+            obj.geohash = geohash_for(obj.latitude, obj.longitude)
+            batch.append(obj)
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, ['geohash'])
+                batch = []
+        model.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0006_dailypoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanrecord',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
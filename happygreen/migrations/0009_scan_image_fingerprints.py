@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:33
+
+from django.db import migrations, models
+import happygreen.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0008_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrecord',
+            name='image_phash',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanrecord',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='scanrecord',
+            name='image',
+            field=models.ImageField(upload_to=happygreen.models.scan_image_path),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0009_scan_image_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recognizedobject',
+            name='features',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:37
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+
+# Copia congelata del tokenizer di happygreen.search al momento della migrazione:
+# le modifiche successive all'indice non devono cambiare il risultato di questa migrazione
+
+SEARCH_FIELDS = {
+    'Product': ('product', {'name': 3.0, 'barcode': 5.0, 'manufacturer': 2.0, 'description': 1.0}),
+    'RecognizedObject': ('object', {'name': 3.0, 'category': 2.0, 'description': 1.0}),
+    'Post': ('post', {'title': 3.0, 'content': 1.0}),
+    'Group': ('group', {'name': 3.0, 'description': 1.0}),
+}
+TERM_MAX_LENGTH = 64
+
+STOPWORDS = frozenset("""
+a ad al alla alle allo agli ai anche che chi ci come con da dal dalla dalle dallo dagli dai de del della
+delle dello degli dei di e ed gli i il in io la le lo loro ma mi ne nei nel nella nelle nello negli non
+o per piu quale quali quello questa questo se si sono su sul sulla sulle sullo sugli sui tra fra
+tu un una uno vi the and of
+l dell dall nell sull all quell c d s
+""".split())
+SUFFIXES = (
+    'amente', 'imente', 'mente', 'azione', 'azioni', 'atore', 'atori', 'atrice', 'atrici',
+    'abile', 'abili', 'ibile', 'ibili', 'issimo', 'issima', 'issimi', 'issime',
+)
+GUTTURAL_ENDINGS = ('che', 'chi', 'ghe', 'ghi')
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold(text):
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(word):
+    if word.isdigit() or len(word) <= 3:
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    if word.endswith(GUTTURAL_ENDINGS):
+        return word[:-2]
+    if word[-1] in 'aeiou':
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_RE.findall(fold(text or '')) if token not in STOPWORDS]
+
+
+def document_terms(instance, fields):
+    weights = Counter()
+    for field, field_weight in fields.items():
+        for term, count in Counter(tokenize(getattr(instance, field))).items():
+            weights[term[:TERM_MAX_LENGTH]] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def backfill_search_index(apps, schema_editor):
+    SearchToken = apps.get_model('happygreen', 'SearchToken')
+    for model_name, (kind, fields) in SEARCH_FIELDS.items():
+        rows = apps.get_model('happygreen', model_name).objects.only('id', *fields)
+        batch = []
+        for obj in rows.iterator():
+            batch.extend(
+                SearchToken(kind=kind, object_id=obj.id, term=term, weight=weight)
+                for term, weight in document_terms(obj, fields).items()
+            )
+            if len(batch) >= 1000:
+                SearchToken.objects.bulk_create(batch)
+                batch = []
+        SearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0010_object_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['kind', 'term', 'object_id'], name='happygreen__kind_59460b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['kind', 'object_id'], name='happygreen__kind_449e5c_idx'),
+        ),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
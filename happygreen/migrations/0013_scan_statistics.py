@@ -0,0 +1,51 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('happygreen', '0012_timelines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('OBJECT', 'Recognized object'), ('CATEGORY', 'Object category'), ('PRODUCT', 'Product')], max_length=10)),
+                ('key', models.CharField(max_length=100)),
+                ('month', models.DateField()),
+                ('scans', models.IntegerField(default=0)),
+                ('score_total', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserScanStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('OBJECT', 'Recognized object'), ('CATEGORY', 'Object category'), ('PRODUCT', 'Product')], max_length=10)),
+                ('key', models.CharField(max_length=100)),
+                ('month', models.DateField()),
+                ('scans', models.IntegerField(default=0)),
+                ('score_total', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_statistics', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scanstatistic',
+            index=models.Index(fields=['scope', 'month', 'scans'], name='happygreen__scope_f3ad30_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scanstatistic',
+            unique_together={('scope', 'key', 'month')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='userscanstatistic',
+            unique_together={('user', 'scope', 'key', 'month')},
+        ),
+    ]
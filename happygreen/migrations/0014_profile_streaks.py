@@ -0,0 +1,28 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happygreen', '0013_scan_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='best_streak',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='current_streak',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='last_active_day',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.1.13 on 2026-10-18 06:51
+
+import datetime
+from collections import Counter
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+# Copia di ActivityCounter.TOTAL al momento della migrazione
+TOTAL = datetime.date(1, 1, 1)
+
+
+def backfill_totals(apps, schema_editor):
+    # Copia congelata dei conteggi di badges.history_events: appena creata la
+    # tabella non esistono criteri, quindi servono solo i totali da sempre
+    ActivityCounter = apps.get_model('happygreen', 'ActivityCounter')
+    ScanRecord = apps.get_model('happygreen', 'ScanRecord')
+    ProductScan = apps.get_model('happygreen', 'ProductScan')
+    Post = apps.get_model('happygreen', 'Post')
+    QuizAttempt = apps.get_model('happygreen', 'QuizAttempt')
+    ChallengeParticipation = apps.get_model('happygreen', 'ChallengeParticipation')
+
+    totals = Counter()
+    for row in ScanRecord.objects.values('user', 'recognized_object__category').annotate(amount=Count('id')).order_by():
+        totals[(row['user'], 'SCAN', '')] += row['amount']
+        if row['recognized_object__category']:
+            totals[(row['user'], 'SCAN', row['recognized_object__category'])] += row['amount']
+    for row in ProductScan.objects.values('user').annotate(amount=Count('id')).order_by():
+        totals[(row['user'], 'PRODUCT_SCAN', '')] += row['amount']
+    for row in Post.objects.values('author').annotate(amount=Count('id')).order_by():
+        totals[(row['author'], 'POST', '')] += row['amount']
+    for row in QuizAttempt.objects.filter(completed=True).exclude(completed_at=None).values('user').annotate(
+        amount=Count('id'), answers=Sum('score')
+    ).order_by():
+        totals[(row['user'], 'QUIZ', '')] += row['amount']
+        totals[(row['user'], 'QUIZ_ANSWER', '')] += row['answers'] or 0
+    for row in ChallengeParticipation.objects.filter(completed=True).exclude(completed_at=None).values('user').annotate(
+        amount=Count('id')
+    ).order_by():
+        totals[(row['user'], 'CHALLENGE', '')] += row['amount']
+
+    ActivityCounter.objects.bulk_create([
+        ActivityCounter(user_id=user_id, event=event, category=category, day=TOTAL, count=count)
+        for (user_id, event, category), count in totals.items() if count
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('happygreen', '0014_profile_streaks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BadgeCriterion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('SCAN', 'Object scan'), ('PRODUCT_SCAN', 'Product scan'), ('QUIZ', 'Completed quiz'), ('QUIZ_ANSWER', 'Correct quiz answer'), ('CHALLENGE', 'Completed challenge'), ('POST', 'Post')], max_length=20)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('threshold', models.PositiveIntegerField()),
+                ('window_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('badge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='criteria', to='happygreen.badge')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('SCAN', 'Object scan'), ('PRODUCT_SCAN', 'Product scan'), ('QUIZ', 'Completed quiz'), ('QUIZ_ANSWER', 'Correct quiz answer'), ('CHALLENGE', 'Completed challenge'), ('POST', 'Post')], max_length=20)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('day', models.DateField(default=datetime.date(1, 1, 1))),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='activitycounter',
+            constraint=models.UniqueConstraint(fields=('user', 'event', 'category', 'day'), name='unique_daily_activity'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,13 @@
+import os
+from datetime import date
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .features import image_features
+from .fingerprints import sha256_of, perceptual_hash
+from .geo import geohash_for
 
 
 class Profile(models.Model):
@@ -9,14 +15,78 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # varianti ridimensionate dell'immagine
     points = models.IntegerField(default=0)
+    # Serie di giorni consecutivi con scansioni, quiz o sfide completate
+    last_active_day = models.DateField(null=True, blank=True, editable=False)
+    current_streak = models.IntegerField(default=0, editable=False)  # serie che termina in last_active_day
+    best_streak = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Usato dalle classifiche in memoria per recuperare i punteggi modificati
+            models.Index(fields=['updated_at']),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s profile"
 
 
+class PointsTransaction(models.Model):
+    """Registro append-only dei punti assegnati agli utenti"""
+    SOURCE_CHOICES = [
+        ('SCAN', 'Object scan'),
+        ('PRODUCT_SCAN', 'Product scan'),
+        ('QUIZ', 'Quiz'),
+        ('CHALLENGE', 'Challenge'),
+        ('BADGE', 'Badge'),
+        ('ADJUSTMENT', 'Adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='points_transactions')
+    amount = models.IntegerField()
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} {self.amount:+d} ({self.source})"
+
+
+class DailyPoints(models.Model):
+    """Punti guadagnati da un utente in un giorno, per le classifiche settimanali e mensili"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_points')
+    day = models.DateField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day')
+        indexes = [
+            models.Index(fields=['day', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.day}: {self.points}"
+
+
+class SearchToken(models.Model):
+    """Voce dell'indice invertito della ricerca: un termine di un oggetto indicizzato"""
+    kind = models.CharField(max_length=20)  # product, object, post, group
+    object_id = models.BigIntegerField()
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'term', 'object_id']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.term}"
+
+
 class Badge(models.Model):
     """Badge ottenibili dagli utenti"""
     name = models.CharField(max_length=100)
@@ -42,12 +112,65 @@ class UserBadge(models.Model):
         return f"{self.user.username} - {self.badge.name}"
 
 
+class BadgeCriterion(models.Model):
+    """
+    Condizione per ottenere un badge: almeno threshold eventi del tipo indicato,
+    eventualmente di una sola categoria e negli ultimi window_days giorni.
+    Un badge con criteri si ottiene quando sono soddisfatti tutti (points_required
+    vale solo per i badge senza criteri).
+    """
+    EVENT_CHOICES = [
+        ('SCAN', 'Object scan'),
+        ('PRODUCT_SCAN', 'Product scan'),
+        ('QUIZ', 'Completed quiz'),
+        ('QUIZ_ANSWER', 'Correct quiz answer'),
+        ('CHALLENGE', 'Completed challenge'),
+        ('POST', 'Post'),
+    ]
+
+    badge = models.ForeignKey(Badge, on_delete=models.CASCADE, related_name='criteria')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    category = models.CharField(max_length=100, blank=True)  # categoria dell'oggetto, vuota = tutte
+    threshold = models.PositiveIntegerField()
+    window_days = models.PositiveIntegerField(null=True, blank=True)  # vuoto = da sempre
+
+    def __str__(self):
+        return f"{self.badge.name}: {self.threshold} {self.event} {self.category}".rstrip()
+
+
+class ActivityCounter(models.Model):
+    """
+    Contatore degli eventi di un utente per tipo e categoria ('' = tutte): il
+    totale da sempre (day = TOTAL) e, per i criteri con finestra temporale, i giorni.
+    """
+    # Giorno fittizio dei totali: con una data non nulla anche i totali sono
+    # coperti dal vincolo unico (i NULL non collidono mai tra loro)
+    TOTAL = date(1, 1, 1)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_counters')
+    event = models.CharField(max_length=20, choices=BadgeCriterion.EVENT_CHOICES)
+    category = models.CharField(max_length=100, blank=True)
+    day = models.DateField(default=TOTAL)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'event', 'category', 'day'], name='unique_daily_activity'),
+        ]
+
+    def __str__(self):
+        day = 'total' if self.day == self.TOTAL else self.day
+        return f"{self.user.username} {self.event} {self.category} {day}: {self.count}"
+
+
 class Group(models.Model):
     """Gruppi di amici"""
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups')
     members = models.ManyToManyField(User, related_name='happygreen_groups', through='GroupMembership')
+    # Gruppi molto grandi: i loro post non vengono copiati nelle timeline ma letti nel feed
+    fanout_on_read = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -81,15 +204,46 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='posts')
     image = models.ImageField(upload_to='posts/', null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # varianti ridimensionate dell'immagine
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     location_name = models.CharField(max_length=100, blank=True, null=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['group', 'created_at', 'id']),
+            models.Index(fields=['author', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_for(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
+
+class TimelineEntry(models.Model):
+    """Post di un gruppo copiato nella timeline di un membro alla pubblicazione (fan-out in scrittura)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # data del post, per ordinare la timeline
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            # Una pagina del feed è una range scan su questo indice
+            models.Index(fields=['user', 'created_at', 'post']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.post.title}"
+
 
 class Comment(models.Model):
     """Commenti sui post"""
@@ -99,6 +253,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['post', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
 
@@ -114,25 +274,78 @@ class RecognizedObject(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(10)]
     )
     image = models.ImageField(upload_to='objects/', null=True, blank=True)
+    features = models.BinaryField(null=True, editable=False)  # descrittore float32 dell'immagine per il riconoscimento
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.features = None
+        elif not self.image._committed:
+            features = image_features(self.image.file)
+            self.features = None if features is None else features.tobytes()
+        super().save(*args, **kwargs)
+
+
+def scan_image_path(instance, filename):
+    """Percorso indirizzato dal contenuto: scans/<sha256[:2]>/<sha256>.<estensione>"""
+    if not instance.image_sha256:
+        return f'scans/{filename}'
+    extension = os.path.splitext(filename)[1].lower()
+    return f'scans/{instance.image_sha256[:2]}/{instance.image_sha256}{extension}'
+
 
 class ScanRecord(models.Model):
     """Registrazione di oggetti scansionati dagli utenti"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scans')
     recognized_object = models.ForeignKey(RecognizedObject, on_delete=models.CASCADE, related_name='scans')
-    image = models.ImageField(upload_to='scans/')
+    image = models.ImageField(upload_to=scan_image_path)
+    image_sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True, editable=False)
+    image_phash = models.CharField(max_length=16, null=True, blank=True, editable=False)  # dHash esadecimale
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # varianti ridimensionate dell'immagine
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     location_name = models.CharField(max_length=100, blank=True, null=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
+    client_id = models.CharField(max_length=64, null=True, blank=True)  # chiave di idempotenza del client
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='unique_scanrecord_client_id'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} scanned {self.recognized_object.name}"
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_for(self.latitude, self.longitude)
+        self.prepare_image()
+        super().save(*args, **kwargs)
+
+    def prepare_image(self):
+        """
+        Calcola le impronte dell'immagine appena caricata. Se lo stesso contenuto
+        è già salvato riusa file e varianti invece di scriverne un'altra copia.
+        """
+        if not self.image or self.image._committed:
+            return
+        self.image_sha256 = sha256_of(self.image.file)
+        phash = perceptual_hash(self.image.file)
+        self.image_phash = None if phash is None else f'{phash:016x}'
+
+        name = scan_image_path(self, os.path.basename(self.image.name))
+        if self.image.storage.exists(name):
+            self.image.name = name
+            self.image._committed = True
+            self.renditions = ScanRecord.objects.filter(image=name).values_list('renditions', flat=True).first() or {}
+
 
 class Quiz(models.Model):
     """Quiz sulla sostenibilità"""
@@ -220,6 +433,7 @@ class Product(models.Model):
     eco_info = models.TextField()  # informazioni sull'impatto ecologico
     alternatives = models.TextField(blank=True)  # alternative eco-friendly
     image = models.ImageField(upload_to='products/', null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)  # varianti ridimensionate dell'immagine
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -231,7 +445,56 @@ class ProductScan(models.Model):
     """Registrazione di prodotti scansionati dagli utenti"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_scans')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='scans')
+    client_id = models.CharField(max_length=64, null=True, blank=True)  # chiave di idempotenza del client
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='unique_productscan_client_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} scanned {self.product.name}"
+
+
+class ScanStatistic(models.Model):
+    """Contatore mensile delle scansioni di un oggetto, di una categoria o di un prodotto"""
+    SCOPE_CHOICES = [
+        ('OBJECT', 'Recognized object'),
+        ('CATEGORY', 'Object category'),
+        ('PRODUCT', 'Product'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=100)  # id dell'oggetto o del prodotto, nome della categoria
+    month = models.DateField()  # primo giorno del mese
+    scans = models.IntegerField(default=0)
+    score_total = models.IntegerField(default=0)  # somma dei sustainability_score scansionati
+
+    class Meta:
+        unique_together = ('scope', 'key', 'month')
+        indexes = [
+            models.Index(fields=['scope', 'month', 'scans']),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} {self.month:%Y-%m}: {self.scans}"
+
+
+class UserScanStatistic(models.Model):
+    """Contatore mensile delle scansioni di un utente per categoria di oggetto o prodotto"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scan_statistics')
+    scope = models.CharField(max_length=10, choices=ScanStatistic.SCOPE_CHOICES)
+    key = models.CharField(max_length=100)
+    month = models.DateField()
+    scans = models.IntegerField(default=0)
+    score_total = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'scope', 'key', 'month')
+
     def __str__(self):
-        return f"{self.user.username} scanned {self.product.name}"
\ No newline at end of file
+        return f"{self.user.username} {self.scope} {self.key} {self.month:%Y-%m}: {self.scans}"
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+# Dimensione massima di una pagina, qualunque sia il page_size richiesto dal client
+MAX_PAGE_SIZE = 100
+
+
+class BoundedPageNumberPagination(PageNumberPagination):
+    """Paginazione per numero di pagina con page_size scelto dal client ma limitato dal server"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Paginazione keyset su (created_at, id) per gli elenchi ordinati nel tempo,
+    con la stessa condizione del cursore di feed.py: ogni pagina è una range
+    scan sull'indice, senza OFFSET né COUNT(*). Il cursore di DRF conterrebbe
+    solo created_at e gestirebbe i pareggi con un offset, che tornando indietro
+    salta delle righe; qui la posizione è unica e l'offset resta sempre 0.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+
+        if position is not None:
+            created_at, pk = position
+            if reverse:
+                queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            else:
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        # Il cursore all'indietro legge verso i più recenti, poi la pagina viene rigirata
+        queryset = queryset.order_by('created_at', 'id') if reverse else queryset.order_by(*self.ordering)
+
+        # Una riga in più per sapere se esiste una pagina successiva
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = self._get_position_from_instance(results[-1], self.ordering) if len(results) > self.page_size else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            created_at, pk = cursor.position.split('|')
+            position = (datetime.fromisoformat(created_at), int(pk))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        if cursor.position is not None:
+            created_at, pk = cursor.position
+            cursor = cursor._replace(position=f'{created_at.isoformat()}|{pk}')
+        return super().encode_cursor(cursor)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return instance.created_at, instance.pk
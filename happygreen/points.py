@@ -0,0 +1,85 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .dashboard import activity
+from .leaderboard import leaderboards
+from .models import Profile, PointsTransaction, DailyPoints
+
+# Punti assegnati per ogni scansione di un oggetto e di un prodotto
+SCAN_POINTS = 5
+PRODUCT_SCAN_POINTS = 2
+
+
+def add_daily_points(user_id, delta, day=None):
+    """Somma delta al contatore giornaliero dell'utente, creandolo se manca"""
+    day = day or timezone.localdate()
+    if DailyPoints.objects.filter(user_id=user_id, day=day).update(points=F('points') + delta):
+        return
+    try:
+        with transaction.atomic():
+            DailyPoints.objects.create(user_id=user_id, day=day, points=delta)
+    except IntegrityError:
+        # Creato nel frattempo da una richiesta concorrente
+        DailyPoints.objects.filter(user_id=user_id, day=day).update(points=F('points') + delta)
+
+
+def reconcile_daily_points():
+    """
+    Porta i contatori giornalieri ai punti del ledger, esclusi gli aggiustamenti
+    che non sono punti guadagnati in quel giorno. Come stats.reconcile applica
+    solo le differenze con add_daily_points, così i punti assegnati durante il
+    ricalcolo non vanno persi. Restituisce il numero di contatori corretti.
+    """
+    with transaction.atomic():
+        expected = {
+            (row['user_id'], row['day']): row['total']
+            for row in PointsTransaction.objects.exclude(source='ADJUSTMENT').annotate(
+                day=TruncDate('created_at')
+            ).values('user_id', 'day').annotate(total=Sum('amount')).order_by().iterator()
+        }
+        stored = {
+            (user_id, day): points
+            for user_id, day, points in DailyPoints.objects.values_list('user', 'day', 'points').iterator()
+        }
+
+    corrected = 0
+    for user_id, day in expected.keys() | stored.keys():
+        delta = expected.get((user_id, day), 0) - stored.get((user_id, day), 0)
+        if delta:
+            add_daily_points(user_id, delta, day)
+            corrected += 1
+    # I contatori scesi a zero equivalgono a quelli assenti
+    DailyPoints.objects.filter(points=0).delete()
+    return corrected
+
+
+def award_transactions(user, transactions):
+    """
+    Registra le transazioni nel ledger e aggiorna Profile.points con un unico
+    UPDATE atomico (points = points + delta), insieme al contatore giornaliero.
+    Restituisce il nuovo totale.
+    """
+    transactions = [t for t in transactions if t.amount]
+    delta = sum(t.amount for t in transactions)
+    with transaction.atomic():
+        if transactions:
+            for t in transactions:
+                t.user = user
+            PointsTransaction.objects.bulk_create(transactions)
+            Profile.objects.filter(user=user).update(
+                points=F('points') + delta,
+                updated_at=timezone.now()
+            )
+            add_daily_points(user.id, delta)
+        points = Profile.objects.filter(user=user).values_list('points', flat=True).first() or 0
+        if transactions:
+            transaction.on_commit(lambda: leaderboards.points_changed(user.id, points, delta))
+            transaction.on_commit(lambda: activity(user.id))
+    return points
+
+
+def award_points(user, amount, source):
+    """Assegna punti all'utente e restituisce il nuovo totale"""
+    return award_transactions(user, [PointsTransaction(amount=amount, source=source)])
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+from .cache import catalog_cache
+from .models import Quiz
+from .serializers import QuizDetailSerializer
+
+
+class CompiledQuiz(namedtuple('CompiledQuiz', ['quiz_id', 'points', 'questions', 'correct_answers', 'data'])):
+    """
+    Rappresentazione immutabile di un quiz, condivisa tra retrieve e submit:
+    - questions: tupla di (id domanda, tupla degli id delle opzioni)
+    - correct_answers: frozenset delle coppie (id domanda, id opzione) corrette
+    - data: il quiz serializzato con QuizDetailSerializer
+    """
+    __slots__ = ()
+
+    @property
+    def questions_count(self):
+        return len(self.questions)
+
+    def grade(self, answers):
+        """
+        Restituisce il numero di risposte corrette. Per ogni domanda conta solo
+        la prima risposta inviata; le risposte non valide vengono ignorate.
+        """
+        chosen = {}
+        for answer in answers:
+            try:
+                question_id = int(answer.get('question_id'))
+                option_id = int(answer.get('option_id'))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            chosen.setdefault(question_id, option_id)
+        return sum(1 for pair in chosen.items() if pair in self.correct_answers)
+
+
+def valid_answers(answers):
+    """True se answers è una lista di {"question_id": int, "option_id": int}"""
+    def is_id(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    return isinstance(answers, list) and all(
+        isinstance(answer, dict) and is_id(answer.get('question_id')) and is_id(answer.get('option_id'))
+        for answer in answers
+    )
+
+
+def compile_quiz(quiz_id):
+    """Carica il quiz con domande e opzioni (tre query) e lo compila; None se non esiste"""
+    quiz = Quiz.objects.prefetch_related('questions__options').filter(id=quiz_id).first()
+    if quiz is None:
+        return None
+
+    questions = []
+    correct_answers = set()
+    for question in quiz.questions.all():
+        options = question.options.all()
+        questions.append((question.id, tuple(option.id for option in options)))
+        correct_answers.update((question.id, option.id) for option in options if option.is_correct)
+
+    return CompiledQuiz(
+        quiz_id=quiz.id,
+        points=quiz.points,
+        questions=tuple(questions),
+        correct_answers=frozenset(correct_answers),
+        data=dict(QuizDetailSerializer(quiz).data)
+    )
+
+
+def get_compiled_quiz(quiz_id):
+    """
+    Restituisce il quiz compilato dalla cache di catalogo; la cache viene invalidata
+    dai segnali su Quiz, QuizQuestion e QuizOption.
+    """
+    try:
+        quiz_id = int(quiz_id)
+    except (TypeError, ValueError):
+        return None
+    return catalog_cache.get_or_set('quiz', f'compiled:{quiz_id}', lambda: compile_quiz(quiz_id))
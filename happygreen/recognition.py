@@ -0,0 +1,68 @@
+from threading import Lock
+
+import numpy as np
+
+from .cache import catalog_cache
+from .features import FEATURE_SIZE, normalize
+from .models import RecognizedObject
+
+# Numero massimo di oggetti restituiti da una ricerca
+MAX_MATCHES = 20
+
+
+class FeatureIndex:
+    """Matrice dei descrittori normalizzati: ricerca dei k più simili (coseno) con un prodotto matrice-vettore"""
+
+    def __init__(self, ids, vectors):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = np.asarray(vectors, dtype=np.float32).reshape(len(self.ids), FEATURE_SIZE)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, vector, k):
+        """Lista di (id, similarità) dei k descrittori più simili, dal più simile"""
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return []
+        scores = self.matrix @ normalize(np.asarray(vector, dtype=np.float32))
+        # argpartition seleziona i k migliori in tempo lineare, poi si ordinano solo quelli
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in best]
+
+
+class ObjectMatcher:
+    """
+    Indice dei descrittori degli oggetti riconoscibili, tenuto in memoria per il
+    processo. Viene ricostruito quando cambia la generazione 'object' della
+    cache di catalogo, cioè a ogni modifica di un RecognizedObject.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._generation = None
+        self._index = FeatureIndex([], [])
+
+    def _load(self):
+        ids, vectors = [], []
+        for object_id, features in RecognizedObject.objects.exclude(features=None).values_list('id', 'features'):
+            vector = np.frombuffer(features, dtype=np.float32)
+            if vector.size == FEATURE_SIZE:
+                ids.append(object_id)
+                vectors.append(vector)
+        self._index = FeatureIndex(ids, vectors)
+
+    def index(self):
+        generation = catalog_cache.generation('object')
+        with self._lock:
+            if self._generation != generation:
+                self._load()
+                self._generation = generation
+            return self._index
+
+    def match(self, vector, k=5):
+        return self.index().nearest(vector, k)
+
+
+matcher = ObjectMatcher()
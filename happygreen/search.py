@@ -0,0 +1,186 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+
+from .cache import LRUCache
+from .models import Product, RecognizedObject, Post, Group, SearchToken
+
+# Campi indicizzati di ogni modello con il loro peso nel punteggio
+SEARCH_FIELDS = {
+    Product: ('product', {'name': 3.0, 'barcode': 5.0, 'manufacturer': 2.0, 'description': 1.0}),
+    RecognizedObject: ('object', {'name': 3.0, 'category': 2.0, 'description': 1.0}),
+    Post: ('post', {'title': 3.0, 'content': 1.0}),
+    Group: ('group', {'name': 3.0, 'description': 1.0}),
+}
+
+# Campi cercati anche per prefisso quando la ricerca è numerica (codici parziali)
+PREFIX_FIELDS = {
+    Product: 'barcode',
+}
+
+# Termini considerati per ogni ricerca
+MAX_QUERY_TERMS = 10
+# Lunghezza massima di un termine (SearchToken.term)
+TERM_MAX_LENGTH = 64
+
+# Numero di oggetti indicizzati per modello, usato per l'IDF: basta un valore approssimato
+document_counts = LRUCache(maxsize=len(SEARCH_FIELDS), ttl=60)
+
+STOPWORDS = frozenset("""
+a ad al alla alle allo agli ai anche che chi ci come con da dal dalla dalle dallo dagli dai de del della
+delle dello degli dei di e ed gli i il in io la le lo loro ma mi ne nei nel nella nelle nello negli non
+o per piu quale quali quello questa questo se si sono su sul sulla sulle sullo sugli sui tra fra
+tu un una uno vi the and of
+l dell dall nell sull all quell c d s
+""".split())
+
+# Suffissi derivativi ridotti a una radice comune (riciclabile, riciclabili -> ricicl)
+SUFFIXES = (
+    'amente', 'imente', 'mente', 'azione', 'azioni', 'atore', 'atori', 'atrice', 'atrici',
+    'abile', 'abili', 'ibile', 'ibili', 'issimo', 'issima', 'issimi', 'issime',
+)
+# Plurali in -che/-chi, -ghe/-ghi: plastiche, plastica -> plastic
+GUTTURAL_ENDINGS = ('che', 'chi', 'ghe', 'ghi')
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def fold(text):
+    """Minuscolo senza accenti: perché -> perche"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(word):
+    """
+    Stemming leggero per l'italiano: toglie alcuni suffissi derivativi e la
+    vocale finale di genere e numero, così singolare e plurale coincidono.
+    """
+    if word.isdigit() or len(word) <= 3:
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    if word.endswith(GUTTURAL_ENDINGS):
+        return word[:-2]
+    if word[-1] in 'aeiou':
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Termini indicizzabili del testo; le elisioni (dell'acqua) restano come stopword separate"""
+    return [stem(token) for token in TOKEN_RE.findall(fold(text or '')) if token not in STOPWORDS]
+
+
+def document_terms(instance, fields=None):
+    """{termine: peso} dell'oggetto, con frequenza smorzata dal logaritmo"""
+    if fields is None:
+        _, fields = SEARCH_FIELDS[type(instance)]
+    weights = Counter()
+    for field, field_weight in fields.items():
+        for term, count in Counter(tokenize(getattr(instance, field))).items():
+            weights[term[:TERM_MAX_LENGTH]] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def index_object(instance):
+    """Sostituisce le voci dell'indice dell'oggetto"""
+    kind, _ = SEARCH_FIELDS[type(instance)]
+    with transaction.atomic():
+        SearchToken.objects.filter(kind=kind, object_id=instance.pk).delete()
+        SearchToken.objects.bulk_create([
+            SearchToken(kind=kind, object_id=instance.pk, term=term, weight=weight)
+            for term, weight in document_terms(instance).items()
+        ])
+
+
+def remove_object(model, pk):
+    kind, _ = SEARCH_FIELDS[model]
+    SearchToken.objects.filter(kind=kind, object_id=pk).delete()
+
+
+def rebuild_index(model, batch_size=1000):
+    """Ricostruisce l'indice di tutti gli oggetti del modello; restituisce il numero di oggetti"""
+    kind, fields = SEARCH_FIELDS[model]
+    count = 0
+    with transaction.atomic():
+        SearchToken.objects.filter(kind=kind).delete()
+        tokens = []
+        for instance in model.objects.only('pk', *fields).iterator(chunk_size=batch_size):
+            tokens.extend(
+                SearchToken(kind=kind, object_id=instance.pk, term=term, weight=weight)
+                for term, weight in document_terms(instance).items()
+            )
+            count += 1
+            if len(tokens) >= batch_size:
+                SearchToken.objects.bulk_create(tokens)
+                tokens = []
+        SearchToken.objects.bulk_create(tokens)
+    return count
+
+
+def search(queryset, query):
+    """
+    Filtra il queryset sugli oggetti che contengono almeno un termine della
+    ricerca e li ordina per punteggio TF-IDF: la somma dei pesi dei termini
+    trovati, ciascuno moltiplicato per la rarità del termine nel modello.
+    Una ricerca numerica trova anche i codici che iniziano con quelle cifre
+    (PREFIX_FIELDS), come faceva il LIKE prima dell'indice.
+    """
+    kind, _ = SEARCH_FIELDS[queryset.model]
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset
+
+    prefix_field = PREFIX_FIELDS.get(queryset.model)
+    prefix = Q()
+    if prefix_field and query.strip().isdigit():
+        prefix = Q(**{f'{prefix_field}__istartswith': query.strip()})
+
+    tokens = SearchToken.objects.filter(kind=kind)
+    documents = document_counts.get(kind, None)
+    if documents is None:
+        documents = tokens.values('object_id').distinct().count()
+        document_counts.set(kind, documents)
+    frequencies = dict(
+        tokens.filter(term__in=terms).values('term').annotate(documents=Count('object_id')).values_list('term', 'documents')
+    )
+    if not frequencies:
+        if prefix:
+            return queryset.filter(prefix).annotate(search_score=Value(0.0)).order_by(prefix_field, '-pk')
+        return queryset.none()
+
+    matching = tokens.filter(term__in=list(frequencies))
+    weighted = Sum(Case(
+        *[
+            When(term=term, then=F('weight') * math.log(1 + max(documents, frequency) / frequency))
+            for term, frequency in frequencies.items()
+        ],
+        output_field=FloatField()
+    ))
+    score = matching.filter(object_id=OuterRef('pk')).order_by().values('object_id').annotate(
+        score=weighted
+    ).values('score')
+    # Il filtro sugli id precede il punteggio, calcolato solo per gli oggetti trovati
+    return queryset.filter(Q(pk__in=matching.values('object_id')) | prefix).annotate(
+        search_score=Coalesce(Subquery(score, output_field=FloatField()), 0.0)
+    ).order_by('-search_score', '-pk')
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """?search= risolto sull'indice invertito per i modelli indicizzati, con LIKE per gli altri"""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if queryset.model not in SEARCH_FIELDS or not query.strip():
+            return super().filter_queryset(request, queryset, view)
+        return search(queryset, query)
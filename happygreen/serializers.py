@@ -1,10 +1,32 @@
+import json
+from collections.abc import Mapping
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
 from .models import (
     Profile, Badge, UserBadge, Group, GroupMembership, Post, Comment,
     RecognizedObject, ScanRecord, Quiz, QuizQuestion, QuizOption,
     QuizAttempt, Challenge, ChallengeParticipation, Product, ProductScan
 )
+from .streaks import streak_of
+
+
+class ImageRenditionsField(serializers.Field):
+    """URL delle varianti ridimensionate dell'immagine ({} finché non sono pronte)"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'renditions')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for label, path in (value or {}).get('sizes', {}).items():
+            url = default_storage.url(path)
+            urls[label] = request.build_absolute_uri(url) if request is not None else url
+        return urls
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -37,14 +59,27 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
 
 class ProfileSerializer(serializers.ModelSerializer):
+    avatar_renditions = ImageRenditionsField()
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
+    streak = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['id', 'username', 'email', 'bio', 'avatar', 'points', 'created_at']
+        fields = ['id', 'username', 'email', 'bio', 'avatar', 'avatar_renditions', 'points', 'streak', 'created_at']
         read_only_fields = ['points', 'created_at']
 
+    def get_streak(self, obj):
+        return streak_of(obj)
+
+    def update(self, instance, validated_data):
+        # Solo i campi modificati: un save() completo riscriverebbe i punti letti
+        # all'inizio della richiesta, annullando gli incrementi atomici fatti nel frattempo
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
 
 class BadgeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -82,6 +117,9 @@ class GroupSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_members_count(self, obj):
+        # Le viewset annotano members_count per evitare una COUNT per riga
+        if hasattr(obj, 'members_count'):
+            return obj.members_count
         return obj.members.count()
 
 
@@ -105,17 +143,21 @@ class PostSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     group_name = serializers.CharField(source='group.name', read_only=True)
     comments_count = serializers.SerializerMethodField()
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Post
         fields = [
             'id', 'title', 'content', 'author_username', 'group_name', 'group',
-            'image', 'latitude', 'longitude', 'location_name', 'comments_count',
+            'image', 'image_renditions', 'latitude', 'longitude', 'location_name', 'comments_count',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
     def get_comments_count(self, obj):
+        # Le viewset annotano comments_count per evitare una COUNT per riga
+        if hasattr(obj, 'comments_count'):
+            return obj.comments_count
         return obj.comments.count()
 
 
@@ -140,12 +182,13 @@ class ScanRecordSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     object_name = serializers.CharField(source='recognized_object.name', read_only=True)
     object_details = RecognizedObjectSerializer(source='recognized_object', read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = ScanRecord
         fields = [
-            'id', 'username', 'object_name', 'object_details', 'image',
-            'latitude', 'longitude', 'location_name', 'created_at'
+            'id', 'username', 'recognized_object', 'object_name', 'object_details', 'image',
+            'image_renditions', 'latitude', 'longitude', 'location_name', 'created_at'
         ]
         read_only_fields = ['created_at']
 
@@ -229,12 +272,14 @@ class ChallengeParticipationSerializer(serializers.ModelSerializer):
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Product
         fields = [
             'id', 'barcode', 'name', 'description', 'manufacturer',
             'eco_friendly', 'recyclable', 'sustainability_score',
-            'eco_info', 'alternatives', 'image', 'created_at', 'updated_at'
+            'eco_info', 'alternatives', 'image', 'image_renditions', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
@@ -246,4 +291,74 @@ class ProductScanSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductScan
         fields = ['id', 'username', 'product_details', 'created_at']
-        read_only_fields = ['created_at']
\ No newline at end of file
+        read_only_fields = ['created_at']
+
+# Numero massimo di scansioni accettate in una singola richiesta batch
+MAX_SCAN_BATCH_SIZE = 500
+
+
+class ScanBatchRecordSerializer(serializers.Serializer):
+    client_id = serializers.CharField(max_length=64)
+    recognized_object = serializers.IntegerField()
+    image = serializers.CharField(help_text="Nome del file caricato nella stessa richiesta multipart")
+    latitude = serializers.FloatField(required=False, allow_null=True)
+    longitude = serializers.FloatField(required=False, allow_null=True)
+    location_name = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+
+
+class ScanBatchProductSerializer(serializers.Serializer):
+    client_id = serializers.CharField(max_length=64)
+    product = serializers.IntegerField()
+
+
+class ScanBatchSerializer(serializers.Serializer):
+    """Scansioni registrate offline dall'app e sincronizzate in un'unica richiesta"""
+    scans = ScanBatchRecordSerializer(many=True, required=False)
+    product_scans = ScanBatchProductSerializer(many=True, required=False)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, Mapping):
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ["Expected an object with scans and product_scans."]
+            })
+        # Nelle richieste multipart le liste arrivano come stringhe JSON
+        parsed = {}
+        for key in ('scans', 'product_scans'):
+            value = data.get(key, [])
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise serializers.ValidationError({key: "Invalid JSON."})
+            if not isinstance(value, list):
+                raise serializers.ValidationError({key: "Expected a list."})
+            parsed[key] = value
+        return super().to_internal_value(parsed)
+
+    def validate(self, data):
+        scans = data.get('scans', [])
+        product_scans = data.get('product_scans', [])
+        if len(scans) + len(product_scans) > MAX_SCAN_BATCH_SIZE:
+            raise serializers.ValidationError(f"A batch can contain at most {MAX_SCAN_BATCH_SIZE} scans.")
+
+        for key, items in (('scans', scans), ('product_scans', product_scans)):
+            client_ids = [item['client_id'] for item in items]
+            if len(client_ids) != len(set(client_ids)):
+                raise serializers.ValidationError({key: "Duplicate client_id in batch."})
+
+        # Verifica l'esistenza di oggetti e prodotti con una query per tipo
+        object_ids = {item['recognized_object'] for item in scans}
+        if RecognizedObject.objects.filter(id__in=object_ids).count() != len(object_ids):
+            raise serializers.ValidationError({'scans': "Unknown recognized_object."})
+        product_ids = {item['product'] for item in product_scans}
+        if Product.objects.filter(id__in=product_ids).count() != len(product_ids):
+            raise serializers.ValidationError({'product_scans': "Unknown product."})
+
+        files = self.context['request'].FILES
+        image_field = serializers.ImageField()
+        for item in scans:
+            if item['image'] not in files:
+                raise serializers.ValidationError({'scans': f"Missing uploaded file '{item['image']}'."})
+            item['image'] = image_field.run_validation(files[item['image']])
+
+        return data
@@ -1,7 +1,19 @@
-from django.db.models.signals import post_save
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from .models import (
+    Profile, Badge, BadgeCriterion, Product, RecognizedObject, Quiz, QuizQuestion, QuizOption, GroupMembership, Group,
+    Post, ScanRecord
+)
+from .cache import catalog_cache
+from .dedup import seen_images
+from . import feed
+from .dashboard import activity
+from .images import needs_renditions, rendition_workers
+from .leaderboard import leaderboards
+from .search import index_object, remove_object
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -10,7 +22,97 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
+    # Crea il profilo mancante degli utenti esistenti. Il profilo non viene risalvato:
+    # riscriverebbe i punti letti prima degli incrementi atomici concorrenti
     try:
-        instance.profile.save()
+        instance.profile
     except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, **kwargs):
+    catalog_cache.bump('product')
+
+@receiver([post_save, post_delete], sender=RecognizedObject)
+def invalidate_object_cache(sender, **kwargs):
+    catalog_cache.bump('object')
+
+@receiver([post_save, post_delete], sender=Badge)
+@receiver([post_save, post_delete], sender=BadgeCriterion)
+def invalidate_badge_cache(sender, **kwargs):
+    catalog_cache.bump('badge')
+
+@receiver([post_save, post_delete], sender=Quiz)
+@receiver([post_save, post_delete], sender=QuizQuestion)
+@receiver([post_save, post_delete], sender=QuizOption)
+def invalidate_quiz_cache(sender, **kwargs):
+    catalog_cache.bump('quiz')
+
+@receiver(post_save, sender=Profile)
+def add_to_leaderboards(sender, instance, created, **kwargs):
+    if created:
+        leaderboards.points_changed(instance.user_id, instance.points)
+
+@receiver(post_delete, sender=Profile)
+def remove_from_leaderboards(sender, instance, **kwargs):
+    leaderboards.user_removed(instance.user_id)
+
+@receiver([post_save, post_delete], sender=GroupMembership)
+def update_group_leaderboard(sender, instance, **kwargs):
+    # Dopo il commit, così gli altri processi non ricaricano la classifica senza la modifica
+    transaction.on_commit(partial(leaderboards.membership_changed, instance.group_id))
+
+@receiver(post_save, sender=GroupMembership)
+def add_group_to_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.membership_added(instance.group_id, instance.user_id)
+
+@receiver(post_delete, sender=GroupMembership)
+def remove_group_from_timeline(sender, instance, **kwargs):
+    feed.membership_removed(instance.group_id, instance.user_id)
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        # Dopo il commit, così il fan-out non allunga la transazione che crea il post
+        transaction.on_commit(partial(feed.fan_out, instance.id))
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=ScanRecord)
+@receiver(post_save, sender=Product)
+def schedule_renditions(sender, instance, **kwargs):
+    # Le varianti vengono generate dal pool solo dopo il commit, quando file e riga sono visibili
+    if needs_renditions(instance):
+        transaction.on_commit(partial(rendition_workers.submit, sender, instance.pk))
+
+@receiver(post_save, sender=ScanRecord)
+def add_to_seen_images(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(seen_images.scan_added, instance.id, instance.image_phash))
+
+@receiver(post_delete, sender=ScanRecord)
+def remove_from_seen_images(sender, instance, **kwargs):
+    seen_images.scan_removed(instance.id)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=RecognizedObject)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Group)
+def update_search_index(sender, instance, **kwargs):
+    index_object(instance)
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=RecognizedObject)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Group)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_object(sender, instance.pk)
+
+@receiver([post_save, post_delete], sender=GroupMembership)
+def invalidate_member_dashboard(sender, instance, **kwargs):
+    activity(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_author_dashboard(sender, instance, **kwargs):
+    activity(instance.author_id)
@@ -0,0 +1,221 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import RecognizedObject, Product, ScanRecord, ProductScan, ScanStatistic, UserScanStatistic
+
+# Elementi restituiti nelle classifiche di oggetti e prodotti più scansionati
+TOP_ITEMS = 10
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def parse_month(value):
+    """Mese di ?month=: AAAA-MM, 'all' per tutti i mesi (None), il mese corrente se manca"""
+    if not value:
+        return month_of(timezone.localdate())
+    if value == 'all':
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError as e:
+        raise ValueError('Month must be YYYY-MM or all') from e
+
+
+def increment(model, lookup, scans, score_total):
+    """Somma scans e score_total al contatore, creandolo se manca (come add_daily_points)"""
+    changes = {'scans': F('scans') + scans, 'score_total': F('score_total') + score_total}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(scans=scans, score_total=score_total, **lookup)
+    except IntegrityError:
+        # Creato nel frattempo da una richiesta concorrente
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record_scans(user, object_ids=(), product_ids=(), day=None, sign=1):
+    """
+    Aggiorna i contatori per le scansioni di oggetti e prodotti dell'utente:
+    per oggetto, categoria e prodotto e, per l'utente, per categoria e prodotto.
+    sign=-1 toglie scansioni eliminate. Gli incrementi sono raggruppati, quindi
+    un batch costa un UPDATE per contatore toccato.
+    """
+    month = month_of(day or timezone.localdate())
+    totals = defaultdict(Counter)
+    user_totals = defaultdict(Counter)
+
+    objects = {
+        object_id: (category, score)
+        for object_id, category, score in RecognizedObject.objects.filter(id__in=set(object_ids)).values_list(
+            'id', 'category', 'sustainability_score'
+        )
+    }
+    for object_id in object_ids:
+        if object_id not in objects:
+            continue
+        category, score = objects[object_id]
+        for counters, key in ((totals, ('OBJECT', str(object_id))), (totals, ('CATEGORY', category)),
+                              (user_totals, ('CATEGORY', category))):
+            counters[key].update(scans=sign, score_total=sign * score)
+
+    scores = dict(Product.objects.filter(id__in=set(product_ids)).values_list('id', 'sustainability_score'))
+    for product_id in product_ids:
+        if product_id not in scores:
+            continue
+        for counters in (totals, user_totals):
+            counters[('PRODUCT', str(product_id))].update(scans=sign, score_total=sign * scores[product_id])
+
+    with transaction.atomic():
+        for (scope, key), counter in totals.items():
+            increment(ScanStatistic, {'scope': scope, 'key': key, 'month': month}, counter['scans'], counter['score_total'])
+        for (scope, key), counter in user_totals.items():
+            increment(
+                UserScanStatistic, {'user': user, 'scope': scope, 'key': key, 'month': month},
+                counter['scans'], counter['score_total']
+            )
+
+
+def recompute():
+    """
+    Contatori ricalcolati dalle tabelle delle scansioni con un GROUP BY per
+    tabella: {(scope, key, month): (scans, score_total)} globali e
+    {(user_id, scope, key, month): (scans, score_total)} per utente.
+    """
+    totals = defaultdict(Counter)
+    user_totals = defaultdict(Counter)
+    month = TruncMonth('created_at', output_field=DateField())
+
+    object_rows = ScanRecord.objects.annotate(month=month).values(
+        'user', 'recognized_object', 'recognized_object__category', 'month'
+    ).annotate(scans=Count('id'), score_total=Sum('recognized_object__sustainability_score')).order_by()
+    for row in object_rows:
+        counts = {'scans': row['scans'], 'score_total': row['score_total']}
+        category = row['recognized_object__category']
+        totals[('OBJECT', str(row['recognized_object']), row['month'])].update(counts)
+        totals[('CATEGORY', category, row['month'])].update(counts)
+        user_totals[(row['user'], 'CATEGORY', category, row['month'])].update(counts)
+
+    product_rows = ProductScan.objects.annotate(month=month).values('user', 'product', 'month').annotate(
+        scans=Count('id'), score_total=Sum('product__sustainability_score')
+    ).order_by()
+    for row in product_rows:
+        counts = {'scans': row['scans'], 'score_total': row['score_total']}
+        totals[('PRODUCT', str(row['product']), row['month'])].update(counts)
+        user_totals[(row['user'], 'PRODUCT', str(row['product']), row['month'])].update(counts)
+
+    def freeze(counters):
+        return {key: (counter['scans'], counter['score_total']) for key, counter in counters.items()}
+
+    return freeze(totals), freeze(user_totals)
+
+
+def reconcile():
+    """
+    Porta i contatori ai valori ricalcolati, correggendo le derive (scansioni
+    cancellate a cascata, punteggi modificati dopo la scansione). Applica solo
+    le differenze, con un UPDATE relativo (F() + delta) per contatore: gli
+    incrementi concorrenti non vengono sovrascritti. Conteggi e contatori sono
+    letti nella stessa transazione, quindi con REPEATABLE READ (MySQL) vedono lo
+    stesso snapshot. Restituisce il numero di contatori globali e per utente corretti.
+    """
+    with transaction.atomic():
+        totals, user_totals = recompute()
+        stored = {
+            (scope, key, month): (scans, score_total)
+            for scope, key, month, scans, score_total in ScanStatistic.objects.values_list(
+                'scope', 'key', 'month', 'scans', 'score_total'
+            )
+        }
+        user_stored = {
+            (user_id, scope, key, month): (scans, score_total)
+            for user_id, scope, key, month, scans, score_total in UserScanStatistic.objects.values_list(
+                'user', 'scope', 'key', 'month', 'scans', 'score_total'
+            )
+        }
+
+    def apply(model, fields, expected, actual):
+        corrected = 0
+        for key in expected.keys() | actual.keys():
+            scans, score_total = expected.get(key, (0, 0))
+            stored_scans, stored_score_total = actual.get(key, (0, 0))
+            if (scans, score_total) != (stored_scans, stored_score_total):
+                increment(model, dict(zip(fields, key)), scans - stored_scans, score_total - stored_score_total)
+                corrected += 1
+        # I contatori scesi a zero equivalgono a quelli assenti
+        model.objects.filter(scans=0, score_total=0).delete()
+        return corrected
+
+    return (
+        apply(ScanStatistic, ('scope', 'key', 'month'), totals, stored),
+        apply(UserScanStatistic, ('user_id', 'scope', 'key', 'month'), user_totals, user_stored),
+    )
+
+
+def aggregate(rows):
+    """Somma per chiave le righe (key, scans, score_total) dei contatori, ordinate per scansioni"""
+    totals = defaultdict(lambda: [0, 0])
+    for key, scans, score_total in rows:
+        totals[key][0] += scans
+        totals[key][1] += score_total
+    return sorted(
+        ((key, scans, score_total) for key, (scans, score_total) in totals.items() if scans > 0),
+        key=lambda row: (-row[1], row[0])
+    )
+
+
+def average(scans, score_total):
+    return round(score_total / scans, 2) if scans else None
+
+
+def counters(queryset, scope, month):
+    queryset = queryset.filter(scope=scope)
+    if month is not None:
+        queryset = queryset.filter(month=month)
+    return aggregate(queryset.values_list('key', 'scans', 'score_total'))
+
+
+def named(rows, model):
+    names = dict(model.objects.filter(id__in=[int(key) for key, _, _ in rows]).values_list('id', 'name'))
+    return [
+        {'id': int(key), 'name': names.get(int(key)), 'scans': scans, 'average_score': average(scans, score_total)}
+        for key, scans, score_total in rows
+    ]
+
+
+def global_summary(month=None):
+    """Scansioni per categoria e oggetti e prodotti più scansionati nel mese (None = sempre)"""
+    statistics = ScanStatistic.objects.all()
+    return {
+        'categories': [
+            {'category': key, 'scans': scans, 'average_score': average(scans, score_total)}
+            for key, scans, score_total in counters(statistics, 'CATEGORY', month)
+        ],
+        'objects': named(counters(statistics, 'OBJECT', month)[:TOP_ITEMS], RecognizedObject),
+        'products': named(counters(statistics, 'PRODUCT', month)[:TOP_ITEMS], Product),
+    }
+
+
+def user_summary(user, month=None):
+    """Scansioni dell'utente per categoria e punteggio medio dei prodotti scansionati"""
+    statistics = UserScanStatistic.objects.filter(user=user)
+    products = counters(statistics, 'PRODUCT', month)
+    product_scans = sum(scans for _, scans, _ in products)
+    return {
+        'categories': [
+            {'category': key, 'scans': scans, 'average_score': average(scans, score_total)}
+            for key, scans, score_total in counters(statistics, 'CATEGORY', month)
+        ],
+        'products': {
+            'scans': product_scans,
+            'average_score': average(product_scans, sum(score_total for _, _, score_total in products)),
+            'top': named(products[:TOP_ITEMS], Product),
+        },
+    }
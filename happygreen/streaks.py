@@ -0,0 +1,118 @@
+from datetime import timedelta
+from functools import partial
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import Profile, ScanRecord, ProductScan, QuizAttempt, ChallengeParticipation
+
+# Campi della serie, scritti solo da record_activity e rebuild_streaks
+STREAK_FIELDS = ['last_active_day', 'current_streak', 'best_streak']
+
+
+def record_activity(user, day=None):
+    """
+    Aggiorna la serie dell'utente con un solo UPDATE: nessun cambiamento se era
+    già attivo nel giorno, +1 se era attivo il giorno prima, altrimenti riparte da 1.
+    Se la serie cambia, la dashboard dell'utente viene invalidata dopo il commit.
+    """
+    # dashboard importa streak_of da questo modulo
+    from .dashboard import activity
+
+    day = day or timezone.localdate()
+    current = Case(
+        When(last_active_day=day - timedelta(days=1), then=F('current_streak') + 1),
+        default=Value(1)
+    )
+    # MySQL applica le assegnazioni da sinistra a destra: best_streak e current_streak
+    # vanno calcolati prima di modificare le colonne da cui dipendono
+    updated = Profile.objects.filter(user=user).filter(Q(last_active_day__lt=day) | Q(last_active_day=None)).update(
+        best_streak=Greatest('best_streak', current),
+        current_streak=current,
+        last_active_day=day
+    )
+    if updated:
+        transaction.on_commit(partial(activity, user.id))
+
+
+def streak_of(profile, today=None):
+    """Serie attuale (ancora valida se l'utente è stato attivo oggi o ieri), migliore e ultimo giorno attivo"""
+    today = today or timezone.localdate()
+    alive = profile.last_active_day is not None and today - profile.last_active_day <= timedelta(days=1)
+    return {
+        'current': profile.current_streak if alive else 0,
+        'best': profile.best_streak,
+        'last_active_day': profile.last_active_day,
+    }
+
+
+def streaks(days):
+    """Ultimo giorno, serie che vi termina e serie migliore di una sequenza ordinata di giorni distinti"""
+    current = best = 0
+    previous = None
+    for day in days:
+        current = current + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        best = max(best, current)
+        previous = day
+    return previous, current, best
+
+
+def activity_days():
+    """(user_id, giorno) distinti di attività di tutti gli utenti, in ordine di utente e giorno"""
+    sources = [
+        ScanRecord.objects.values('user', day=TruncDate('created_at')),
+        ProductScan.objects.values('user', day=TruncDate('created_at')),
+        QuizAttempt.objects.filter(completed=True).exclude(completed_at=None).values(
+            'user', day=TruncDate('completed_at')
+        ),
+        ChallengeParticipation.objects.filter(completed=True).exclude(completed_at=None).values(
+            'user', day=TruncDate('completed_at')
+        ),
+    ]
+    days = sources[0].union(*sources[1:]).order_by('user', 'day')
+    return ((row['user'], row['day']) for row in days.iterator())
+
+
+def rebuild_streaks(batch_size=1000):
+    """
+    Ricalcola le serie di tutti i profili in un'unica passata sui giorni di
+    attività, confrontandole con i profili in ordine di utente. Scrive solo i
+    profili da correggere, a blocchi di batch_size e senza una transazione
+    unica; restituisce il numero di profili corretti.
+    """
+    from .dashboard import activity
+
+    groups = groupby(activity_days(), key=lambda row: row[0])
+    group = next(groups, None)
+    changed = []
+    updated = 0
+
+    def write(profiles):
+        count = Profile.objects.bulk_update(profiles, STREAK_FIELDS)
+        for profile in profiles:
+            activity(profile.user_id)
+        return count
+
+    for pk, user_id, *stored in Profile.objects.order_by('user_id').values_list(
+        'id', 'user_id', *STREAK_FIELDS
+    ).iterator():
+        while group is not None and group[0] < user_id:
+            group = next(groups, None)
+        # Senza attività (per esempio dopo aver cancellato le scansioni) la serie è vuota
+        expected = (None, 0, 0)
+        if group is not None and group[0] == user_id:
+            expected = streaks(day for _, day in group[1])
+        if tuple(stored) != expected:
+            last_active_day, current, best = expected
+            changed.append(Profile(
+                id=pk, user_id=user_id, last_active_day=last_active_day, current_streak=current, best_streak=best
+            ))
+        if len(changed) >= batch_size:
+            updated += write(changed)
+            changed = []
+    if changed:
+        updated += write(changed)
+    return updated
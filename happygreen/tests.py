@@ -1,3 +1,1250 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import warnings
+from datetime import datetime, time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .badges import award_badges, record_events, rebuild_counters, thresholds
+from .cache import catalog_cache
+from .dedup import seen_images
+from .features import FEATURE_SIZE
+from . import dashboard, feed, ingestion
+from .leaderboard import Leaderboard, leaderboards
+from .points import award_points, award_transactions
+from .quizzes import get_compiled_quiz
+from .exports import export_rows
+from .geo import prefix_range
+from .heatmap import bin_scans, tile_for
+from .search import tokenize
+from .stats import record_scans, reconcile
+from .streaks import record_activity, rebuild_streaks
+from .models import (
+    Group, GroupMembership, Post, Comment, Product, Challenge, ChallengeParticipation,
+    Quiz, QuizQuestion, QuizOption, QuizAttempt, ProductScan, Profile, DailyPoints, RecognizedObject, ScanRecord,
+    TimelineEntry, ScanStatistic, Badge, BadgeCriterion, ActivityCounter, UserBadge, PointsTransaction
+)
+
+
+class CursorPaginationTest(TestCase):
+    """Il cursore su created_at non salta né ripete i post con lo stesso created_at"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        group = Group.objects.create(name='Gruppo', creator=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='ADMIN')
+        posts = [Post.objects.create(title=f'Post {i}', content='...', author=self.user, group=group) for i in range(11)]
+        # Due gruppi di pareggi che attraversano i confini delle pagine
+        now = timezone.now()
+        Post.objects.filter(id__in=[post.id for post in posts[:7]]).update(created_at=now - timedelta(hours=1))
+        Post.objects.filter(id__in=[post.id for post in posts[7:]]).update(created_at=now)
+        self.expected = [post.id for post in posts[7:][::-1] + posts[:7][::-1]]
+
+    def test_pages_across_identical_created_at(self):
+        ids, url = [], '/api/posts/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, self.expected)
+
+        # All'indietro dall'ultima pagina: nessun post saltato o ripetuto
+        ids, url = [], response.data['previous']
+        while url:
+            response = self.client.get(url)
+            ids = [post['id'] for post in response.data['results']] + ids
+            url = response.data['previous']
+        self.assertEqual(ids, self.expected[:9])
+
+
+class ListQueryCountTest(TestCase):
+    """Le liste di post e gruppi devono costare un numero fisso di query"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_data(self, size):
+        for i in range(size):
+            group = Group.objects.create(name=f'Gruppo {i}', creator=self.user)
+            GroupMembership.objects.create(user=self.user, group=group, role='ADMIN')
+            post = Post.objects.create(title=f'Post {i}', content='...', author=self.user, group=group)
+            Comment.objects.create(post=post, author=self.user, content='Bravo!')
+
+    def count_queries(self, url):
+        """(oggetti restituiti, query eseguite) per la pagina"""
+        with warnings.catch_warnings():
+            # Una lista non ordinata darebbe pagine instabili
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(response.data['results']), len(context)
+
+    def assert_constant_queries(self, url):
+        # Pagine di 10 e di 100 oggetti: una query per riga farebbe crescere il conteggio
+        self.create_data(100)
+        counts = []
+        for size in (10, 100):
+            returned, queries = self.count_queries(f'{url}?page_size={size}')
+            self.assertEqual(returned, size)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1], f'{url}: {counts}')
+
+    def test_post_list(self):
+        self.assert_constant_queries('/api/posts/')
+
+    def test_group_list(self):
+        self.assert_constant_queries('/api/groups/')
+
+    def test_user_posts(self):
+        self.assert_constant_queries(f'/api/users/{self.user.id}/posts/')
+
+    def test_user_groups(self):
+        self.assert_constant_queries(f'/api/users/{self.user.id}/groups/')
+
+    def test_annotated_counts(self):
+        self.create_data(1)
+        other = User.objects.create_user('luigi', password='password')
+        GroupMembership.objects.create(user=other, group=Group.objects.get(), role='MEMBER')
+
+        group = self.client.get(f'/api/users/{self.user.id}/groups/').data['results'][0]
+        self.assertEqual(group['members_count'], 2)
+        post = self.client.get('/api/posts/').data['results'][0]
+        self.assertEqual(post['comments_count'], 1)
+        self.assertEqual(post['author_username'], 'mario')
+
+
+class ActionPaginationTest(TestCase):
+    """Le @action che restituiscono elenchi devono essere paginate con un limite lato server"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_participants_page_size_is_bounded(self):
+        challenge = Challenge.objects.create(
+            title='Plastic free', description='...', start_date=timezone.now(), end_date=timezone.now()
+        )
+        users = User.objects.bulk_create([User(username=f'utente{i}') for i in range(150)])
+        ChallengeParticipation.objects.bulk_create(
+            [ChallengeParticipation(user=user, challenge=challenge) for user in users]
+        )
+
+        response = self.client.get(f'/api/challenges/{challenge.id}/participants/?page_size=1000')
+        self.assertEqual(response.data['count'], 150)
+        self.assertEqual(len(response.data['results']), 100)
+        response = self.client.get(f'/api/challenges/{challenge.id}/participants/')
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class PointsTest(TestCase):
+    """I punti si aggiornano con incrementi atomici che nessun salvataggio del profilo deve annullare"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ledger_matches_points(self):
+        award_points(self.user, 10, 'SCAN')
+        award_transactions(self.user, [
+            PointsTransaction(amount=5, source='QUIZ'),
+            PointsTransaction(amount=0, source='SCAN'),
+            PointsTransaction(amount=-3, source='ADJUSTMENT'),
+        ])
+        self.assertEqual(award_points(self.user, 2, 'PRODUCT_SCAN'), 14)
+        self.assertEqual(PointsTransaction.objects.filter(user=self.user).count(), 4)
+        ledger = PointsTransaction.objects.filter(user=self.user).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(ledger, Profile.objects.get(user=self.user).points)
+        self.assertEqual(DailyPoints.objects.get(user=self.user).points, 14)
+
+    def test_side_effects_run_on_commit(self):
+        with mock.patch.object(leaderboards, 'points_changed') as points_changed:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                try:
+                    with transaction.atomic():
+                        award_points(self.user, 10, 'SCAN')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+            self.assertEqual(callbacks, [])
+            self.assertEqual(Profile.objects.get(user=self.user).points, 0)
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                award_points(self.user, 10, 'SCAN')
+                points_changed.assert_not_called()
+            for callback in callbacks:
+                callback()
+            points_changed.assert_called_once_with(self.user.id, 10, 10)
+
+    def test_profile_saves_keep_concurrent_points(self):
+        profile = Profile.objects.get(user=self.user)
+        stale_user = User.objects.get(id=self.user.id)
+        stale_user.profile  # profilo letto prima dell'incremento
+        award_points(self.user, 10, 'SCAN')
+
+        stale_user.first_name = 'Mario'
+        stale_user.save()
+        response = self.client.patch(f'/api/profiles/{profile.id}/', {'bio': 'Riciclo tutto'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['points'], 10)
+        profile.refresh_from_db()
+        self.assertEqual((profile.bio, profile.points), ('Riciclo tutto', 10))
+
+    def test_rebuild_points_adjusts_ledger_by_default(self):
+        Profile.objects.filter(user=self.user).update(points=50)  # saldo precedente al ledger
+        award_points(self.user, 5, 'SCAN')
+
+        call_command('rebuild_points', '--dry-run', stdout=StringIO())
+        self.assertFalse(PointsTransaction.objects.filter(source='ADJUSTMENT').exists())
+
+        call_command('rebuild_points', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=self.user).points, 55)
+        self.assertEqual(PointsTransaction.objects.get(source='ADJUSTMENT').amount, 50)
+        self.assertEqual(DailyPoints.objects.get(user=self.user).points, 5)
+
+    def test_rebuild_points_reconciles_daily_points(self):
+        award_points(self.user, 5, 'SCAN')
+        yesterday = timezone.localdate() - timedelta(days=1)
+        drifted = DailyPoints.objects.get(user=self.user)
+        DailyPoints.objects.filter(pk=drifted.pk).update(points=8)
+        DailyPoints.objects.create(user=self.user, day=yesterday, points=3)  # senza transazioni nel ledger
+
+        out = StringIO()
+        call_command('rebuild_points', stdout=out)
+        self.assertIn('Corretti 2 contatori giornalieri', out.getvalue())
+        # Il contatore viene corretto sul posto, non cancellato e ricreato
+        self.assertEqual(list(DailyPoints.objects.values_list('id', 'points')), [(drifted.pk, 5)])
+
+    def test_rebuild_points_overwrite(self):
+        Profile.objects.filter(user=self.user).update(points=50)
+        award_points(self.user, 5, 'SCAN')
+        call_command('rebuild_points', '--overwrite', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=self.user).points, 5)
+        self.assertFalse(PointsTransaction.objects.filter(source='ADJUSTMENT').exists())
+
+
+class ScanBatchTest(TestCase):
+    """Il batch di scansioni offline deve essere idempotente rispetto ai client_id"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...',
+            sustainability_score=8, eco_info='...'
+        )
+
+    def test_replayed_batch_is_ignored(self):
+        payload = {'product_scans': [
+            {'client_id': f'scan-{i}', 'product': self.product.id} for i in range(50)
+        ]}
+        response = self.client.post('/api/scans/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['product_scans']), 50)
+
+        response = self.client.post('/api/scans/batch/', payload, format='json')
+        self.assertEqual(response.data['product_scans'], [])
+        self.assertEqual(ProductScan.objects.filter(user=self.user).count(), 50)
+        self.assertEqual(Profile.objects.get(user=self.user).points, 100)
+
+    def test_overlapping_batch_is_counted_once(self):
+        payload = {'product_scans': [
+            {'client_id': f'scan-{i}', 'product': self.product.id} for i in range(5)
+        ]}
+        self.client.post('/api/scans/batch/', payload, format='json')
+
+        # Un invio concorrente che ha controllato i client_id prima che il primo confermasse
+        real_new_items = ingestion.new_items
+        calls = []
+
+        def stale_new_items(model, user, items):
+            calls.append(model)
+            return items if len(calls) <= 2 else real_new_items(model, user, items)
+
+        with mock.patch.object(ingestion, 'new_items', side_effect=stale_new_items):
+            response = self.client.post('/api/scans/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['product_scans'], [])
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(ProductScan.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(Profile.objects.get(user=self.user).points, 10)
+        self.assertEqual(PointsTransaction.objects.filter(user=self.user).count(), 1)
+
+    def test_invalid_payload(self):
+        for payload in ([], 3, {'scans': 3}, {'product_scans': {'client_id': 'x'}}, {'scans': '"x"'}):
+            response = self.client.post('/api/scans/batch/', payload, format='json')
+            self.assertEqual(response.status_code, 400, payload)
+
+
+class ExportTest(TestCase):
+    """L'esportazione legge la cronologia a blocchi per id, senza righe duplicate o perse tra un blocco e l'altro"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        other = User.objects.create_user('anna', password='password')
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+        # Scansioni di un altro utente in mezzo, così gli id dell'utente non sono consecutivi
+        self.ids = []
+        for i in range(7):
+            self.ids.append(ProductScan.objects.create(user=self.user, product=self.product, client_id=f'scan-{i}').id)
+            ProductScan.objects.create(user=other, product=self.product)
+
+    def test_chunk_boundaries(self):
+        for chunk_size, queries in ((3, 3), (7, 2), (1, 8), (100, 1)):
+            with self.assertNumQueries(queries):
+                rows = list(export_rows(self.user, 'product_scans', chunk_size=chunk_size))
+            self.assertEqual([row['id'] for row in rows], self.ids, chunk_size)
+        self.assertEqual(rows[0]['barcode'], '8001097047991')
+
+    def test_streamed_export(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/users/{self.user.id}/export/?type=product_scans&output=csv')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,created_at,barcode,product_name,sustainability_score')
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], self.ids)
+
+
+class LeaderboardTest(TestCase):
+    """Le classifiche devono seguire i punti assegnati senza ricaricare i profili"""
+
+    def setUp(self):
+        leaderboards.reset()
+        self.client = APIClient()
+        self.users = [User.objects.create_user(f'utente{i}', password='password') for i in range(3)]
+        for points, user in zip((30, 10, 20), self.users):
+            Profile.objects.filter(user=user).update(points=points)
+        self.client.force_authenticate(self.users[1])
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...',
+            sustainability_score=8, eco_info='...'
+        )
+
+    def tearDown(self):
+        leaderboards.reset()
+
+    def test_global_leaderboard(self):
+        data = self.client.get('/api/leaderboard/').data
+        self.assertEqual([row['username'] for row in data['results']], ['utente0', 'utente2', 'utente1'])
+        self.assertEqual(data['me'], {'rank': 3, 'points': 10})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(11):
+                self.client.post(f'/api/products/{self.product.id}/scan/')
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/leaderboard/?limit=1').data
+        self.assertEqual(data['results'][0]['username'], 'utente1')
+        self.assertEqual(data['me'], {'rank': 1, 'points': 32})
+
+    def test_weekly_leaderboard(self):
+        today = timezone.localdate()
+        DailyPoints.objects.create(user=self.users[0], day=today - timedelta(days=10), points=100)
+        DailyPoints.objects.create(user=self.users[2], day=today - timedelta(days=3), points=5)
+
+        data = self.client.get('/api/leaderboard/?period=week').data
+        self.assertEqual([row['username'] for row in data['results']], ['utente2'])
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                self.client.post(f'/api/products/{self.product.id}/scan/')
+        data = self.client.get('/api/leaderboard/?period=week').data
+        self.assertEqual(data['me'], {'rank': 1, 'points': 6})
+        self.assertEqual(DailyPoints.objects.get(user=self.users[1], day=today).points, 6)
+        data = self.client.get('/api/leaderboard/?period=month').data
+        self.assertEqual([row['points'] for row in data['results']], [100, 6, 5])
+
+    def test_group_leaderboard(self):
+        group = Group.objects.create(name='Gruppo', creator=self.users[1])
+        GroupMembership.objects.create(user=self.users[1], group=group, role='ADMIN')
+        GroupMembership.objects.create(user=self.users[2], group=group)
+        url = f'/api/groups/{group.id}/leaderboard/'
+
+        self.assertEqual([row['points'] for row in self.client.get(url).data['results']], [20, 10])
+        with self.captureOnCommitCallbacks(execute=True):
+            GroupMembership.objects.create(user=self.users[0], group=group)
+        self.assertEqual([row['points'] for row in self.client.get(url).data['results']], [30, 20, 10])
+
+        # Un'uscita confermata da un altro processo incrementa solo la generazione condivisa
+        GroupMembership.objects.filter(user=self.users[2], group=group).delete()
+        self.assertEqual(len(self.client.get(url).data['results']), 3)
+        catalog_cache.bump(f'group:{group.id}')
+        self.assertEqual([row['points'] for row in self.client.get(url).data['results']], [30, 10])
+
+    def test_large_scores_use_memory_per_user(self):
+        board = Leaderboard([(1, 10), (2, -5), (3, 10 ** 12), (4, 10)])
+        self.assertEqual(board.top(4), [(1, 3, 10 ** 12), (2, 1, 10), (2, 4, 10), (4, 2, -5)])
+        self.assertEqual(board.rank(4), 2)
+        board.update(2, 10 ** 15)
+        board.remove(3)
+        self.assertEqual(board.top(2), [(1, 2, 10 ** 15), (2, 1, 10)])
+        self.assertEqual((board.rank(1), board.rank(3), len(board)), (2, None, 3))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTest(TestCase):
+    """La ricerca per barcode deve essere servita dalla cache dopo la prima richiesta"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...',
+            sustainability_score=8, eco_info='...'
+        )
+
+    def test_by_barcode_is_cached(self):
+        url = '/api/products/by_barcode/?barcode=8001097047991'
+        self.assertEqual(self.client.get(url).data['name'], 'Acqua Naturale Bio')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data['name'], 'Acqua Naturale Bio')
+
+    def test_save_invalidates_cache(self):
+        url = '/api/products/by_barcode/?barcode=8001097047991'
+        self.client.get(url)
+        self.product.name = 'Acqua Frizzante Bio'
+        self.product.save()
+        self.assertEqual(self.client.get(url).data['name'], 'Acqua Frizzante Bio')
+
+    def test_unknown_barcode(self):
+        url = '/api/products/by_barcode/?barcode=0000000000000'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        Product.objects.create(
+            barcode='0000000000000', name='Nuovo', description='...',
+            sustainability_score=5, eco_info='...'
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_compiled_quiz(self):
+        quiz = Quiz.objects.create(title='Riciclo', description='...', points=10)
+        question = QuizQuestion.objects.create(quiz=quiz, question='Dove va il vetro?')
+        QuizOption.objects.create(question=question, text='Vetro', is_correct=True)
+        url = f'/api/quizzes/{quiz.id}/'
+
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            data = self.client.get(url).data
+        self.assertEqual(len(data['questions'][0]['options']), 1)
+
+        QuizOption.objects.create(question=question, text='Carta')
+        self.assertEqual(len(self.client.get(url).data['questions'][0]['options']), 2)
+
+
+class QuizSubmitTest(TestCase):
+    """Le risposte si correggono sul quiz compilato, solo per un tentativo attivo e in formato valido"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.quiz = Quiz.objects.create(title='Riciclo', description='...', points=10)
+        self.options = []
+        for text in ('Dove va il vetro?', 'Dove va la carta?'):
+            question = QuizQuestion.objects.create(quiz=self.quiz, question=text)
+            self.options.append((
+                QuizOption.objects.create(question=question, text='Giusta', is_correct=True),
+                QuizOption.objects.create(question=question, text='Sbagliata'),
+            ))
+        self.url = f'/api/quizzes/{self.quiz.id}/submit/'
+
+    def answer(self, option):
+        return {'question_id': option.question_id, 'option_id': option.id}
+
+    def test_grade(self):
+        quiz = get_compiled_quiz(self.quiz.id)
+        (first_right, first_wrong), (second_right, second_wrong) = self.options
+        self.assertEqual(quiz.questions_count, 2)
+        self.assertEqual(quiz.grade([self.answer(first_right), self.answer(second_right)]), 2)
+        # Conta solo la prima risposta per domanda; le domande sconosciute sono ignorate
+        self.assertEqual(quiz.grade([
+            self.answer(first_wrong), self.answer(first_right), self.answer(second_right),
+            {'question_id': 0, 'option_id': first_right.id},
+        ]), 1)
+
+    def test_submit(self):
+        answers = {'answers': [self.answer(self.options[0][0]), self.answer(self.options[1][1])]}
+        self.assertEqual(self.client.post(self.url, answers, format='json').status_code, 400)
+
+        self.client.post(f'/api/quizzes/{self.quiz.id}/start/')
+        response = self.client.post(self.url, answers, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 1)
+        self.assertEqual(Profile.objects.get(user=self.user).points, 5)
+        # Il tentativo è concluso: un secondo invio non assegna altri punti
+        self.assertEqual(self.client.post(self.url, answers, format='json').status_code, 400)
+
+    def test_invalid_answers(self):
+        self.client.post(f'/api/quizzes/{self.quiz.id}/start/')
+        option = self.options[0][0]
+        for answers in (3, 'tutte', [3], [{'question_id': str(option.question_id), 'option_id': option.id}],
+                        [{'question_id': option.question_id}], [{'question_id': True, 'option_id': option.id}]):
+            response = self.client.post(self.url, {'answers': answers}, format='json')
+            self.assertEqual(response.status_code, 400, answers)
+        self.assertTrue(QuizAttempt.objects.filter(user=self.user, completed=False).exists())
+
+
+class ImageRenditionsTest(TestCase):
+    """Dopo il caricamento le immagini devono avere varianti ridimensionate"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGE_RENDITIONS={'SIZES': {'thumb': 160, 'small': 480}, 'FORMAT': 'JPEG', 'WORKERS': 0},
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.group = Group.objects.create(name='Verdi', creator=self.user)
+        GroupMembership.objects.create(user=self.user, group=self.group, role='ADMIN')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, size=(2000, 1500)):
+        output = BytesIO()
+        Image.new('RGB', size, 'green').save(output, 'JPEG')
+        return SimpleUploadedFile('foto.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_post_image_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title='Raccolta', content='...', author=self.user, group=self.group, image=self.upload()
+            )
+
+        post.refresh_from_db()
+        self.assertEqual(post.renditions['source'], post.image.name)
+        with default_storage.open(post.renditions['sizes']['thumb']) as thumb:
+            self.assertEqual(Image.open(thumb).size, (160, 120))
+
+        data = self.client.get(f'/api/posts/{post.id}/').data
+        self.assertEqual(set(data['image_renditions']), {'thumb', 'small'})
+        self.assertTrue(data['image_renditions']['small'].startswith('http://testserver/media/renditions/posts/'))
+
+    def test_replaced_image_removes_old_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title='Raccolta', content='...', author=self.user, group=self.group, image=self.upload()
+            )
+        post.refresh_from_db()
+        old = post.renditions['sizes']['thumb']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = self.upload((800, 800))
+            post.save()
+        post.refresh_from_db()
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(post.renditions['source'], post.image.name)
+
+
+class ScanImageDedupTest(TestCase):
+    """Le immagini di scansione già viste non devono essere salvate di nuovo"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITIONS={'WORKERS': 0})
+        self.settings_override.enable()
+        seen_images.reset()
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.object = RecognizedObject.objects.create(
+            name='Bottiglia', description='...', category='plastica', eco_impact='...',
+            recycling_info='...', sustainability_score=4
+        )
+        image = Image.new('RGB', (640, 480))
+        image.paste(Image.linear_gradient('L').resize((320, 480)).convert('RGB'), (0, 0))
+        self.image = image
+
+    def tearDown(self):
+        seen_images.reset()
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, size=None, quality=90):
+        output = BytesIO()
+        (self.image.resize(size) if size else self.image).save(output, 'JPEG', quality=quality)
+        return SimpleUploadedFile('foto.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def scan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/scans/', {'recognized_object': self.object.id, 'image': self.upload()}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201)
+        return ScanRecord.objects.get(id=response.data['id'])
+
+    def test_identical_images_share_file(self):
+        first, second = self.scan(), self.scan()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.name, f'scans/{first.image_sha256[:2]}/{first.image_sha256}.jpg')
+        self.assertEqual(second.renditions, first.renditions)
+        self.assertEqual(len(default_storage.listdir(f'scans/{first.image_sha256[:2]}')[1]), 1)
+
+    def test_lookup_finds_near_duplicates(self):
+        scan = self.scan()
+        response = self.client.post('/api/scans/lookup/', {'image': self.upload((320, 240), 60)}, format='multipart')
+        self.assertFalse(response.data['exact'])
+        self.assertEqual(response.data['matches'][0]['scan'], scan.id)
+        self.assertEqual(response.data['matches'][0]['recognized_object'], self.object.id)
+
+        response = self.client.post('/api/scans/lookup/', {'image': self.upload()}, format='multipart')
+        self.assertTrue(response.data['exact'])
+
+
+class RecognitionTest(TestCase):
+    """Il riconoscimento lato server deve restituire gli oggetti con l'immagine più simile"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.images = {
+            'Bottiglia': Image.linear_gradient('L').convert('RGB'),
+            'Lattina': Image.new('RGB', (256, 256), 'red'),
+            'Giornale': Image.radial_gradient('L').convert('RGB'),
+        }
+        for name, image in self.images.items():
+            RecognizedObject.objects.create(
+                name=name, description='...', category='...', eco_impact='...', recycling_info='...',
+                sustainability_score=5, image=self.upload(image)
+            )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, image):
+        output = BytesIO()
+        image.save(output, 'JPEG')
+        return SimpleUploadedFile('oggetto.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_match_image(self):
+        photo = self.images['Giornale'].resize((600, 600))
+        response = self.client.post('/api/objects/match/?k=2', {'image': self.upload(photo)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['object']['name'], 'Giornale')
+
+    def test_match_features(self):
+        response = self.client.post('/api/objects/match/', {'features': [1.0] * FEATURE_SIZE}, format='json')
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.post('/api/objects/match/', {'features': [1.0, 2.0]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class NearbyTest(TestCase):
+    """La ricerca per posizione legge solo i candidati più vicini dall'indice dei geohash"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        group = Group.objects.create(name='Gruppo', creator=self.user)
+        places = {
+            'Duomo': (45.4642, 9.1900),
+            'Brera': (45.4730, 9.1900),  # circa 1 km a nord
+            'Lambrate': (45.4840, 9.2380),  # circa 4,3 km
+            'Roma': (41.9028, 12.4964),
+        }
+        for title, (latitude, longitude) in places.items():
+            Post.objects.create(
+                title=title, content='...', author=self.user, group=group, latitude=latitude, longitude=longitude
+            )
+
+    def titles(self, query):
+        response = self.client.get(f'/api/posts/nearby/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data]
+
+    def test_radius(self):
+        response = self.client.get('/api/posts/nearby/?lat=45.4642&lon=9.19&radius=2000')
+        self.assertEqual([item['title'] for item in response.data], ['Duomo', 'Brera'])
+        self.assertAlmostEqual(response.data[1]['distance'], 978.5, delta=5)
+        self.assertEqual(self.titles('lat=45.4642&lon=9.19&radius=2000&limit=1'), ['Duomo'])
+        # Il raggio è limitato a MAX_NEARBY_RADIUS
+        self.assertEqual(self.titles('lat=45.4642&lon=9.19&radius=1000000'), ['Duomo', 'Brera', 'Lambrate'])
+
+    def test_bbox(self):
+        self.assertEqual(
+            sorted(self.titles('min_lat=45.4&min_lon=9.1&max_lat=45.5&max_lon=9.3')), ['Brera', 'Duomo', 'Lambrate']
+        )
+        self.assertEqual(self.titles('min_lat=45.4&min_lon=9.1&max_lat=45.5&max_lon=9.3&limit=1'), ['Lambrate'])
+        # Un rettangolo grande come il mondo viene ridotto intorno al centro
+        self.assertEqual(self.titles('min_lat=-90&min_lon=-180&max_lat=90&max_lon=180'), [])
+
+    def test_invalid_parameters(self):
+        for query in ('', 'lat=45&lon=9', 'lat=abc&lon=9&radius=10', 'lat=45&lon=9&radius=-5', 'lat=nan&lon=9&radius=10',
+                      'lat=200&lon=9&radius=10', 'min_lat=46&min_lon=9&max_lat=45&max_lon=10', 'min_lat=45&min_lon=9'):
+            response = self.client.get(f'/api/posts/nearby/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_prefix_range(self):
+        self.assertEqual(prefix_range('u0n'), ('u0n', 'u0p'))
+        self.assertEqual(prefix_range('u0z'), ('u0z', 'u1'))
+        self.assertEqual(prefix_range('zz'), ('zz', None))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class HeatmapTest(TestCase):
+    """Le scansioni si contano per tile e categoria; le tile calcolate restano in cache"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        objects = {
+            category: RecognizedObject.objects.create(
+                name=category, description='...', category=category, eco_impact='...', recycling_info='...',
+                sustainability_score=4
+            )
+            for category in ('plastica', 'carta')
+        }
+        for category, latitude, longitude in (
+            ('plastica', 45.4642, 9.1900), ('plastica', 45.4650, 9.1910), ('carta', 45.4730, 9.1900),
+            ('plastica', 41.9028, 12.4964),
+        ):
+            # Un'immagine già salvata: nessuna elaborazione del file
+            ScanRecord.objects.create(
+                user=self.user, recognized_object=objects[category], image='scans/foto.jpg',
+                latitude=latitude, longitude=longitude
+            )
+
+    def test_bin_scans(self):
+        tiles = bin_scans([45.0, 46.0, -30.0], [9.0, 10.0, -60.0], ['plastica', 'carta', 'plastica'], zoom=1)
+        self.assertEqual(tiles, {(1, 0): {'plastica': 1, 'carta': 1}, (0, 1): {'plastica': 1}})
+
+    def test_counts_per_tile(self):
+        url = '/api/scans/heatmap/?zoom=10&min_lat=45.4&min_lon=9.1&max_lat=45.5&max_lon=9.3'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        x, y = tile_for(45.4642, 9.19, 10)
+        self.assertEqual(
+            response.data['tiles'], [{'x': x, 'y': y, 'total': 3, 'categories': {'plastica': 2, 'carta': 1}}]
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, response.data)
+
+    def test_invalid_parameters(self):
+        for query in ('min_lat=45&min_lon=9&max_lat=46&max_lon=10', 'zoom=x&min_lat=45&min_lon=9&max_lat=46&max_lon=10',
+                      'zoom=19&min_lat=45&min_lon=9&max_lat=46&max_lon=10',
+                      'zoom=1&min_lat=-80&min_lon=-180&max_lat=80&max_lon=180',
+                      'zoom=9&min_lat=45&min_lon=9&max_lat=46&max_lon=10',
+                      'zoom=18&min_lat=-80&min_lon=-180&max_lat=80&max_lon=180'):
+            with self.assertNumQueries(0):
+                response = self.client.get(f'/api/scans/heatmap/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class SearchIndexTest(TestCase):
+    """La ricerca deve usare l'indice invertito, con termini italiani normalizzati e risultati ordinati"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for barcode, name, description in (
+            ('1', 'Bottiglia in plastica riciclata', "Bottiglia per l'acqua"),
+            ('2', 'Sacchetto compostabile', 'Sostituisce le buste di plastica'),
+            ('3', 'Borraccia in acciaio', 'Alternativa riutilizzabile alle bottiglie'),
+        ):
+            Product.objects.create(
+                barcode=barcode, name=name, description=description, sustainability_score=7, eco_info='...'
+            )
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Dell'acqua nelle BOTTIGLIE"), tokenize('acqua bottiglia'))
+        self.assertEqual(tokenize('plastiche riciclabili'), tokenize('plastica riciclabile'))
+        self.assertEqual(tokenize('Sostenibilità'), tokenize('sostenibilita'))
+
+    def test_ranked_search(self):
+        self.assertEqual(
+            self.names('/api/products/?search=bottiglie'),
+            ['Bottiglia in plastica riciclata', 'Borraccia in acciaio']
+        )
+        self.assertEqual(self.names('/api/products/?search=plastiche')[0], 'Bottiglia in plastica riciclata')
+        self.assertEqual(self.names('/api/products/?search=vetro'), [])
+
+    def test_index_follows_changes(self):
+        product = Product.objects.get(barcode='2')
+        product.name = 'Sacchetto in carta'
+        product.save()
+        self.assertEqual(self.names('/api/products/?search=carta'), ['Sacchetto in carta'])
+        product.delete()
+        self.assertEqual(self.names('/api/products/?search=carta'), [])
+
+    def test_partial_barcode(self):
+        for barcode, name in (('8001097047991', 'Acqua Naturale Bio'), ('8001097047992', 'Acqua Frizzante Bio'),
+                              ('8005000000001', 'Patatine')):
+            Product.objects.create(barcode=barcode, name=name, description='...', sustainability_score=7, eco_info='...')
+        self.assertEqual(sorted(self.names('/api/products/?search=800109704799')), ['Acqua Frizzante Bio', 'Acqua Naturale Bio'])
+        self.assertEqual(self.names('/api/products/?search=8001097047992'), ['Acqua Frizzante Bio'])
+        self.assertEqual(self.names('/api/products/?search=9001'), [])
+
+    def test_post_search(self):
+        group = Group.objects.create(name='Riciclo creativo', creator=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='ADMIN')
+        Post.objects.create(title='Lampade dalle bottiglie', content='...', author=self.user, group=group)
+        Post.objects.create(title='Pulizia del parco', content='Abbiamo raccolto bottiglie', author=self.user, group=group)
+        response = self.client.get('/api/posts/?search=bottiglia')
+        self.assertEqual([post['title'] for post in response.data['results']], ['Lampade dalle bottiglie', 'Pulizia del parco'])
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.names('/api/groups/?search=creativi'), ['Riciclo creativo'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AutocompleteTest(TestCase):
+    """I suggerimenti devono arrivare dall'indice in memoria, senza query al database"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        for barcode, name in (('8001', 'Acqua Naturale Bio'), ('8002', 'Acqua Frizzante'), ('9003', 'Caffè Equo')):
+            Product.objects.create(barcode=barcode, name=name, description='...', sustainability_score=7, eco_info='...')
+        ProductScan.objects.create(user=self.user, product=Product.objects.get(barcode='8002'))
+
+    def suggest(self, query):
+        return [item['name'] for item in self.client.get(f'/api/products/autocomplete/?q={query}').data]
+
+    def test_suggestions(self):
+        # I prodotti più scansionati vengono prima
+        self.assertEqual(self.suggest('acq'), ['Acqua Frizzante', 'Acqua Naturale Bio'])
+        self.assertEqual(self.suggest('bio'), ['Acqua Naturale Bio'])
+        self.assertEqual(self.suggest('caffe'), ['Caffè Equo'])
+        self.assertEqual(self.suggest('800'), ['Acqua Frizzante', 'Acqua Naturale Bio'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('ACQUA N'), ['Acqua Naturale Bio'])
+
+    def test_rebuilt_on_catalog_change(self):
+        self.suggest('acq')
+        Product.objects.create(barcode='8004', name='Acqua Tonica', description='...', sustainability_score=5, eco_info='...')
+        self.assertIn('Acqua Tonica', self.suggest('acqua t'))
+
+
+class HomeFeedTest(TestCase):
+    """Il feed deve unire le timeline materializzate e i post dei gruppi grandi"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.other = User.objects.create_user('luigi', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.small = Group.objects.create(name='Quartiere', creator=self.other)
+        self.large = Group.objects.create(name='Italia', creator=self.other)
+        self.hidden = Group.objects.create(name='Privato', creator=self.other)
+        for group in (self.small, self.large, self.hidden):
+            GroupMembership.objects.create(user=self.other, group=group, role='ADMIN')
+        GroupMembership.objects.create(user=self.user, group=self.small, role='MEMBER')
+        GroupMembership.objects.create(user=self.user, group=self.large, role='MEMBER')
+        Group.objects.filter(id=self.large.id).update(fanout_on_read=True)
+
+    def publish(self, group, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(title=title, content='...', author=self.other, group=group)
+
+    def test_feed_pages(self):
+        titles = []
+        for i in range(6):
+            for group in (self.small, self.large, self.hidden):
+                titles.append((group, self.publish(group, f'{group.name} {i}').title))
+        self.assertFalse(TimelineEntry.objects.filter(group=self.large).exists())
+
+        expected = [title for group, title in reversed(titles) if group != self.hidden]
+        url, received = '/api/posts/feed/?page_size=5', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            received += [post['title'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(received, expected)
+
+    def test_membership_changes(self):
+        self.publish(self.hidden, 'Benvenuto')
+        GroupMembership.objects.create(user=self.user, group=self.hidden, role='MEMBER')
+        self.assertEqual(self.client.get('/api/posts/feed/').data['results'][0]['title'], 'Benvenuto')
+
+        GroupMembership.objects.get(user=self.user, group=self.hidden).delete()
+        self.assertEqual(self.client.get('/api/posts/feed/').data['results'], [])
+
+    def test_large_group_switches_to_fanout_on_read(self):
+        with mock.patch.object(feed, 'FANOUT_LIMIT', 2):
+            GroupMembership.objects.create(user=User.objects.create_user('anna'), group=self.small, role='MEMBER')
+        self.assertTrue(Group.objects.get(id=self.small.id).fanout_on_read)
+
+
+class ScanStatisticsTest(TestCase):
+    """Le statistiche si leggono dai contatori aggiornati a ogni scansione e riconciliati dal comando"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.water = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+        self.chips = Product.objects.create(
+            barcode='8001097047992', name='Patatine', description='...', sustainability_score=3, eco_info='...'
+        )
+        self.bottle = RecognizedObject.objects.create(
+            name='Bottiglia', category='plastica', description='...', eco_impact='...', recycling_info='...',
+            sustainability_score=4
+        )
+
+    def test_counters_follow_scans(self):
+        self.client.post(f'/api/products/{self.water.id}/scan/')
+        self.client.post('/api/scans/batch/', {'product_scans': [
+            {'client_id': 'a', 'product': self.chips.id}, {'client_id': 'b', 'product': self.water.id},
+        ]}, format='json')
+        record_scans(self.user, object_ids=[self.bottle.id, self.bottle.id])
+
+        with self.assertNumQueries(3):
+            mine = self.client.get('/api/stats/me/').data
+        self.assertEqual(mine['products']['scans'], 3)
+        self.assertEqual(mine['products']['average_score'], 6.33)
+        self.assertEqual(mine['categories'], [{'category': 'plastica', 'scans': 2, 'average_score': 4.0}])
+
+        overall = self.client.get('/api/stats/', {'month': 'all'}).data
+        self.assertEqual([(p['name'], p['scans']) for p in overall['products']], [('Acqua Naturale Bio', 2), ('Patatine', 1)])
+        self.assertEqual(overall['objects'][0]['scans'], 2)
+        self.assertEqual(self.client.get('/api/stats/', {'month': '2020-13'}).status_code, 400)
+
+    def test_reconcile_fixes_drift(self):
+        self.client.post(f'/api/products/{self.water.id}/scan/')
+        # Scansione registrata senza passare dai contatori e contatore senza scansioni
+        ProductScan.objects.create(user=self.user, product=self.chips)
+        record_scans(self.user, object_ids=[self.bottle.id])
+
+        water = ScanStatistic.objects.get(scope='PRODUCT', key=str(self.water.id))
+
+        self.assertEqual(reconcile(), (3, 2))
+        self.assertEqual(reconcile(), (0, 0))
+        self.assertEqual(
+            set(ScanStatistic.objects.values_list('key', 'scans')), {(str(self.water.id), 1), (str(self.chips.id), 1)}
+        )
+        # Solo le differenze: i contatori corretti non vengono riscritti
+        self.assertEqual(ScanStatistic.objects.get(scope='PRODUCT', key=str(self.water.id)).pk, water.pk)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardTest(TestCase):
+    """La dashboard usa un numero fisso di query, resta in cache e si aggiorna alla nuova attività"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+        self.url = f'/api/users/{self.user.id}/dashboard/'
+
+    def test_dashboard(self):
+        for _ in range(3):
+            self.client.post(f'/api/products/{self.product.id}/scan/')
+        group = Group.objects.create(name='Quartiere', creator=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='ADMIN')
+
+        with self.assertNumQueries(5):
+            data = self.client.get(self.url).data
+        self.assertEqual(data['points'], 6)
+        self.assertEqual(data['points_by_source'], {'PRODUCT_SCAN': 6})
+        self.assertEqual((data['counts']['product_scans'], data['counts']['groups']), (3, 1))
+        self.assertEqual(data['products_average_score'], 8.0)
+        self.assertEqual(data['streak']['current'], 1)
+
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/products/{self.product.id}/scan/')
+        self.assertEqual(self.client.get(self.url).data['counts']['product_scans'], 4)
+
+
+class StreakTest(TestCase):
+    """La serie si aggiorna con un UPDATE per evento e il ricalcolo dallo storico dà lo stesso risultato"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+
+    def streak(self):
+        profile = Profile.objects.get(user=self.user)
+        return profile.last_active_day, profile.current_streak, profile.best_streak
+
+    def test_record_activity(self):
+        today = timezone.localdate()
+        days = [today - timedelta(days=n) for n in (6, 5, 5, 4, 2, 1, 0)]
+        for day in days:
+            with self.assertNumQueries(1):
+                record_activity(self.user, day)
+        self.assertEqual(self.streak(), (today, 3, 3))
+
+        # Le stesse attività registrate come scansioni di prodotti in quei giorni
+        for day in days:
+            scan = ProductScan.objects.create(user=self.user, product=self.product)
+            moment = timezone.make_aware(datetime.combine(day, time(12)))
+            ProductScan.objects.filter(id=scan.id).update(created_at=moment)
+        Profile.objects.filter(user=self.user).update(current_streak=0, best_streak=0, last_active_day=None)
+        self.assertEqual(rebuild_streaks(), 1)
+        self.assertEqual(self.streak(), (today, 3, 3))
+
+    def test_best_streak_on_consecutive_days(self):
+        today = timezone.localdate()
+        for n in range(4, -1, -1):
+            with CaptureQueriesContext(connection) as queries:
+                record_activity(self.user, today - timedelta(days=n))
+            self.assertEqual(self.streak(), (today - timedelta(days=n), 5 - n, 5 - n))
+        # Con MySQL le assegnazioni sono valutate in ordine: best_streak deve leggere current_streak non ancora modificato
+        sql = queries[0]['sql']
+        self.assertLess(sql.index('"best_streak" ='), sql.index('"current_streak" ='))
+
+    def test_scan_updates_streak(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(f'/api/products/{self.product.id}/scan/')
+        client.post(f'/api/products/{self.product.id}/scan/')
+        self.assertEqual(self.streak(), (timezone.localdate(), 1, 1))
+        self.assertEqual(client.get(f'/api/users/{self.user.id}/profile/').data['streak']['current'], 1)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_streak_change_invalidates_dashboard(self):
+        before = dashboard.generation(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            record_activity(self.user)
+        after = dashboard.generation(self.user.id)
+        self.assertNotEqual(after, before)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            record_activity(self.user)
+        self.assertEqual(callbacks, [])
+
+    def test_profile_update_keeps_streak(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        profile = Profile.objects.get(user=self.user)
+        record_activity(self.user)
+        response = client.patch(f'/api/profiles/{profile.id}/', {'bio': '...'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.streak(), (timezone.localdate(), 1, 1))
+
+    def test_rebuild_writes_only_changed_profiles_in_batches(self):
+        other = User.objects.create_user('anna', password='password')
+        idle = User.objects.create_user('luca', password='password')
+        for user in (self.user, other):
+            ProductScan.objects.create(user=user, product=self.product)
+        record_activity(self.user)
+        # Serie rimasta dopo la cancellazione delle attività
+        Profile.objects.filter(user=idle).update(last_active_day=timezone.localdate(), current_streak=4, best_streak=4)
+
+        self.assertEqual(rebuild_streaks(batch_size=1), 2)
+        self.assertEqual(
+            list(Profile.objects.order_by('user_id').values_list('current_streak', 'best_streak')),
+            [(1, 1), (1, 1), (0, 0)]
+        )
+        self.assertEqual(rebuild_streaks(batch_size=1), 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BadgeThresholdsTest(TestCase):
+    """I badge a punti si assegnano con un numero fisso di query, qualunque sia il numero di badge"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.badges = [
+            Badge.objects.create(name=f'Livello {i}', description='...', points_required=i * 10) for i in range(1, 41)
+        ]
+        # I badge con criteri non dipendono dai punti
+        criteria_badge = Badge.objects.create(name='Eco-Detective', description='...', points_required=0)
+        BadgeCriterion.objects.create(badge=criteria_badge, event='SCAN', threshold=2)
+
+    def ids(self, badges):
+        return [badge.id for badge in badges]
+
+    def test_qualifying_thresholds(self):
+        self.assertEqual(thresholds.qualifying(5), [])
+        self.assertEqual(thresholds.qualifying(25), self.ids(self.badges[:2]))
+        # La soglia raggiunta esattamente conta
+        self.assertEqual(thresholds.qualifying(30), self.ids(self.badges[:3]))
+        self.assertEqual(thresholds.qualifying(10_000), self.ids(self.badges))
+
+    def test_new_badges_reload_thresholds(self):
+        thresholds.qualifying(0)
+        extra = Badge.objects.create(name='Principiante', description='...', points_required=5)
+        self.assertEqual(thresholds.qualifying(5), [extra.id])
+
+    def test_award_badges_with_fixed_queries(self):
+        thresholds.qualifying(0)
+
+        # Più soglie superate insieme: una lettura dei badge posseduti e un solo INSERT
+        with self.assertNumQueries(2):
+            self.assertEqual(award_badges(self.user, 250), self.ids(self.badges[:25]))
+        with self.assertNumQueries(2):
+            self.assertEqual(award_badges(self.user, 400), self.ids(self.badges[25:]))
+
+        # Nessun badge viene assegnato due volte
+        with self.assertNumQueries(1):
+            self.assertEqual(award_badges(self.user, 400), [])
+        self.assertEqual(
+            sorted(UserBadge.objects.filter(user=self.user).values_list('badge_id', flat=True)), self.ids(self.badges)
+        )
+
+
+class BadgeCriteriaTest(TestCase):
+    """I badge con criteri si valutano sui contatori, solo per gli eventi a cui sono iscritti"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+        self.badge = Badge.objects.create(name='Eco-Detective', description='...', icon='badges/a.png')
+        BadgeCriterion.objects.create(badge=self.badge, event='SCAN', category='plastica', threshold=2)
+        BadgeCriterion.objects.create(badge=self.badge, event='PRODUCT_SCAN', threshold=3, window_days=7)
+
+    def test_badge_awarded_when_all_criteria_are_met(self):
+        record_events(self.user, {('SCAN', 'plastica'): 2, ('SCAN', 'carta'): 1})
+        for _ in range(2):
+            self.client.post(f'/api/products/{self.product.id}/scan/')
+        self.assertFalse(UserBadge.objects.filter(user=self.user).exists())
+
+        # Le scansioni fuori dalla finestra non contano
+        ActivityCounter.objects.create(
+            user=self.user, event='PRODUCT_SCAN', day=timezone.localdate() - timedelta(days=10), count=5
+        )
+        record_events(self.user, {('SCAN', 'plastica'): 1})
+        self.assertFalse(UserBadge.objects.filter(user=self.user).exists())
+
+        self.client.post(f'/api/products/{self.product.id}/scan/')
+        self.assertTrue(UserBadge.objects.filter(user=self.user, badge=self.badge).exists())
+        self.assertEqual(ActivityCounter.objects.get(user=self.user, event='SCAN', category='', day=ActivityCounter.TOTAL).count, 4)
+
+    def test_unsubscribed_events_skip_evaluation(self):
+        record_events(self.user, {('QUIZ_ANSWER', ''): 4})
+        with self.assertNumQueries(3):
+            # Solo l'UPDATE del contatore nel suo savepoint: nessuna lettura di badge o contatori
+            record_events(self.user, {('QUIZ_ANSWER', ''): 4})
+
+    def test_points_do_not_award_criteria_badges(self):
+        # points_required è 0, ma i criteri sulle scansioni di plastica non sono soddisfatti
+        for _ in range(3):
+            self.client.post(f'/api/products/{self.product.id}/scan/')
+        self.assertFalse(UserBadge.objects.filter(user=self.user).exists())
+
+    def test_seeding_adds_criteria_to_existing_badges(self):
+        guardian = Badge.objects.create(name='Green Guardian', description='...', points_required=100)
+        call_command('create_initial_data', stdout=StringIO())
+        self.assertEqual(list(guardian.criteria.values_list('event', 'threshold')), [('CHALLENGE', 5)])
+        # I criteri già configurati non vengono toccati
+        self.assertEqual(self.badge.criteria.count(), 2)
+
+    def test_rebuild_counters_from_history(self):
+        for _ in range(3):
+            self.client.post(f'/api/products/{self.product.id}/scan/')
+        expected = set(ActivityCounter.objects.values_list('event', 'category', 'day', 'count'))
+        self.assertEqual(rebuild_counters(), 0)
+
+        # Un contatore in deriva, uno mancante e uno senza storico
+        drifted = ActivityCounter.objects.get(event='PRODUCT_SCAN', day=ActivityCounter.TOTAL)
+        ActivityCounter.objects.filter(pk=drifted.pk).update(count=10)
+        ActivityCounter.objects.filter(event='PRODUCT_SCAN', day=timezone.localdate()).delete()
+        ActivityCounter.objects.create(user=self.user, event='POST', count=2)
+        self.assertEqual(rebuild_counters(), 3)
+        self.assertEqual(set(ActivityCounter.objects.values_list('event', 'category', 'day', 'count')), expected)
+        # I contatori corretti vengono aggiornati, non cancellati e ricreati
+        self.assertTrue(ActivityCounter.objects.filter(pk=drifted.pk, count=3).exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncEndpointsTest(TestCase):
+    """Le versioni asincrone degli endpoint restituiscono gli stessi dati di quelle sincrone"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mario', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.token = str(AccessToken.for_user(self.user))
+        Product.objects.create(
+            barcode='8001097047991', name='Acqua Naturale Bio', description='...', sustainability_score=8, eco_info='...'
+        )
+        group = Group.objects.create(name='Quartiere', creator=self.user)
+        GroupMembership.objects.create(user=self.user, group=group, role='ADMIN')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Post.objects.create(title=f'Post {i}', content='...', author=self.user, group=group)
+        leaderboards.reset()
+
+    def get(self, path, token=None):
+        # In Django 4.1 AsyncClient passa gli argomenti extra così come sono, come header ASGI
+        return self.async_client.get(path, AUTHORIZATION=f'Bearer {token or self.token}')
+
+    async def test_same_payloads(self):
+        for sync_path, async_path in [
+            ('/api/products/by_barcode/?barcode=8001097047991', '/api/async/products/by_barcode/?barcode=8001097047991'),
+            ('/api/products/by_barcode/?barcode=0', '/api/async/products/by_barcode/?barcode=0'),
+            ('/api/posts/feed/?page_size=2', '/api/async/posts/feed/?page_size=2'),
+            ('/api/leaderboard/', '/api/async/leaderboard/'),
+        ]:
+            expected = await sync_to_async(self.client.get)(sync_path)
+            response = await self.get(async_path)
+            self.assertEqual(response.status_code, expected.status_code)
+            data, expected = response.json(), expected.json()
+            if data.get('next'):
+                # Il cursore è lo stesso, cambia solo il percorso
+                self.assertEqual(data.pop('next').replace('/async', ''), expected.pop('next'))
+            self.assertEqual(data, expected)
+
+    def test_static_files_served_from_static_root(self):
+        from backend_happygreen.asgi import application
+        # L'applicazione esportata è quella di Django, senza l'handler statico di sviluppo
+        self.assertIs(type(application), ASGIHandler)
+
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root, ignore_errors=True)
+        with override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = Client().get('/static/admin/css/base.css')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.get('/api/async/leaderboard/', token='invalid')
+        self.assertEqual(response.status_code, 401)
@@ -1,14 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
 router.register(r'profiles', views.ProfileViewSet)
+router.register(r'leaderboard', views.LeaderboardViewSet, basename='leaderboard')
+router.register(r'stats', views.StatsViewSet, basename='stats')
 router.register(r'groups', views.GroupViewSet)
 router.register(r'posts', views.PostViewSet)
 router.register(r'comments', views.CommentViewSet)
+router.register(r'scans', views.ScanRecordViewSet)
 router.register(r'badges', views.BadgeViewSet)
+router.register(r'quizzes', views.QuizViewSet)
 router.register(r'user-badges', views.BadgeViewSet)
 router.register(r'challenges', views.ChallengeViewSet)
 router.register(r'user-challenges', views.ChallengeViewSet)
@@ -17,4 +21,8 @@ router.register(r'objects', views.RecognizedObjectViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Versioni asincrone degli endpoint di sola lettura più usati, per il deploy ASGI
+    path('async/products/by_barcode/', async_views.product_by_barcode, name='async-product-by-barcode'),
+    path('async/posts/feed/', async_views.feed, name='async-post-feed'),
+    path('async/leaderboard/', async_views.leaderboard, name='async-leaderboard'),
 ]
\ No newline at end of file
@@ -1,13 +1,20 @@
+import math
+
+import numpy as np
+
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Q, Count, ExpressionWrapper, F, FloatField, Prefetch
 from django.utils import timezone
 from .models import (
     Profile, Badge, UserBadge, Group, GroupMembership, Post, Comment,
-    RecognizedObject, ScanRecord, Quiz, QuizQuestion, QuizOption,
+    RecognizedObject, ScanRecord, Quiz,
     QuizAttempt, Challenge, ChallengeParticipation, Product, ProductScan
 )
 from .serializers import (
@@ -16,12 +23,142 @@ from .serializers import (
     PostSerializer, PostDetailSerializer, CommentSerializer,
     RecognizedObjectSerializer, ScanRecordSerializer, QuizSerializer,
     QuizDetailSerializer, QuizAttemptSerializer, ChallengeSerializer,
-    ChallengeParticipationSerializer, ProductSerializer, ProductScanSerializer, GroupMembershipSerializer
+    ChallengeParticipationSerializer, ProductSerializer, ProductScanSerializer, GroupMembershipSerializer,
+    ScanBatchSerializer
 )
 from .permissions import IsOwnerOrReadOnly, IsGroupMember, IsGroupAdmin
+from .badges import award_badges, record_events
+from .points import award_points, SCAN_POINTS, PRODUCT_SCAN_POINTS
+from .cache import catalog_cache
+from .dashboard import dashboard, activity
+from .pagination import BoundedPageNumberPagination, CreatedAtCursorPagination, MAX_PAGE_SIZE
+from .quizzes import get_compiled_quiz, valid_answers
+from .ingestion import ingest_scans
+from .exports import EXPORTS, export_rows, export_fields, ndjson_lines, csv_lines
+from .autocomplete import product_suggestions, object_suggestions
+from .leaderboard import leaderboards, standings, WINDOWS as LEADERBOARD_WINDOWS
+from .dedup import find_seen
+from .features import image_features, FEATURE_SIZE
+from .feed import home_feed, encode_cursor, decode_cursor
+from .geo import covering_prefixes, prefix_filter, clamp_bbox, radius_bbox, distance
+from .heatmap import heatmap, MIN_ZOOM as HEATMAP_MIN_ZOOM, MAX_ZOOM as HEATMAP_MAX_ZOOM
+from .recognition import matcher, MAX_MATCHES
+from .search import IndexedSearchFilter
+from .stats import record_scans, global_summary, user_summary, parse_month
+from .streaks import record_activity
+
+
+def post_queryset():
+    return Post.objects.select_related('author', 'group').annotate(comments_count=Count('comments'))
+
+
+def group_queryset():
+    # Newest first, with id as tie-breaker so that pages are stable
+    return Group.objects.select_related('creator').annotate(members_count=Count('members')).order_by('-created_at', '-id')
+
+
+# Raggio massimo in metri accettato da /nearby/
+MAX_NEARBY_RADIUS = 10000
+# Lato massimo in gradi del rettangolo accettato da /nearby/
+MAX_NEARBY_BBOX = 1.0
+
+
+def query_limit(request):
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        limit = 10
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+class PaginatedActionMixin:
+    """Pagina i risultati delle @action che restituiscono elenchi"""
+
+    def paginated_response(self, queryset, serializer_class, pagination_class=None):
+        paginator = pagination_class() if pagination_class else self.paginator
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class NearbyMixin:
+    """Ricerca per posizione: raggio intorno a un punto o rettangolo della mappa"""
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        # ?lat=&lon=&radius=<meters> or ?min_lat=&min_lon=&max_lat=&max_lon=, plus optional limit
+        params = request.query_params
+        try:
+            if 'radius' in params:
+                latitude, longitude, radius = (float(params[key]) for key in ('lat', 'lon', 'radius'))
+                # Chained comparisons are also False for NaN
+                valid = -90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius
+            else:
+                latitude = longitude = radius = None
+                bbox = tuple(float(params[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon'))
+                min_lat, min_lon, max_lat, max_lon = bbox
+                valid = -90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180
+        except (KeyError, ValueError):
+            valid = False
+        if not valid:
+            return Response(
+                {"detail": "Provide lat, lon and radius or min_lat, min_lon, max_lat and max_lon"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if radius is None:
+            bbox = clamp_bbox(*bbox, MAX_NEARBY_BBOX)
+        else:
+            radius = min(radius, MAX_NEARBY_RADIUS)
+            bbox = radius_bbox(latitude, longitude, radius)
+        min_lat, min_lon, max_lat, max_lon = bbox
+        # Geohash prefixes narrow the search through the index, the bounding box and distance are exact
+        queryset = self.get_queryset().filter(prefix_filter(covering_prefixes(*bbox))).filter(
+            latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon)
+        )
+
+        limit = query_limit(request)
+        if radius is None:
+            objects = list(queryset.order_by('-created_at')[:limit])
+        else:
+            # The database picks the nearest rows by equirectangular distance, which within
+            # MAX_NEARBY_RADIUS orders like the exact one; only those rows are loaded
+            d_lat = F('latitude') - latitude
+            d_lon = (F('longitude') - longitude) * math.cos(math.radians(latitude))
+            candidates = queryset.annotate(
+                approximate_distance=ExpressionWrapper(d_lat * d_lat + d_lon * d_lon, output_field=FloatField())
+            ).order_by('approximate_distance', 'id')[:limit]
+            objects = []
+            for obj in candidates:
+                obj.distance = distance(latitude, longitude, obj.latitude, obj.longitude)
+                if obj.distance <= radius:
+                    objects.append(obj)
+            objects.sort(key=lambda obj: obj.distance)
+
+        serializer = self.get_serializer(objects, many=True)
+        data = serializer.data
+        if radius is not None:
+            for item, obj in zip(data, objects):
+                item['distance'] = round(obj.distance, 1)
+        return Response(data)
+
+
+class CatalogCacheMixin:
+    """Serve list e retrieve dalla cache di catalogo, le scritture passano dal database"""
+    catalog_name = None
+
+    def cached_response(self, request, loader):
+        data = catalog_cache.get_or_set(self.catalog_name, request.build_absolute_uri(), loader)
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs).data)
+
+
+class UserViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -45,40 +182,95 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = ProfileSerializer(profile)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, pk=None):
+        # Totals for the profile screen in one bounded response, cached until the user's next activity
+        return Response(dashboard(self.get_object()))
+
     @action(detail=True, methods=['get'])
     def badges(self, request, pk=None):
         user = self.get_object()
-        badges = UserBadge.objects.filter(user=user)
-        serializer = UserBadgeSerializer(badges, many=True)
-        return Response(serializer.data)
+        badges = UserBadge.objects.filter(user=user).select_related('user', 'badge').order_by('-earned_at', '-id')
+        return self.paginated_response(badges, UserBadgeSerializer)
 
     @action(detail=True, methods=['get'])
     def groups(self, request, pk=None):
         user = self.get_object()
-        groups = Group.objects.filter(members=user)
-        serializer = GroupSerializer(groups, many=True)
-        return Response(serializer.data)
+        groups = group_queryset().filter(members=user)
+        return self.paginated_response(groups, GroupSerializer)
 
     @action(detail=True, methods=['get'])
     def posts(self, request, pk=None):
         user = self.get_object()
-        posts = Post.objects.filter(author=user)
-        serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data)
+        posts = post_queryset().filter(author=user)
+        return self.paginated_response(posts, PostSerializer, CreatedAtCursorPagination)
 
     @action(detail=True, methods=['get'])
     def scans(self, request, pk=None):
         user = self.get_object()
-        scans = ScanRecord.objects.filter(user=user)
-        serializer = ScanRecordSerializer(scans, many=True)
-        return Response(serializer.data)
+        scans = ScanRecord.objects.filter(user=user).select_related('user', 'recognized_object')
+        return self.paginated_response(scans, ScanRecordSerializer, CreatedAtCursorPagination)
 
     @action(detail=True, methods=['get'])
     def product_scans(self, request, pk=None):
         user = self.get_object()
-        product_scans = ProductScan.objects.filter(user=user)
-        serializer = ProductScanSerializer(product_scans, many=True)
-        return Response(serializer.data)
+        product_scans = ProductScan.objects.filter(user=user).select_related('user', 'product')
+        return self.paginated_response(product_scans, ProductScanSerializer, CreatedAtCursorPagination)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        # Streams the whole history as NDJSON or CSV: ?type=scans|product_scans|quiz_attempts|challenges&output=ndjson|csv
+        user = self.get_object()
+        if user != request.user and not request.user.is_staff:
+            return Response({"detail": "You can only export your own history"}, status=status.HTTP_403_FORBIDDEN)
+
+        export_type = request.query_params.get('type', 'scans')
+        output = request.query_params.get('output', 'ndjson')
+        if export_type not in EXPORTS or output not in ('ndjson', 'csv'):
+            return Response({"detail": "Invalid export type or output"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = export_rows(user, export_type)
+        if output == 'csv':
+            response = StreamingHttpResponse(csv_lines(export_fields(export_type), rows), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{export_type}.{output}"'
+        return response
+
+
+class LeaderboardViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        # ?period=all (lifetime points), week or month (rolling windows)
+        period = request.query_params.get('period', 'all')
+        if period == 'all':
+            board = leaderboards.global_board()
+        elif period in LEADERBOARD_WINDOWS:
+            board = leaderboards.window_board(period)
+        else:
+            return Response({"detail": "Invalid period"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(standings(board, request.user, query_limit(request)))
+
+
+class StatsViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    # Both endpoints read the precomputed monthly counters: ?month=YYYY-MM (default current) or all
+    def list(self, request):
+        try:
+            month = parse_month(request.query_params.get('month'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'month': month, **global_summary(month)})
+
+    @action(detail=False, methods=['get'])
+    def me(self, request):
+        try:
+            month = parse_month(request.query_params.get('month'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'month': month, **user_summary(request.user, month)})
 
 
 class ProfileViewSet(viewsets.ModelViewSet):
@@ -92,7 +284,8 @@ class ProfileViewSet(viewsets.ModelViewSet):
         return Profile.objects.filter(user=self.request.user)
 
 
-class BadgeViewSet(viewsets.ModelViewSet):
+class BadgeViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_name = 'badge'
     queryset = Badge.objects.all()
     serializer_class = BadgeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -110,21 +303,27 @@ class BadgeViewSet(viewsets.ModelViewSet):
         user_badge = UserBadge.objects.create(user=user, badge=badge)
 
         # Update user points
-        profile = Profile.objects.get(user=user)
-        profile.points += badge.points_required
-        profile.save()
+        award_points(user, badge.points_required, 'BADGE')
 
         serializer = UserBadgeSerializer(user_badge)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [IndexedSearchFilter]
     search_fields = ['name', 'description']
 
+    def get_queryset(self):
+        queryset = group_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('groupmembership_set', queryset=GroupMembership.objects.select_related('user'))
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return GroupDetailSerializer
@@ -171,22 +370,44 @@ class GroupViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def members(self, request, pk=None):
         group = self.get_object()
-        memberships = GroupMembership.objects.filter(group=group)
-        serializer = GroupMembershipSerializer(memberships, many=True)
-        return Response(serializer.data)
+        memberships = GroupMembership.objects.filter(group=group).select_related('user').order_by('joined_at', 'id')
+        return self.paginated_response(memberships, GroupMembershipSerializer)
+
+    @action(detail=True, methods=['get'])
+    def leaderboard(self, request, pk=None):
+        group = self.get_object()
+        board = leaderboards.group_board(group.id)
+        return Response(standings(board, request.user, query_limit(request)))
 
     @action(detail=True, methods=['get'])
     def posts(self, request, pk=None):
         group = self.get_object()
-        posts = Post.objects.filter(group=group).order_by('-created_at')
-        serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data)
+        posts = post_queryset().filter(group=group)
+        return self.paginated_response(posts, PostSerializer, CreatedAtCursorPagination)
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(PaginatedActionMixin, NearbyMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated, IsGroupMember]
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [IndexedSearchFilter]
+    search_fields = ['title', 'content']
+
+    @property
+    def paginator(self):
+        # Search results are ordered by relevance, which the created_at cursor cannot page through
+        if not hasattr(self, '_paginator') and self.action == 'list' and self.request.query_params.get('search'):
+            self._paginator = BoundedPageNumberPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        queryset = post_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.select_related('author'))
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -195,6 +416,29 @@ class PostViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        record_events(self.request.user, {('POST', ''): 1})
+
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        # Home feed: posts of every group the user belongs to, newest first (?cursor=&page_size=)
+        try:
+            cursor = decode_cursor(request.query_params['cursor']) if 'cursor' in request.query_params else None
+        except ValueError:
+            return Response({"detail": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.query_params.get('page_size', CreatedAtCursorPagination.page_size))
+        except ValueError:
+            size = CreatedAtCursorPagination.page_size
+        size = max(1, min(size, MAX_PAGE_SIZE))
+
+        post_ids, next_position = home_feed(request.user, size, cursor)
+        posts = post_queryset().in_bulk(post_ids)
+        serializer = PostSerializer([posts[post_id] for post_id in post_ids if post_id in posts], many=True,
+                                    context=self.get_serializer_context())
+        next_url = None
+        if next_position is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(next_position))
+        return Response({'next': next_url, 'results': serializer.data})
 
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
@@ -217,73 +461,157 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         post = self.get_object()
-        comments = Comment.objects.filter(post=post).order_by('-created_at')
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        comments = Comment.objects.filter(post=post).select_related('author')
+        return self.paginated_response(comments, CommentSerializer)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = CreatedAtCursorPagination
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
 
-class RecognizedObjectViewSet(viewsets.ModelViewSet):
+class RecognizedObjectViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_name = 'object'
     queryset = RecognizedObject.objects.all()
     serializer_class = RecognizedObjectSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [IndexedSearchFilter]
     search_fields = ['name', 'category']
 
     @action(detail=False, methods=['get'])
     def categories(self, request):
-        categories = RecognizedObject.objects.values_list('category', flat=True).distinct()
-        return Response(list(categories))
+        categories = catalog_cache.get_or_set(
+            'object', 'categories',
+            lambda: list(RecognizedObject.objects.values_list('category', flat=True).distinct())
+        )
+        return Response(categories)
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        # Typeahead on names, served from the in-memory prefix index: ?q=&limit=
+        return Response(object_suggestions.suggest(request.query_params.get('q', ''), query_limit(request)))
 
-class ScanRecordViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def match(self, request):
+        # Server-side recognition: an uploaded "image" or a precomputed "features" vector, ?k= results
+        try:
+            k = min(max(int(request.query_params.get('k', 5)), 1), MAX_MATCHES)
+        except ValueError:
+            return Response({"detail": "k must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if 'image' in request.FILES:
+            vector = image_features(request.FILES['image'])
+            if vector is None:
+                return Response({"detail": "The uploaded file is not a valid image"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            try:
+                vector = np.asarray(request.data.get('features'), dtype=np.float32)
+            except (TypeError, ValueError):
+                vector = None
+            if vector is None or vector.shape != (FEATURE_SIZE,) or not np.isfinite(vector).all():
+                return Response(
+                    {"detail": f"Provide an image or a list of {FEATURE_SIZE} features"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        matches = matcher.match(vector, k)
+        objects = RecognizedObject.objects.in_bulk([object_id for object_id, _ in matches])
+        context = self.get_serializer_context()
+        return Response({'results': [
+            {'score': round(score, 4), 'object': RecognizedObjectSerializer(objects[object_id], context=context).data}
+            for object_id, score in matches
+            if object_id in objects
+        ]})
+
+
+class ScanRecordViewSet(NearbyMixin, viewsets.ModelViewSet):
     queryset = ScanRecord.objects.all()
     serializer_class = ScanRecordSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
+        queryset = ScanRecord.objects.select_related('user', 'recognized_object')
         if self.request.user.is_staff:
-            return ScanRecord.objects.all()
-        return ScanRecord.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         # Save the scan record
         scan = serializer.save(user=self.request.user)
+        record_scans(self.request.user, object_ids=[scan.recognized_object_id])
+        record_activity(self.request.user)
 
         # Update user points
-        profile = Profile.objects.get(user=self.request.user)
-        profile.points += 5  # Award 5 points for each scan
-        profile.save()
+        points = award_points(self.request.user, SCAN_POINTS, 'SCAN')
 
         # Check if user qualifies for any badge
-        self.check_for_badges(self.request.user)
+        award_badges(self.request.user, points)
+        record_events(self.request.user, {('SCAN', scan.recognized_object.category): 1})
 
         return scan
 
-    def check_for_badges(self, user):
-        # Get number of scans by user
-        scans_count = ScanRecord.objects.filter(user=user).count()
+    def perform_destroy(self, instance):
+        # Take the scan out of the counters of the month it was made in
+        record_scans(
+            instance.user, object_ids=[instance.recognized_object_id],
+            day=timezone.localdate(instance.created_at), sign=-1
+        )
+        instance.delete()
+        activity(instance.user_id)
 
-        # Get badges the user doesn't have yet
-        user_badges = UserBadge.objects.filter(user=user).values_list('badge_id', flat=True)
-        available_badges = Badge.objects.exclude(id__in=user_badges)
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        # Scan counts per map tile and object category: ?zoom=&min_lat=&min_lon=&max_lat=&max_lon=
+        try:
+            zoom = int(request.query_params['zoom'])
+            bbox = [float(request.query_params[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Provide zoom, min_lat, min_lon, max_lat and max_lon"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Below the minimum zoom a few tiles would cover whole countries and load every scan in them
+        if not HEATMAP_MIN_ZOOM <= zoom <= HEATMAP_MAX_ZOOM:
+            return Response(
+                {"detail": f"Zoom must be between {HEATMAP_MIN_ZOOM} and {HEATMAP_MAX_ZOOM}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # Check if user qualifies for any badge based on points
-        user_profile = Profile.objects.get(user=user)
-        for badge in available_badges:
-            if badge.points_required <= user_profile.points:
-                UserBadge.objects.create(user=user, badge=badge)
+        try:
+            tiles = heatmap(zoom, *bbox)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'zoom': zoom, 'tiles': tiles})
+
+    @action(detail=False, methods=['post'])
+    def lookup(self, request):
+        # "Seen this before?": scans with the same or a near-identical image, nothing is stored
+        image = request.FILES.get('image')
+        if image is None:
+            return Response({"detail": "Upload an image"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(find_seen(image, request.user))
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Offline sync: "scans" and "product_scans" lists, each item with a client_id
+        serializer = ScanBatchSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        created = ingest_scans(
+            request.user,
+            serializer.validated_data.get('scans', []),
+            serializer.validated_data.get('product_scans', [])
+        )
+        return Response(created, status=status.HTTP_201_CREATED)
 
 
-class QuizViewSet(viewsets.ModelViewSet):
+class QuizViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_name = 'quiz'
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -293,6 +621,16 @@ class QuizViewSet(viewsets.ModelViewSet):
             return QuizDetailSerializer
         return QuizSerializer
 
+    def get_compiled_quiz(self, pk):
+        quiz = get_compiled_quiz(pk)
+        if quiz is None:
+            raise Http404
+        return quiz
+
+    def retrieve(self, request, pk=None):
+        # Served from the compiled quiz shared with submit
+        return Response(self.get_compiled_quiz(pk).data)
+
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         quiz = self.get_object()
@@ -312,59 +650,48 @@ class QuizViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def submit(self, request, pk=None):
-        quiz = self.get_object()
+        quiz = self.get_compiled_quiz(pk)
         user = request.user
         answers = request.data.get('answers', [])  # Format: [{"question_id": 1, "option_id": 2}, ...]
-
-        # Find active attempt
-        try:
-            attempt = QuizAttempt.objects.get(user=user, quiz=quiz, completed=False)
-        except QuizAttempt.DoesNotExist:
-            return Response({"detail": "No active quiz attempt found"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Calculate score
-        score = 0
-        for answer in answers:
-            question_id = answer.get('question_id')
-            option_id = answer.get('option_id')
-
-            try:
-                option = QuizOption.objects.get(id=option_id, question_id=question_id)
-                if option.is_correct:
-                    score += 1
-            except QuizOption.DoesNotExist:
-                pass
-
-        # Update attempt
-        attempt.score = score
-        attempt.completed = True
-        attempt.completed_at = timezone.now()
-        attempt.save()
-
-        # Award points to user
-        profile = Profile.objects.get(user=user)
-        points_earned = (score / quiz.questions.count()) * quiz.points
-        profile.points += int(points_earned)
-        profile.save()
+        if not valid_answers(answers):
+            return Response(
+                {"detail": "answers must be a list of objects with integer question_id and option_id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            # Find active attempt, locking it so that concurrent submits are graded once
+            attempt = QuizAttempt.objects.select_for_update().filter(
+                user=user, quiz_id=quiz.quiz_id, completed=False
+            ).first()
+            if attempt is None:
+                return Response({"detail": "No active quiz attempt found"}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Grade all answers in memory against the compiled quiz
+            score = quiz.grade(answers)
+            points_earned = 0
+            if quiz.questions_count:
+                points_earned = (score / quiz.questions_count) * quiz.points
+
+            # Update attempt
+            attempt.score = score
+            attempt.completed = True
+            attempt.completed_at = timezone.now()
+            attempt.save(update_fields=['score', 'completed', 'completed_at'])
+            record_activity(user)
+
+            # Award points to user
+            points = award_points(user, int(points_earned), 'QUIZ')
 
         # Check for badges
-        self.check_for_badges(user)
+        award_badges(user, points)
+        record_events(user, {('QUIZ', ''): 1, ('QUIZ_ANSWER', ''): score})
 
         serializer = QuizAttemptSerializer(attempt)
         return Response(serializer.data)
 
-    def check_for_badges(self, user):
-        # Similar to scan records badge check
-        user_profile = Profile.objects.get(user=user)
-        user_badges = UserBadge.objects.filter(user=user).values_list('badge_id', flat=True)
-        available_badges = Badge.objects.exclude(id__in=user_badges)
 
-        for badge in available_badges:
-            if badge.points_required <= user_profile.points:
-                UserBadge.objects.create(user=user, badge=badge)
-
-
-class ChallengeViewSet(viewsets.ModelViewSet):
+class ChallengeViewSet(PaginatedActionMixin, viewsets.ModelViewSet):
     queryset = Challenge.objects.all()
     serializer_class = ChallengeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -419,55 +746,57 @@ class ChallengeViewSet(viewsets.ModelViewSet):
         participation.completed = True
         participation.completed_at = timezone.now()
         participation.save()
+        record_activity(user)
 
         # Award points
-        profile = Profile.objects.get(user=user)
-        profile.points += challenge.points
-        profile.save()
+        points = award_points(user, challenge.points, 'CHALLENGE')
 
         # Check for badges
-        self.check_for_badges(user)
+        award_badges(user, points)
+        record_events(user, {('CHALLENGE', ''): 1})
 
         serializer = ChallengeParticipationSerializer(participation)
         return Response(serializer.data)
 
-    def check_for_badges(self, user):
-        # Similar to other badge checks
-        user_profile = Profile.objects.get(user=user)
-        user_badges = UserBadge.objects.filter(user=user).values_list('badge_id', flat=True)
-        available_badges = Badge.objects.exclude(id__in=user_badges)
-
-        for badge in available_badges:
-            if badge.points_required <= user_profile.points:
-                UserBadge.objects.create(user=user, badge=badge)
-
     @action(detail=True, methods=['get'])
     def participants(self, request, pk=None):
         challenge = self.get_object()
-        participants = ChallengeParticipation.objects.filter(challenge=challenge)
-        serializer = ChallengeParticipationSerializer(participants, many=True)
-        return Response(serializer.data)
+        participants = ChallengeParticipation.objects.filter(challenge=challenge).select_related(
+            'user', 'challenge'
+        ).order_by('joined_at', 'id')
+        return self.paginated_response(participants, ChallengeParticipationSerializer)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_name = 'product'
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [IndexedSearchFilter]
     search_fields = ['name', 'barcode', 'manufacturer']
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        # Typeahead on names and barcodes, served from the in-memory prefix index: ?q=&limit=
+        return Response(product_suggestions.suggest(request.query_params.get('q', ''), query_limit(request)))
+
     @action(detail=False, methods=['get'])
     def by_barcode(self, request):
         barcode = request.query_params.get('barcode', None)
         if not barcode:
             return Response({"detail": "Barcode parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            product = Product.objects.get(barcode=barcode)
-            serializer = ProductSerializer(product)
-            return Response(serializer.data)
-        except Product.DoesNotExist:
+        # Unknown barcodes are cached too, as None
+        data = catalog_cache.get_or_set('product', f'barcode:{barcode}', lambda: self.load_by_barcode(barcode))
+        if data is None:
             return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+    def load_by_barcode(self, barcode):
+        product = Product.objects.filter(barcode=barcode).first()
+        if product is None:
+            return None
+        return ProductSerializer(product).data
 
     @action(detail=True, methods=['post'])
     def scan(self, request, pk=None):
@@ -476,24 +805,15 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         # Record the scan
         product_scan = ProductScan.objects.create(user=user, product=product)
+        record_scans(user, product_ids=[product.id])
+        record_activity(user)
 
         # Update user points
-        profile = Profile.objects.get(user=user)
-        profile.points += 2  # Award 2 points for scanning products
-        profile.save()
+        points = award_points(user, PRODUCT_SCAN_POINTS, 'PRODUCT_SCAN')
 
         # Check for badges
-        self.check_for_badges(user)
+        award_badges(user, points)
+        record_events(user, {('PRODUCT_SCAN', ''): 1})
 
         serializer = ProductScanSerializer(product_scan)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def check_for_badges(self, user):
-        # Similar to other badge checks
-        user_profile = Profile.objects.get(user=user)
-        user_badges = UserBadge.objects.filter(user=user).values_list('badge_id', flat=True)
-        available_badges = Badge.objects.exclude(id__in=user_badges)
-
-        for badge in available_badges:
-            if badge.points_required <= user_profile.points:
-                UserBadge.objects.create(user=user, badge=badge)
\ No newline at end of file